@@ -0,0 +1,1128 @@
+"""
+API サーバー共通処理
+同期版（server.py / Flask）と非同期版（async_server.py / Quart）で共有する
+設定・認証情報・レート制限の準備と、リクエストの検証・レスポンスの組み立て
+"""
+
+import heapq
+import hmac
+import json
+import logging
+import math
+import os
+import secrets
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import yaml
+from google.oauth2.credentials import Credentials
+
+from app_config import AppConfig
+from calendar_service import CalendarServiceBase
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from occupancy_index import OccupancyIndex
+from slot_engine import to_minute_offset
+from rate_limiter import InMemoryBackend, RateLimitBackend, RateLimiter, RedisBackend
+
+logger = logging.getLogger(__name__)
+
+# (レスポンス本文, ステータスコード)
+ErrorResponse = Tuple[Dict, int]
+
+# 本文なしのレスポンス (本文, ステータスコード, ヘッダー)（304 Not Modified）
+CachedResponse = Tuple[str, int, Dict[str, str]]
+
+# 早い順の空き枠検索で返す件数（既定・上限）
+SEARCH_DEFAULT_LIMIT = 5
+SEARCH_MAX_LIMIT = 50
+
+SLOT_TAKEN_MESSAGE = "この時間枠は既に予約されています。別の時間をお選びください。"
+QUEUE_FULL_MESSAGE = "ただいま予約が混み合っています。しばらくしてから再度お試しください。"
+BOOKING_ERROR_MESSAGE = "予約処理中にエラーが発生しました"
+CALENDAR_ERROR_MESSAGE = "Calendar service error"
+
+# Calendar API 障害中に古いbusy枠で作った空き枠レスポンスは、どこにも保持させない
+STALE_RESPONSE_HEADERS = {"Cache-Control": "no-store"}
+
+
+def load_config() -> Dict:
+    """設定ファイルを読み込み（環境変数 CONFIG_PATH で別ファイルを指定可能）"""
+    with open(os.environ.get("CONFIG_PATH", "config.yaml"), "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def get_credentials(config: Dict) -> Credentials:
+    """
+    Google OAuth 2.0 認証情報を取得
+
+    開発環境: token.json から読み込み
+    本番環境: Secret Manager から refresh_token 取得
+
+    アクセストークンの取得・更新は CredentialManager が行う
+    """
+    is_development = config.get("development", {}).get("use_local_credentials", False)
+
+    if is_development:
+        # ローカル開発環境
+        logger.info("Using local credentials (development mode)")
+        token_file = config["development"]["token_file"]
+
+        if not os.path.exists(token_file):
+            logger.error("Token file not found: %s", token_file)
+            logger.error("Run setup_oauth.py first to generate token.json")
+            raise FileNotFoundError(f"Token file not found: {token_file}")
+
+        creds = Credentials.from_authorized_user_file(
+            token_file,
+            scopes=config["google_calendar"]["scopes"]
+        )
+
+        return creds
+
+    else:
+        # 本番環境（Secret Manager）
+        # deploy.sh の --update-secrets で環境変数に展開済みの場合は API を呼ばない
+        refresh_token = os.environ.get("REFRESH_TOKEN")
+        client_secret_data = os.environ.get("CLIENT_SECRET")
+
+        if refresh_token and client_secret_data:
+            logger.info("Using secrets from environment variables (production mode)")
+        else:
+            logger.info("Using Secret Manager credentials (production mode)")
+            project_id = os.environ.get("GCP_PROJECT_ID")
+
+            if not project_id:
+                raise ValueError("GCP_PROJECT_ID environment variable not set")
+
+            # 読み込みが重いため、使用する場合のみ import する
+            from google.cloud import secretmanager
+
+            client = secretmanager.SecretManagerServiceClient()
+
+            # refresh_token 取得
+            refresh_token_name = config["secrets"]["refresh_token_name"]
+            refresh_token_path = f"projects/{project_id}/secrets/{refresh_token_name}/versions/latest"
+            refresh_token_response = client.access_secret_version(name=refresh_token_path)
+            refresh_token = refresh_token_response.payload.data.decode("UTF-8")
+
+            # client_secret 取得
+            client_secret_name = config["secrets"]["client_secret_name"]
+            client_secret_path = f"projects/{project_id}/secrets/{client_secret_name}/versions/latest"
+            client_secret_response = client.access_secret_version(name=client_secret_path)
+            client_secret_data = client_secret_response.payload.data.decode("UTF-8")
+
+        # client_secret は JSON 形式
+        client_config = json.loads(client_secret_data)
+
+        # Credentials 作成
+        creds = Credentials(
+            token=None,
+            refresh_token=refresh_token,
+            token_uri=client_config["installed"]["token_uri"],
+            client_id=client_config["installed"]["client_id"],
+            client_secret=client_config["installed"]["client_secret"],
+            scopes=config["google_calendar"]["scopes"]
+        )
+
+        return creds
+
+
+def calendar_api_endpoint(config: Dict) -> Optional[str]:
+    """Calendar API のベースURL（環境変数 CALENDAR_API_ENDPOINT を優先、未設定なら既定値）"""
+    return os.environ.get("CALENDAR_API_ENDPOINT", config["google_calendar"].get("api_endpoint"))
+
+
+def calendar_webhook_settings(sync_config: Dict) -> Tuple[Optional[str], str]:
+    """
+    Calendar のプッシュ通知の (通知先URL, トークン)
+
+    環境変数 CALENDAR_WEBHOOK_ADDRESS / CALENDAR_WEBHOOK_TOKEN を優先する。
+    トークンが未設定なら起動ごとに生成する（複数インスタンスで通知を受ける場合は共通の値を設定すること）
+
+    Args:
+        sync_config: calendar_sync 設定
+
+    Returns:
+        (通知先URL（None の場合は通知を使わない）, トークン)
+    """
+    webhook_config = sync_config.get("webhook", {})
+    address = os.environ.get("CALENDAR_WEBHOOK_ADDRESS", webhook_config.get("address"))
+    token = os.environ.get("CALENDAR_WEBHOOK_TOKEN", webhook_config.get("token")) or secrets.token_urlsafe(24)
+    return address or None, token
+
+
+def metrics_token(metrics_config: Dict) -> Optional[str]:
+    """
+    /metrics の Bearer トークン
+
+    環境変数 METRICS_TOKEN を優先する（本番は Secret Manager のシークレットを deploy.sh の
+    --update-secrets で展開する）。未設定の場合 /metrics は公開しない
+
+    Args:
+        metrics_config: metrics 設定
+
+    Returns:
+        トークン（未設定の場合 None）
+    """
+    return os.environ.get("METRICS_TOKEN", metrics_config.get("token")) or None
+
+
+def metrics_authorized(authorization: Optional[str], token: str) -> bool:
+    """
+    Authorization ヘッダーが /metrics の Bearer トークンと一致するか
+
+    Args:
+        authorization: Authorization ヘッダーの値
+        token: metrics_token の値
+
+    Returns:
+        一致する場合 True
+    """
+    scheme, _, credentials = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        credentials.strip().encode("utf-8"), token.encode("utf-8")
+    )
+
+
+def metrics_settings(metrics_config: Dict) -> Tuple[bool, Optional[str]]:
+    """
+    メトリクスの (有効か, Bearer トークン)
+
+    metrics.enabled が true でもトークンが未設定なら無効にする（計測もしない）
+
+    Args:
+        metrics_config: metrics 設定
+
+    Returns:
+        (有効か, トークン)
+    """
+    token = metrics_token(metrics_config)
+    if metrics_config.get("enabled", False) and token is None:
+        logger.warning("Metrics disabled - set METRICS_TOKEN to serve /metrics")
+        return False, None
+    return bool(metrics_config.get("enabled", False)), token
+
+
+def mask_sensitive_data(data: str, mask_type: str) -> str:
+    """個人情報をマスク"""
+    if mask_type == "phone":
+        # 090-1234-5678 → 090-****-5678
+        if len(data) > 4:
+            return data[:3] + "****" + data[-4:]
+        return "****"
+    elif mask_type == "email":
+        # test@example.com → t***@example.com
+        if "@" in data:
+            local, domain = data.split("@", 1)
+            return local[0] + "***@" + domain
+        return "***"
+    return data
+
+
+def create_rate_limit_backend(rate_limit_config: Dict) -> RateLimitBackend:
+    """設定に応じたレート制限バックエンドを作成"""
+    if rate_limit_config.get("backend") == "redis":
+        import redis  # Redis バックエンド使用時のみ必要
+
+        redis_url = os.environ.get("REDIS_URL", rate_limit_config.get("redis_url"))
+        logger.info("Using Redis rate limit backend")
+        return RedisBackend(redis.Redis.from_url(redis_url, socket_timeout=0.5))
+    return InMemoryBackend()
+
+
+def build_rate_limit_routes(
+    rate_limit_config: Dict,
+    backend: RateLimitBackend
+) -> Dict[str, Tuple[RateLimiter, int]]:
+    """
+    エンドポイントごとの (RateLimiter, 消費件数) を作成
+
+    Args:
+        rate_limit_config: rate_limit 設定
+        backend: 全ポリシーで共有するバックエンド
+
+    Returns:
+        {エンドポイント名: (RateLimiter, 消費件数)}
+    """
+    limiters = {
+        name: RateLimiter(
+            max_per_minute=policy["max_requests_per_minute"],
+            max_per_hour=policy["max_requests_per_hour"],
+            backend=backend,
+            name=name
+        )
+        for name, policy in rate_limit_config.get("policies", {}).items()
+    }
+    return {
+        endpoint: (limiters[route["policy"]], route.get("cost", 1))
+        for endpoint, route in rate_limit_config.get("routes", {}).items()
+    }
+
+
+def create_rate_limiters(
+    rate_limit_config: Dict
+) -> Tuple[Optional[RateLimiter], Dict[str, Tuple[RateLimiter, int]]]:
+    """
+    既定の RateLimiter とエンドポイントごとの RateLimiter を作成
+
+    Args:
+        rate_limit_config: rate_limit 設定
+
+    Returns:
+        (routes に定義のないエンドポイント用の RateLimiter, {エンドポイント名: (RateLimiter, 消費件数)})
+        無効の場合は (None, {})
+    """
+    if not rate_limit_config["enabled"]:
+        return None, {}
+
+    backend = create_rate_limit_backend(rate_limit_config)
+    default_limiter = RateLimiter(
+        max_per_minute=rate_limit_config["max_requests_per_minute"],
+        max_per_hour=rate_limit_config["max_requests_per_hour"],
+        backend=backend
+    )
+    return default_limiter, build_rate_limit_routes(rate_limit_config, backend)
+
+
+def create_circuit_breaker(breaker_config: Dict) -> Optional[CircuitBreaker]:
+    """
+    Calendar API 用のサーキットブレーカーを作成
+
+    Args:
+        breaker_config: circuit_breaker 設定
+
+    Returns:
+        CircuitBreaker（無効の場合は None）
+    """
+    if not breaker_config.get("enabled"):
+        return None
+    return CircuitBreaker(
+        failure_threshold=breaker_config.get("failure_threshold", 5),
+        reset_timeout_seconds=breaker_config.get("reset_timeout_seconds", 30)
+    )
+
+
+def calendar_unavailable(error: Exception, message: str) -> Tuple[Dict, int, Dict[str, str]]:
+    """
+    Calendar API が使えない場合の 503（回路が開いている間は再開までの秒数を Retry-After で返す）
+
+    Args:
+        error: 発生した例外
+        message: エラーメッセージ
+
+    Returns:
+        (レスポンス本文, ステータスコード, ヘッダー)
+    """
+    headers = {}
+    if isinstance(error, CircuitOpenError):
+        headers["Retry-After"] = str(max(math.ceil(error.retry_after), 1))
+    return {"error": message}, 503, headers
+
+
+def client_ip(forwarded_for: Optional[str], remote_addr: Optional[str]) -> str:
+    """
+    クライアントIPアドレスを取得
+
+    Args:
+        forwarded_for: X-Forwarded-For ヘッダーの値
+        remote_addr: 接続元アドレス
+
+    Returns:
+        IPアドレス
+    """
+    if forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return remote_addr or "unknown"
+
+
+def parse_availability_query(
+    app_config: AppConfig,
+    args: Mapping[str, str]
+) -> Tuple[Optional[Dict], Optional[ErrorResponse]]:
+    """
+    空き枠取得APIのパラメータを検証
+
+    Args:
+        app_config: 事前計算済みの設定
+        args: クエリパラメータ
+
+    Returns:
+        ({"staff", "date", "date_str", "duration"}, None) または (None, エラーレスポンス)
+    """
+    staff_id = args.get("staff")
+    date_str = args.get("date", app_config.event_date_str)
+
+    if not staff_id:
+        return None, ({"error": "staff parameter is required"}, 400)
+
+    # スタッフ情報取得
+    staff = app_config.get_staff(staff_id)
+    if not staff:
+        return None, ({"error": f"Staff not found: {staff_id}"}, 404)
+
+    # メニュー情報取得（施術時間）
+    menu_name = args.get("menu")
+    duration = app_config.slot_duration
+    if menu_name:
+        menu = app_config.find_menu(staff, menu_name)
+        if not menu:
+            return None, ({"error": f"Menu not found: {menu_name}"}, 404)
+        duration = menu["duration"]
+
+    date, error = _parse_event_date(app_config, date_str)
+    if error:
+        return None, error
+
+    return {"staff": staff, "date": date, "date_str": date_str, "duration": duration}, None
+
+
+def parse_batch_query(
+    app_config: AppConfig,
+    args: Mapping[str, str]
+) -> Tuple[Optional[Dict], Optional[ErrorResponse]]:
+    """
+    空き枠一括取得APIのパラメータを検証
+
+    Args:
+        app_config: 事前計算済みの設定
+        args: クエリパラメータ
+
+    Returns:
+        ({"staff_list", "date", "date_str"}, None) または (None, エラーレスポンス)
+    """
+    staff_param = args.get("staff", "")
+    date_str = args.get("date", app_config.event_date_str)
+
+    # スタッフ情報取得
+    staff_ids = [s.strip() for s in staff_param.split(",") if s.strip()]
+    if staff_ids:
+        staff_list = []
+        for staff_id in staff_ids:
+            staff = app_config.get_staff(staff_id)
+            if not staff:
+                return None, ({"error": f"Staff not found: {staff_id}"}, 404)
+            staff_list.append(staff)
+    else:
+        staff_list = app_config.staff_list
+
+    date, error = _parse_event_date(app_config, date_str)
+    if error:
+        return None, error
+
+    return {"staff_list": staff_list, "date": date, "date_str": date_str}, None
+
+
+def parse_staff_at_query(
+    app_config: AppConfig,
+    args: Mapping[str, str]
+) -> Tuple[Optional[Dict], Optional[ErrorResponse]]:
+    """
+    指定時刻に施術できるスタッフの検索APIのパラメータを検証
+
+    Args:
+        app_config: 事前計算済みの設定
+        args: クエリパラメータ
+
+    Returns:
+        ({"start", "time_str", "duration", "date", "date_str"}, None) または (None, エラーレスポンス)
+    """
+    time_str = args.get("time")
+    date_str = args.get("date", app_config.event_date_str)
+
+    if not time_str:
+        return None, ({"error": "time parameter is required"}, 400)
+    try:
+        start = datetime.strptime(time_str, "%H:%M").time()
+    except ValueError:
+        return None, ({"error": "Invalid time format. Use HH:MM"}, 400)
+    if not app_config.start_time <= start < app_config.end_time:
+        return None, ({"error": f"Time must be between {app_config.start_time_str} and {app_config.end_time_str}"}, 400)
+
+    # 施術時間（省略時は1枠の長さ）
+    duration_str = args.get("duration")
+    duration = app_config.slot_duration
+    if duration_str:
+        try:
+            duration = int(duration_str)
+        except ValueError:
+            duration = 0
+        if duration <= 0:
+            return None, ({"error": "duration must be a positive integer (minutes)"}, 400)
+
+    date, error = _parse_event_date(app_config, date_str)
+    if error:
+        return None, error
+
+    return {
+        "start": app_config.timezone.localize(datetime.combine(date.date(), start)),
+        "time_str": start.strftime("%H:%M"),
+        "duration": duration,
+        "date": date,
+        "date_str": date_str
+    }, None
+
+
+def parse_search_query(
+    app_config: AppConfig,
+    args: Mapping[str, str]
+) -> Tuple[Optional[Dict], Optional[ErrorResponse]]:
+    """
+    早い順の空き枠検索APIのパラメータを検証
+
+    Args:
+        app_config: 事前計算済みの設定
+        args: クエリパラメータ
+
+    Returns:
+        ({"candidates", "time_from", "time_to", "from_str", "to_str", "limit", "date", "date_str"}, None)
+        または (None, エラーレスポンス)。candidates は [(スタッフ, 対象メニューのリスト), ...]
+    """
+    services = {s.strip() for s in args.get("service", "").split(",") if s.strip()}
+    menu_names = {s.strip() for s in args.get("menu", "").split(",") if s.strip()}
+    date_str = args.get("date", app_config.event_date_str)
+
+    if not services and not menu_names:
+        return None, ({"error": "service or menu parameter is required"}, 400)
+
+    # 対象スタッフとメニュー（サービスが一致すれば全メニュー、メニュー名が一致すればそのメニュー）
+    candidates = []
+    for staff in app_config.staff_list:
+        if staff["service"] in services:
+            menus = staff["menus"]
+        else:
+            menus = [menu for menu in staff["menus"] if menu["name"] in menu_names]
+        if menus:
+            candidates.append((staff, menus))
+    if not candidates:
+        return None, ({"error": "No staff offers the requested service or menu"}, 404)
+
+    # 時間帯（省略時は営業時間全体）
+    try:
+        time_from = datetime.strptime(args.get("from", app_config.start_time_str), "%H:%M").time()
+        time_to = datetime.strptime(args.get("to", app_config.end_time_str), "%H:%M").time()
+    except ValueError:
+        return None, ({"error": "Invalid time format. Use HH:MM"}, 400)
+    time_from = max(time_from, app_config.start_time)
+    time_to = min(time_to, app_config.end_time)
+    if time_from >= time_to:
+        return None, ({"error": f"Time window must overlap {app_config.start_time_str}-{app_config.end_time_str}"}, 400)
+
+    try:
+        limit = int(args.get("limit", SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        return None, ({"error": f"limit must be between 1 and {SEARCH_MAX_LIMIT}"}, 400)
+
+    date, error = _parse_event_date(app_config, date_str)
+    if error:
+        return None, error
+
+    return {
+        "candidates": candidates,
+        "time_from": app_config.timezone.localize(datetime.combine(date.date(), time_from)),
+        "time_to": app_config.timezone.localize(datetime.combine(date.date(), time_to)),
+        "from_str": time_from.strftime("%H:%M"),
+        "to_str": time_to.strftime("%H:%M"),
+        "limit": limit,
+        "date": date,
+        "date_str": date_str
+    }, None
+
+
+def _parse_event_date(
+    app_config: AppConfig,
+    date_str: str
+) -> Tuple[Optional[datetime], Optional[ErrorResponse]]:
+    """日付をパースし、イベント日か確認"""
+    try:
+        date = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return None, ({"error": "Invalid date format. Use YYYY-MM-DD"}, 400)
+
+    if date_str != app_config.event_date_str:
+        return None, ({"error": f"Bookings only available for {app_config.event_date_str}"}, 400)
+
+    return date, None
+
+
+def parse_booking_request(
+    app_config: AppConfig,
+    data: Optional[Dict[str, Any]]
+) -> Tuple[Optional[Dict], Optional[ErrorResponse]]:
+    """
+    予約確定APIのリクエスト本文を検証
+
+    Args:
+        app_config: 事前計算済みの設定
+        data: リクエスト本文（JSON）
+
+    Returns:
+        (予約内容, None) または (None, エラーレスポンス)
+    """
+    data = data or {}
+
+    # バリデーション
+    required_fields = ["staff", "start", "menu", "name", "phone"]
+    for field in required_fields:
+        if field not in data:
+            return None, ({"error": f"Missing required field: {field}"}, 400)
+
+    staff_id = data["staff"]
+    start_str = data["start"]
+    menu_name = data["menu"]
+
+    # スタッフ情報取得
+    staff = app_config.get_staff(staff_id)
+    if not staff:
+        return None, ({"error": f"Staff not found: {staff_id}"}, 404)
+
+    # メニュー情報取得
+    menu = app_config.find_menu(staff, menu_name)
+    if not menu:
+        return None, ({"error": f"Menu not found: {menu_name}"}, 404)
+
+    # 開始時刻パース（タイムゾーン付き）
+    try:
+        # naive datetime をパース
+        start_time_naive = datetime.fromisoformat(start_str)
+        # タイムゾーンを付与
+        start_time = app_config.timezone.localize(start_time_naive)
+    except ValueError:
+        return None, ({"error": "Invalid start time format"}, 400)
+
+    # イベント日チェック
+    if start_time.date() != app_config.event_date:
+        return None, ({"error": f"Bookings only available for {app_config.event_date_str}"}, 400)
+
+    # 営業時間・枠の区切りチェック（空き枠として返す開始時刻のみ受け付ける）
+    duration = menu["duration"]
+    opening = datetime.combine(app_config.event_date, app_config.start_time)
+    closing = datetime.combine(app_config.event_date, app_config.end_time)
+    offset = start_time_naive - opening
+    if offset < timedelta(0) or offset % timedelta(minutes=app_config.slot_duration):
+        return None, ({
+            "error": f"Start time must be on the {app_config.slot_duration}-minute grid "
+                     f"from {app_config.start_time_str}"
+        }, 400)
+    if start_time_naive + timedelta(minutes=duration) > closing:
+        return None, ({"error": f"Booking must end by {app_config.end_time_str}"}, 400)
+
+    return {
+        "staff": staff,
+        "calendar_id": staff["calendar_id"],
+        "menu_name": menu_name,
+        "start_str": start_str,
+        "start_time": start_time,
+        "end_time": start_time + timedelta(minutes=duration),
+        "duration": duration,
+        "customer_name": data["name"],
+        "customer_phone": data["phone"],
+        "customer_email": data.get("email"),
+        "note": data.get("note"),
+    }, None
+
+
+def booking_details(app_config: AppConfig, booking: Dict) -> Dict:
+    """CalendarService.build_event / create_booking に渡す予約内容"""
+    return dict(
+        start_time=booking["start_time"],
+        duration=booking["duration"],
+        customer_name=booking["customer_name"],
+        customer_phone=booking["customer_phone"],
+        staff_name=booking["staff"]["name"],
+        service_name=booking["menu_name"],
+        location=app_config.location,
+        customer_email=booking["customer_email"],
+        note=booking["note"],
+        timezone=app_config.timezone_name
+    )
+
+
+def log_booking_confirmed(booking: Dict):
+    """
+    予約確定のログ（個人情報はマスクしてからログレコードに渡す）
+
+    ログはキュー経由で別スレッドから出力されるため、マスク前の値をレコードに含めない
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info(
+        "Booking confirmed - Staff: %s, Time: %s, Menu: %s, Customer: %s**, Phone: %s",
+        booking["staff"]["name"],
+        booking["start_str"],
+        booking["menu_name"],
+        booking["customer_name"][:2],
+        mask_sensitive_data(booking["customer_phone"], "phone")
+    )
+
+
+def booking_response(
+    app_config: AppConfig,
+    booking: Dict,
+    booking_id: str,
+    event_id: Optional[str],
+    status: str
+) -> Dict:
+    """予約確定APIのレスポンス本文"""
+    start_time = booking["start_time"]
+    return {
+        "success": True,
+        "booking_id": booking_id,
+        "event_id": event_id,
+        "status": status,
+        "message": "予約が完了しました",
+        "booking": {
+            "staff": booking["staff"]["name"],
+            "service": booking["staff"]["service"],
+            "menu": booking["menu_name"],
+            "date": start_time.strftime("%Y年%m月%d日"),
+            "time": start_time.strftime("%H:%M"),
+            "duration": booking["duration"],
+            "location": app_config.location,
+            "customer_name": booking["customer_name"]
+        }
+    }
+
+
+def staff_available_at(
+    app_config: AppConfig,
+    index: OccupancyIndex,
+    start: datetime,
+    duration: int
+) -> List[Dict]:
+    """
+    指定時刻から duration 分続けて空いているスタッフ
+
+    Args:
+        app_config: 事前計算済みの設定
+        index: カレンダーIDごとの占有ビットマスク索引
+        start: 開始時刻（タイムゾーン付き）
+        duration: 施術時間（分）
+
+    Returns:
+        [{"staff", "free_minutes", "menus"}, ...]（menus は空き時間に収まるメニュー名）
+    """
+    offset = index.offset(start)
+    if offset is None:
+        return []
+
+    # 全スタッフの行を同じ開始位置で判定（回復枠は全員 0 分）
+    free_by_calendar = index.free_minutes_at(offset)
+    results = []
+    for staff in app_config.staff_list:
+        free_minutes = free_by_calendar.get(staff["calendar_id"], 0)
+        if free_minutes < duration:
+            continue
+        results.append({
+            "staff": app_config.staff_summaries[staff["id"]],
+            "free_minutes": free_minutes,
+            "menus": [menu["name"] for menu in staff["menus"] if menu["duration"] <= free_minutes]
+        })
+    return results
+
+
+def _tag_starts(order: int, starts: Iterator[Tuple[int, int]]) -> Iterator[Tuple[int, int, int]]:
+    """(開始位置, 空いている分数) に候補の順番を加える（同時刻の並びを設定のスタッフ順にする）"""
+    for offset, free_minutes in starts:
+        yield offset, order, free_minutes
+
+
+def search_earliest(
+    app_config: AppConfig,
+    index: OccupancyIndex,
+    free_by_staff: Dict[str, List[Tuple[int, int]]],
+    params: Dict
+) -> List[Dict]:
+    """
+    対象スタッフの空き区間から、開始の早い (スタッフ, 開始時刻) を limit 件求める
+
+    スタッフごとに開始位置を早い順に返すイテレーターを作り、heapq.merge で合流させて
+    limit 件に達した時点で打ち切る（残りの空き枠は計算しない）
+
+    Args:
+        app_config: 事前計算済みの設定
+        index: 分オフセットの基準になる占有ビットマスク索引
+        free_by_staff: スタッフIDごとの空き区間（OccupancyIndex.free_intervals の結果）
+        params: parse_search_query の結果
+
+    Returns:
+        [{"staff", "start", "free_minutes", "menus"}, ...]（開始時刻順、同時刻は設定のスタッフ順）
+    """
+    first = to_minute_offset(params["time_from"], index.time_min)
+    last = to_minute_offset(params["time_to"], index.time_min)
+
+    streams = []
+    for order, (staff, menus) in enumerate(params["candidates"]):
+        intervals = free_by_staff.get(staff["id"])
+        if intervals is None:
+            continue
+        # 対象メニューのうち最も短いものが収まれば候補
+        duration = min(menu["duration"] for menu in menus)
+        streams.append(_tag_starts(order, index.iter_starts(intervals, duration, first, last)))
+
+    results = []
+    for offset, order, free_minutes in islice(heapq.merge(*streams), params["limit"]):
+        staff, menus = params["candidates"][order]
+        results.append({
+            "staff": app_config.staff_summaries[staff["id"]],
+            "start": (index.time_min + timedelta(minutes=offset)).strftime("%H:%M"),
+            "free_minutes": free_minutes,
+            "menus": [menu["name"] for menu in menus if menu["duration"] <= free_minutes]
+        })
+    return results
+
+
+def format_slots(slots: List[datetime]) -> List[str]:
+    """空き枠を時刻文字列（HH:MM）に変換"""
+    return [dt.strftime("%H:%M") for dt in slots]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match ヘッダーが ETag に一致するか（弱い比較）
+
+    Args:
+        if_none_match: If-None-Match ヘッダーの値（カンマ区切りで複数可）
+        etag: 現在の ETag（引用符付き）
+
+    Returns:
+        一致する場合 True（304 を返してよい）
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag.removeprefix("W/"):
+            return True
+    return False
+
+
+def cache_headers(app_config: AppConfig, etag: str) -> Dict[str, str]:
+    """空き枠レスポンス（200 / 304）に付けるヘッダー"""
+    return {"ETag": etag, "Cache-Control": app_config.availability_cache_control}
+
+
+def availability_calendar_ids(staff_list: List[Dict]) -> List[str]:
+    """スタッフのカレンダーID（重複を除いて設定順）"""
+    return list(dict.fromkeys(staff["calendar_id"] for staff in staff_list))
+
+
+def check_not_modified(
+    calendar_service: CalendarServiceBase,
+    app_config: AppConfig,
+    calendar_ids: List[str],
+    date: datetime,
+    variant: str,
+    if_none_match: Optional[str]
+) -> Tuple[str, Optional[CachedResponse]]:
+    """
+    busy枠の取得前に ETag を作り、If-None-Match が一致すれば 304 を返す
+
+    取得前のカウンターで作るため、取得中に変わっても次回は 200 になる側に倒れる
+
+    Args:
+        calendar_service: CalendarService / AsyncCalendarService
+        app_config: 事前計算済みの設定
+        calendar_ids: 対象のカレンダーID
+        date: 対象日
+        variant: 同じカレンダーでもレスポンスが変わる条件（施術時間など）
+        if_none_match: If-None-Match ヘッダーの値
+
+    Returns:
+        (ETag, 304 レスポンス)（busy枠がキャッシュにない・一致しない場合 304 は None）
+    """
+    etag = calendar_service.versions.etag(calendar_ids, variant)
+    if etag_matches(if_none_match, etag) and calendar_service.is_busy_cached(
+        calendar_ids, date, app_config.start_time_str,
+        app_config.end_time_str, app_config.timezone_name
+    ):
+        return etag, ("", 304, cache_headers(app_config, etag))
+    return etag, None
+
+
+def revalidate_after_fetch(
+    calendar_service: CalendarServiceBase,
+    app_config: AppConfig,
+    calendar_ids: List[str],
+    variant: str,
+    if_none_match: Optional[str],
+    stale: bool
+) -> Optional[CachedResponse]:
+    """
+    Google から取得した結果が前回と同じなら 304（空き枠の計算・JSON 化を省略）
+
+    Returns:
+        304 レスポンス（古いbusy枠で代替した・一致しない場合 None）
+    """
+    if stale:
+        return None
+    current_etag = calendar_service.versions.etag(calendar_ids, variant)
+    if etag_matches(if_none_match, current_etag):
+        return "", 304, cache_headers(app_config, current_etag)
+    return None
+
+
+def availability_headers(app_config: AppConfig, etag: Optional[str], stale: bool) -> Dict[str, str]:
+    """空き枠レスポンス（200）のヘッダー（古いbusy枠から作った場合はキャッシュ不可）"""
+    if stale:
+        return STALE_RESPONSE_HEADERS
+    if etag is None:
+        return {"Cache-Control": app_config.availability_cache_control}
+    return cache_headers(app_config, etag)
+
+
+def stale_busy_fallback(
+    calendar_service: CalendarServiceBase,
+    app_config: AppConfig,
+    calendar_ids: List[str],
+    date: datetime,
+    error: Exception
+) -> Dict[str, List]:
+    """
+    Calendar API が使えない間、最後に取得したbusy枠で代替する
+
+    Args:
+        calendar_service: CalendarService / AsyncCalendarService
+        app_config: 事前計算済みの設定
+        calendar_ids: 対象のカレンダーID
+        date: 対象日
+        error: busy枠の取得で発生した例外
+
+    Returns:
+        カレンダーIDごとの古いbusy枠
+
+    Raises:
+        error: 代替できるbusy枠がない
+    """
+    stale_busy = calendar_service.get_stale_busy_slots(
+        calendar_ids,
+        date,
+        app_config.start_time_str,
+        app_config.end_time_str,
+        app_config.timezone_name
+    )
+    if stale_busy is None:
+        raise error
+    logger.warning("Serving stale busy slots for %s calendar(s): %s", len(calendar_ids), error)
+    return stale_busy
+
+
+def build_available_slots(
+    calendar_service: CalendarServiceBase,
+    app_config: AppConfig,
+    busy_slots: List,
+    date: datetime,
+    duration: Optional[int] = None
+) -> List[str]:
+    """busy枠からイベント当日の空き枠（HH:MM のリスト）を生成"""
+    return format_slots(calendar_service.generate_available_slots(
+        busy_slots=busy_slots,
+        date=date,
+        start_time=app_config.start_time_str,
+        end_time=app_config.end_time_str,
+        slot_duration=app_config.slot_duration,
+        recovery_times=app_config.recovery_times,
+        timezone=app_config.timezone_name,
+        duration=duration
+    ))
+
+
+def availability_body(
+    calendar_service: CalendarServiceBase,
+    app_config: AppConfig,
+    params: Dict,
+    busy_by_calendar: Dict[str, List],
+    stale: bool
+) -> Dict:
+    """
+    空き枠取得API（/api/availability）のレスポンス本文
+
+    Args:
+        calendar_service: CalendarService / AsyncCalendarService
+        app_config: 事前計算済みの設定
+        params: parse_availability_query の結果
+        busy_by_calendar: カレンダーIDごとのbusy枠
+        stale: 古いbusy枠で代替したか
+
+    Returns:
+        {"staff", "date", "available_slots", "duration", "timezone", "stale"}
+    """
+    staff = params["staff"]
+    duration = params["duration"]
+    # 施術時間が収まる枠のみ
+    available_slots = build_available_slots(
+        calendar_service, app_config, busy_by_calendar[staff["calendar_id"]], params["date"], duration
+    )
+
+    logger.info(
+        "Availability requested - Staff: %s, Date: %s, Duration: %smin, Available: %s slots",
+        staff["name"], params["date_str"], duration, len(available_slots)
+    )
+
+    return {
+        "staff": app_config.staff_summaries[staff["id"]],
+        "date": params["date_str"],
+        "available_slots": available_slots,
+        "duration": duration,
+        "timezone": app_config.timezone_name,
+        "stale": stale
+    }
+
+
+def batch_body(
+    calendar_service: CalendarServiceBase,
+    app_config: AppConfig,
+    params: Dict,
+    busy_by_calendar: Dict[str, List],
+    stale: bool
+) -> Dict:
+    """
+    複数スタッフの空き枠一括取得API（/api/availability/batch）のレスポンス本文
+
+    Args:
+        calendar_service: CalendarService / AsyncCalendarService
+        app_config: 事前計算済みの設定
+        params: parse_batch_query の結果
+        busy_by_calendar: カレンダーIDごとのbusy枠
+        stale: 古いbusy枠で代替したか
+
+    Returns:
+        {"date", "timezone", "results", "stale"}
+    """
+    staff_list = params["staff_list"]
+    results = [
+        {
+            "staff": app_config.staff_summaries[staff["id"]],
+            "available_slots": build_available_slots(
+                calendar_service, app_config, busy_by_calendar[staff["calendar_id"]], params["date"]
+            )
+        }
+        for staff in staff_list
+    ]
+
+    logger.info(
+        "Batch availability requested - Staff: %s, Date: %s", len(staff_list), params["date_str"]
+    )
+
+    return {
+        "date": params["date_str"],
+        "timezone": app_config.timezone_name,
+        "results": results,
+        "stale": stale
+    }
+
+
+def staff_at_body(
+    calendar_service: CalendarServiceBase,
+    app_config: AppConfig,
+    params: Dict,
+    busy_by_calendar: Dict[str, List],
+    stale: bool
+) -> Dict:
+    """
+    指定時刻に施術できるスタッフの検索API（/api/availability/at）のレスポンス本文
+
+    Args:
+        calendar_service: CalendarService / AsyncCalendarService
+        app_config: 事前計算済みの設定
+        params: parse_staff_at_query の結果
+        busy_by_calendar: 全スタッフのカレンダーIDごとのbusy枠
+        stale: 古いbusy枠で代替したか
+
+    Returns:
+        {"date", "time", "duration", "timezone", "results", "stale"}
+    """
+    duration = params["duration"]
+    # 全スタッフの占有ビットマスクを同じ開始位置で判定
+    index = calendar_service.build_occupancy_index(
+        busy_by_calendar,
+        params["date"],
+        app_config.start_time_str,
+        app_config.end_time_str,
+        app_config.slot_duration,
+        app_config.recovery_times,
+        app_config.timezone_name
+    )
+    results = staff_available_at(app_config, index, params["start"], duration)
+
+    logger.info(
+        "Staff availability requested - Time: %s, Duration: %smin, Available: %s staff",
+        params["time_str"], duration, len(results)
+    )
+
+    return {
+        "date": params["date_str"],
+        "time": params["time_str"],
+        "duration": duration,
+        "timezone": app_config.timezone_name,
+        "results": results,
+        "stale": stale
+    }
+
+
+def search_free_intervals(
+    calendar_service: CalendarServiceBase,
+    app_config: AppConfig,
+    staff_list: List[Dict],
+    date: datetime,
+    busy_by_calendar: Dict[str, List]
+) -> Tuple[OccupancyIndex, Dict[str, List[Tuple[int, int]]]]:
+    """
+    スナップショットが無効・未生成の間の検索用に、busy枠からスタッフごとの空き区間を作る
+
+    Returns:
+        (占有ビットマスク索引, スタッフIDごとの空き区間)
+    """
+    index = calendar_service.build_occupancy_index(
+        busy_by_calendar,
+        date,
+        app_config.start_time_str,
+        app_config.end_time_str,
+        app_config.slot_duration,
+        app_config.recovery_times,
+        app_config.timezone_name
+    )
+    free_by_staff = {
+        staff["id"]: index.free_intervals(index.rows[staff["calendar_id"]])
+        for staff in staff_list
+    }
+    return index, free_by_staff
+
+
+def search_body(
+    app_config: AppConfig,
+    params: Dict,
+    index: OccupancyIndex,
+    free_by_staff: Dict[str, List[Tuple[int, int]]],
+    stale: bool
+) -> Dict:
+    """
+    早い順の空き枠検索API（/api/availability/search）のレスポンス本文
+
+    Args:
+        app_config: 事前計算済みの設定
+        params: parse_search_query の結果
+        index: 分オフセットの基準になる占有ビットマスク索引
+        free_by_staff: スタッフIDごとの空き区間
+        stale: 古い空き区間から作ったか
+
+    Returns:
+        {"date", "timezone", "from", "to", "results", "stale"}
+    """
+    results = search_earliest(app_config, index, free_by_staff, params)
+
+    logger.info(
+        "Availability search requested - Staff: %s, Window: %s-%s, Results: %s",
+        len(params["candidates"]), params["from_str"], params["to_str"], len(results)
+    )
+
+    return {
+        "date": params["date_str"],
+        "timezone": app_config.timezone_name,
+        "from": params["from_str"],
+        "to": params["to_str"],
+        "results": results,
+        "stale": stale
+    }
@@ -0,0 +1,123 @@
+"""
+設定の事前計算
+config.yaml から、リクエストごとに変わらない値（オリジン判定の正規表現、
+スタッフ・メニューの索引、回復枠、時刻）を起動時に1回だけ作成する
+"""
+
+import re
+from datetime import date, datetime, time
+from typing import Dict, FrozenSet, List, Optional, Pattern
+
+import pytz
+
+from slot_engine import parse_clock
+
+
+def compile_origin_patterns(patterns: List[str]) -> Optional[Pattern]:
+    """
+    ワイルドカード付きのオリジンパターンを1つの正規表現にまとめる
+
+    Args:
+        patterns: "https://*.vercel.app" 形式のパターン
+
+    Returns:
+        コンパイル済みの正規表現（パターンがない場合 None）
+    """
+    if not patterns:
+        return None
+    alternatives = [
+        re.escape(pattern).replace(r"\*", r"[^/]+")
+        for pattern in patterns
+    ]
+    return re.compile(f"^(?:{'|'.join(alternatives)})$")
+
+
+class AppConfig:
+    """config.yaml から作成した読み取り専用の索引"""
+
+    def __init__(self, config: Dict):
+        """
+        初期化
+
+        Args:
+            config: config.yaml の内容
+        """
+        self.raw = config
+
+        # イベント情報
+        event = config["event"]
+        self.event_date_str: str = event["date"]
+        self.event_date: date = datetime.strptime(event["date"], "%Y-%m-%d").date()
+        self.start_time_str: str = event["start_time"]
+        self.end_time_str: str = event["end_time"]
+        self.start_time: time = parse_clock(event["start_time"])
+        self.end_time: time = parse_clock(event["end_time"])
+        self.timezone_name: str = event["timezone"]
+        self.timezone = pytz.timezone(event["timezone"])
+        self.location: str = event["location"]
+
+        self.slot_duration: int = config["booking"]["slot_duration"]
+
+        # 回復枠 {HH:MM: 長さ（分）}（長さの省略時は1枠分）
+        self.recovery_times: Dict[str, int] = {
+            slot["time"]: slot.get("duration", self.slot_duration)
+            for slot in config["recovery_slots"]
+        }
+
+        # スタッフ・メニューの索引
+        self.staff_list: List[Dict] = config["staff"]
+        self.staff_by_id: Dict[str, Dict] = {staff["id"]: staff for staff in self.staff_list}
+        self.menus_by_staff: Dict[str, Dict[str, Dict]] = {
+            staff["id"]: {menu["name"]: menu for menu in staff["menus"]}
+            for staff in self.staff_list
+        }
+        # レスポンス用のスタッフ情報
+        self.staff_summaries: Dict[str, Dict] = {
+            staff["id"]: {
+                "id": staff["id"],
+                "name": staff["name"],
+                "service": staff["service"],
+                "menus": staff["menus"]
+            }
+            for staff in self.staff_list
+        }
+
+        # 空き枠レスポンスの Cache-Control（ブラウザは ETag で再検証、共有キャッシュは短時間保持）
+        http_cache = config.get("http_cache", {})
+        self.availability_cache_control: str = (
+            f"public, max-age={http_cache.get('max_age_seconds', 0)}, "
+            f"s-maxage={http_cache.get('shared_max_age_seconds', 5)}"
+        )
+
+        # CORS 許可オリジン（完全一致は集合、ワイルドカードは1つの正規表現）
+        allowed_origins = config["cors"]["allowed_origins"]
+        self.exact_origins: FrozenSet[str] = frozenset(
+            origin for origin in allowed_origins if "*" not in origin
+        )
+        self.origin_pattern = compile_origin_patterns(
+            [origin for origin in allowed_origins if "*" in origin]
+        )
+
+    def is_origin_allowed(self, origin: Optional[str]) -> bool:
+        """
+        リクエストオリジンがCORS許可リストに含まれるかチェック
+
+        Args:
+            origin: Origin ヘッダーの値
+
+        Returns:
+            許可されている場合 True
+        """
+        if not origin:
+            return False
+        if origin in self.exact_origins:
+            return True
+        return bool(self.origin_pattern and self.origin_pattern.match(origin))
+
+    def get_staff(self, staff_id: str) -> Optional[Dict]:
+        """スタッフIDから施術者情報を取得"""
+        return self.staff_by_id.get(staff_id)
+
+    def find_menu(self, staff: Dict, menu_name: str) -> Optional[Dict]:
+        """スタッフのメニューを名前で取得"""
+        return self.menus_by_staff.get(staff["id"], {}).get(menu_name)
@@ -0,0 +1,481 @@
+"""
+Google Calendar API サービスクラス（非同期版）
+httpx.AsyncClient で REST API を直接呼び出し、応答待ちの間も他のリクエストを処理する
+（async_server.py から使用。空き枠計算・台帳・キャッシュは同期版と共通）
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Mapping, Optional, Tuple
+from urllib.parse import quote
+
+import httplib2
+import httpx
+from googleapiclient.errors import HttpError
+
+from booking_store import BookingStore
+from calendar_service import BusySlotCache, CalendarServiceBase
+from calendar_sync import CalendarMirror, MirrorUpdate, watch_request
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from credential_manager import CredentialManager
+from metrics import CALENDAR_API_DURATION, CALENDAR_SERVICE_DURATION, timed
+from singleflight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Calendar API が使えないことを示す例外（API エラー・回路遮断中・タイムアウト・通信エラー）
+CALENDAR_UNAVAILABLE_ERRORS = (HttpError, CircuitOpenError, OSError, httpx.TransportError)
+
+# Calendar API のベースURL
+DEFAULT_API_ENDPOINT = "https://www.googleapis.com/calendar/v3/"
+
+
+class AsyncCalendarService(CalendarServiceBase):
+    """Google Calendar API操作クラス（asyncio）"""
+
+    def __init__(
+        self,
+        credential_manager: CredentialManager,
+        cache_ttl_seconds: float = 0,
+        cache_max_entries: int = 256,
+        booking_store: Optional[BookingStore] = None,
+        http_timeout_seconds: Optional[float] = None,
+        api_endpoint: Optional[str] = None,
+        max_connections: int = 100,
+        freebusy_group_size: int = 50,
+        client: Optional[httpx.AsyncClient] = None,
+        coalesce_freebusy: bool = True,
+        read_timeout_seconds: Optional[float] = None,
+        stale_max_age_seconds: float = 0,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        calendar_mirror: Optional[CalendarMirror] = None
+    ):
+        """
+        初期化
+
+        Args:
+            credential_manager: 共有の認証情報（期限前の更新はバックグラウンドで行われる）
+            cache_ttl_seconds: busy枠キャッシュの有効期間（秒）、0 以下で無効
+            cache_max_entries: busy枠キャッシュの最大エントリ数
+            booking_store: 予約台帳（指定時は予約確認・空き枠計算で台帳を優先）
+            http_timeout_seconds: HTTP 通信のタイムアウト（秒）
+            api_endpoint: Calendar API のベースURL（省略時は Google の既定値）
+            max_connections: 同時接続数の上限（接続はリクエスト間で再利用される）
+            freebusy_group_size: freebusy.query 1回にまとめるカレンダー数
+                                 （超える分は別リクエストにして並行実行）
+            client: 使用する httpx.AsyncClient（省略時は作成）
+            coalesce_freebusy: 同じ範囲への同時の freebusy.query を1回にまとめるか
+            read_timeout_seconds: freebusy.query の期限（秒、認証情報の更新待ちを含む）、省略時は無制限
+            stale_max_age_seconds: Calendar API 障害時に代わりに返すbusy枠の、取得からの最大経過秒数
+            circuit_breaker: Calendar API 呼び出しに使うサーキットブレーカー（None で使わない）
+            calendar_mirror: 差分同期するカレンダーのミラー（同期済みのカレンダーは freebusy.query を呼ばない）
+        """
+        super().__init__(
+            cache_ttl_seconds, cache_max_entries, booking_store, stale_max_age_seconds, circuit_breaker,
+            calendar_mirror
+        )
+        self.credential_manager = credential_manager
+        self.read_timeout_seconds = read_timeout_seconds
+        self.freebusy_group_size = max(freebusy_group_size, 1)
+        self.freebusy_flight = AsyncSingleFlight() if coalesce_freebusy else None
+        self.client = client or httpx.AsyncClient(
+            base_url=api_endpoint or DEFAULT_API_ENDPOINT,
+            timeout=http_timeout_seconds,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    # 通信エラー・asyncio.wait_for の期限切れ（TimeoutError）を回路の失敗に数える
+    upstream_errors = (OSError, httpx.TransportError)
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Dict] = None,
+        timeout_seconds: Optional[float] = None,
+        params: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Calendar API を呼び出す（サーキットブレーカーがあれば経由する）
+
+        Args:
+            method: HTTP メソッド
+            path: ベースURLからの相対パス
+            body: リクエスト本文（JSON）
+            timeout_seconds: 呼び出し全体の期限（秒）
+            params: クエリパラメータ
+
+        Returns:
+            レスポンス本文
+
+        Raises:
+            HttpError: Calendar API エラー（同期版と同じ例外型）
+            CircuitOpenError: 回路が開いている
+            TimeoutError: 期限切れ
+        """
+        with self._upstream_guard():
+            return await asyncio.wait_for(self._send(method, path, body, params), timeout_seconds)
+
+    async def _send(self, method: str, path: str, body: Optional[Dict], params: Optional[Dict] = None) -> Dict:
+        """Calendar API へのリクエスト送信（エラー応答は HttpError に変換）"""
+        # 通常はバックグラウンドで更新済み。期限切れの場合のみ更新を待つ（イベントループは止めない）
+        if self.credential_manager.needs_refresh():
+            await asyncio.to_thread(self.credential_manager.ensure_valid)
+
+        response = await self.client.request(
+            method,
+            path,
+            json=body,
+            params=params,
+            headers={"Authorization": f"Bearer {self.credential_manager.credentials.token}"}
+        )
+        if response.status_code >= 400:
+            raise HttpError(
+                httplib2.Response({"status": response.status_code}),
+                response.content,
+                uri=str(response.url)
+            )
+        return response.json()
+
+    @timed(CALENDAR_SERVICE_DURATION, "get_busy_slots")
+    async def get_busy_slots(
+        self,
+        calendar_id: str,
+        date: datetime,
+        start_time: str,
+        end_time: str,
+        timezone: str = "Asia/Tokyo",
+        use_cache: bool = True
+    ) -> List[Tuple[datetime, datetime]]:
+        """
+        指定日のbusy枠を取得
+
+        Args:
+            calendar_id: カレンダーID
+            date: 対象日
+            start_time: 開始時刻 (HH:MM)
+            end_time: 終了時刻 (HH:MM)
+            timezone: タイムゾーン
+            use_cache: キャッシュを利用するか（False で常に API から取得）
+
+        Returns:
+            busy枠のリスト [(開始時刻, 終了時刻), ...]
+        """
+        busy_by_calendar = await self.get_busy_slots_batch(
+            calendar_ids=[calendar_id],
+            date=date,
+            start_time=start_time,
+            end_time=end_time,
+            timezone=timezone,
+            use_cache=use_cache
+        )
+        return busy_by_calendar[calendar_id]
+
+    @timed(CALENDAR_SERVICE_DURATION, "get_busy_slots_batch")
+    async def get_busy_slots_batch(
+        self,
+        calendar_ids: List[str],
+        date: datetime,
+        start_time: str,
+        end_time: str,
+        timezone: str = "Asia/Tokyo",
+        use_cache: bool = True
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """
+        複数カレンダーのbusy枠を取得
+
+        キャッシュにないカレンダーを freebusy_group_size 件ずつの freebusy.query で並行して問い合わせ、
+        台帳上の予約を重ねて返す
+
+        Args:
+            calendar_ids: カレンダーIDのリスト
+            date: 対象日
+            start_time: 開始時刻 (HH:MM)
+            end_time: 終了時刻 (HH:MM)
+            timezone: タイムゾーン
+            use_cache: キャッシュを利用するか（False で常に API から取得）
+
+        Returns:
+            カレンダーIDごとのbusy枠 {calendar_id: [(開始時刻, 終了時刻), ...]}
+        """
+        try:
+            time_min, time_max = self._time_range(date, start_time, end_time, timezone)
+
+            # ミラー・キャッシュ確認
+            cache = self.busy_cache if use_cache else None
+            busy_by_calendar = self._get_local(calendar_ids, time_min, time_max, use_cache)
+
+            missing_ids = [cid for cid in calendar_ids if cid not in busy_by_calendar]
+            if missing_ids:
+                groups = [
+                    missing_ids[i:i + self.freebusy_group_size]
+                    for i in range(0, len(missing_ids), self.freebusy_group_size)
+                ]
+                results = await asyncio.gather(*(
+                    self._query_freebusy_coalesced(group, time_min, time_max, timezone, cache, use_cache)
+                    for group in groups
+                ))
+                for result in results:
+                    busy_by_calendar.update(result)
+                logger.info(
+                    "Retrieved busy slots for %s calendar(s) from API in %s request(s) (%s cached)",
+                    len(missing_ids), len(groups), len(calendar_ids) - len(missing_ids)
+                )
+            else:
+                logger.info("Busy slots served from mirror/cache for %s calendar(s)", len(calendar_ids))
+
+            self._overlay_ledger(busy_by_calendar, calendar_ids, time_min, time_max)
+            return busy_by_calendar
+
+        except HttpError as error:
+            logger.error("Calendar API error: %s", error)
+            raise
+        except Exception as error:
+            logger.error("Unexpected error in get_busy_slots: %s", error)
+            raise
+
+    @timed(CALENDAR_SERVICE_DURATION, "sync_calendar")
+    async def sync_calendar(self, calendar_id: str) -> int:
+        """
+        カレンダーのミラーを events.list で同期（同期版と同じく、410 Gone の場合は全件取得からやり直す）
+
+        Args:
+            calendar_id: カレンダーID
+
+        Returns:
+            busy枠が変わった予定の件数
+
+        Raises:
+            HttpError: Calendar API エラー
+            CircuitOpenError: Calendar API の回路が開いている
+        """
+        try:
+            return self._commit_sync(await self._list_events(calendar_id))
+        except HttpError as error:
+            if error.resp.status != 410:
+                raise
+            logger.warning("Sync token expired for calendar %s..., running a full sync", calendar_id[:8])
+            self.calendar_mirror.reset(calendar_id)
+            return self._commit_sync(await self._list_events(calendar_id), resynced=True)
+
+    async def _list_events(self, calendar_id: str) -> MirrorUpdate:
+        """events.list の全ページを取得"""
+        update = self.calendar_mirror.begin(calendar_id)
+        events_path = f"calendars/{quote(calendar_id, safe='')}/events"
+        page_token = None
+        while True:
+            with CALENDAR_API_DURATION.time("events.list"):
+                page = await self._request("GET", events_path, params=update.params(page_token))
+            page_token = update.add_page(page)
+            if not page_token:
+                return update
+
+    async def watch_calendar(self, calendar_id: str, address: str, token: str, ttl_seconds: int) -> Dict:
+        """
+        カレンダーの変更通知チャンネルを作成（events.watch）し、ミラーに記録
+
+        Args:
+            calendar_id: カレンダーID
+            address: 通知先（HTTPS の /webhooks/calendar）
+            token: 通知に付けるトークン
+            ttl_seconds: チャンネルの有効期間（秒）
+
+        Returns:
+            作成されたチャンネル
+        """
+        with CALENDAR_API_DURATION.time("events.watch"):
+            channel = await self._request(
+                "POST",
+                f"calendars/{quote(calendar_id, safe='')}/events/watch",
+                watch_request(address, token, ttl_seconds)
+            )
+        self.calendar_mirror.register_channel(calendar_id, channel)
+        logger.info("Calendar %s... watch channel created, expires %s", calendar_id[:8], channel.get("expiration"))
+        return channel
+
+    async def _query_freebusy_coalesced(
+        self,
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime,
+        timezone: str,
+        cache: Optional[BusySlotCache],
+        use_cache: bool
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """
+        freebusy.query を実行（同じ範囲を問い合わせ中のタスクがあれば結果を共有）
+
+        常に最新を取得する呼び出し（use_cache=False）は、自分より前に始まった問い合わせには合流しない
+        """
+        if not (self.freebusy_flight and use_cache):
+            return await self._query_freebusy(calendar_ids, time_min, time_max, timezone, cache)
+        result, shared = await self.freebusy_flight.do(
+            self._freebusy_flight_key(calendar_ids, time_min, time_max, timezone),
+            lambda: self._query_freebusy(calendar_ids, time_min, time_max, timezone, cache)
+        )
+        return self._coalesced_result(result, shared)
+
+    async def _query_freebusy(
+        self,
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime,
+        timezone: str,
+        cache: Optional[BusySlotCache]
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """freebusy.query を実行し、結果をキャッシュに保存"""
+        body = self._freebusy_body(calendar_ids, time_min, time_max, timezone)
+        generations = self._cache_generations(calendar_ids, cache)
+        with CALENDAR_API_DURATION.time("freebusy.query"):
+            result = await self._request("POST", "freeBusy", body, self.read_timeout_seconds)
+        return self._parse_freebusy(result, calendar_ids, time_min, time_max, cache, generations)
+
+    @timed(CALENDAR_SERVICE_DURATION, "insert_event")
+    async def insert_event(self, calendar_id: str, event: Dict, event_id: str) -> Dict:
+        """
+        イベントを作成（同じ event_id での再実行は冪等）
+
+        Args:
+            calendar_id: カレンダーID
+            event: イベント本文
+            event_id: イベントID（base32hex: 小文字 a-v と数字）
+
+        Returns:
+            作成されたイベント情報
+
+        Raises:
+            HttpError: Calendar API エラー
+            CircuitOpenError: Calendar API の回路が開いている
+        """
+        events_path = f"calendars/{quote(calendar_id, safe='')}/events"
+        try:
+            with CALENDAR_API_DURATION.time("events.insert"):
+                return await self._request("POST", events_path, dict(event, id=event_id))
+        except HttpError as error:
+            # 前回の試行で作成済み（レスポンスだけ失われたケース）
+            if error.resp.status == 409:
+                logger.info("Event %s already exists, treating insert as done", event_id)
+                with CALENDAR_API_DURATION.time("events.get"):
+                    return await self._request("GET", f"{events_path}/{event_id}")
+            raise
+
+    @timed(CALENDAR_SERVICE_DURATION, "create_booking")
+    async def create_booking(
+        self,
+        calendar_id: str,
+        start_time: datetime,
+        duration: int,
+        customer_name: str,
+        customer_phone: str,
+        staff_name: str,
+        service_name: str,
+        location: str,
+        customer_email: Optional[str] = None,
+        note: Optional[str] = None,
+        timezone: str = "Asia/Tokyo"
+    ) -> Dict:
+        """
+        予約を確定（イベント作成）
+
+        Args:
+            calendar_id: カレンダーID
+            start_time: 開始時刻
+            duration: 施術時間（分）
+            customer_name: 予約者名
+            customer_phone: 電話番号
+            staff_name: 施術者名
+            service_name: サービス名
+            location: 会場住所
+            customer_email: メールアドレス（任意）
+            note: 備考（任意）
+            timezone: タイムゾーン
+
+        Returns:
+            作成されたイベント情報
+
+        Raises:
+            SlotConflictError: 台帳上で既に予約済みの枠
+            HttpError: Calendar API エラー
+            CircuitOpenError: Calendar API の回路が開いている（台帳には記録しない）
+        """
+        self.ensure_calendar_available()
+        end_time = start_time + timedelta(minutes=duration)
+        booking_id = self.reserve_booking(calendar_id, start_time, end_time)
+
+        event = self.build_event(
+            start_time=start_time,
+            duration=duration,
+            customer_name=customer_name,
+            customer_phone=customer_phone,
+            staff_name=staff_name,
+            service_name=service_name,
+            location=location,
+            customer_email=customer_email,
+            note=note,
+            timezone=timezone
+        )
+
+        try:
+            created_event = await self.insert_event(calendar_id, event, event_id=booking_id)
+            self.confirm_booking(booking_id, calendar_id, start_time, end_time, created_event["id"])
+
+            logger.info(
+                "Booking created - Staff: %s, Time: %s, Customer: %s** (masked)",
+                staff_name, start_time, customer_name[:2]
+            )
+
+            return created_event
+
+        except (HttpError, CircuitOpenError) as error:
+            logger.error("Failed to create booking: %s", error)
+            self.release_booking(booking_id, calendar_id)
+            raise
+
+    @timed(CALENDAR_SERVICE_DURATION, "is_slot_available")
+    async def is_slot_available(
+        self,
+        calendar_id: str,
+        start_time: datetime,
+        duration: int,
+        recovery_times: Mapping[str, int],
+        timezone: str = "Asia/Tokyo"
+    ) -> bool:
+        """
+        指定枠が予約可能かチェック（二重予約防止用）
+
+        Args:
+            calendar_id: カレンダーID
+            start_time: 開始時刻
+            duration: 施術時間（分）
+            recovery_times: 回復枠 {開始時刻 (HH:MM): 長さ（分）}
+            timezone: タイムゾーン
+
+        Returns:
+            予約可能な場合 True
+        """
+        end_time = start_time + timedelta(minutes=duration)
+
+        # 回復枠・台帳チェック
+        if self._is_blocked_locally(calendar_id, start_time, end_time, recovery_times):
+            return False
+
+        # busy枠チェック
+        busy_slots = await self.get_busy_slots(
+            calendar_id=calendar_id,
+            date=start_time,
+            start_time=start_time.strftime("%H:%M"),
+            end_time=end_time.strftime("%H:%M"),
+            timezone=timezone,
+            # 台帳はインスタンスごとのため、他インスタンスの予約を見落とさないよう常に最新を取得
+            use_cache=False
+        )
+
+        return not self._overlaps_busy(start_time, end_time, busy_slots)
+
+    async def aclose(self):
+        """HTTP 接続を閉じる"""
+        await self.client.aclose()
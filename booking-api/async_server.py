@@ -0,0 +1,810 @@
+"""
+予約システム API サーバー（非同期版 / Quart）
+server.py と同じルート・JSON 形式で応答する。Calendar API の応答待ちの間も
+1ワーカー（1イベントループ）で他のリクエストを処理できる
+
+起動: hypercorn --bind :8080 async_server:app
+
+※ async_calendar_write・calendar_batch は同期版（server.py）のみ対応。
+   非同期版ではイベント作成を待ってもワーカーを占有しないため、常にその場で作成する
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from quart import Quart, Response, g, jsonify, make_response, request
+
+from api_common import (
+    BOOKING_ERROR_MESSAGE,
+    CALENDAR_ERROR_MESSAGE,
+    SLOT_TAKEN_MESSAGE,
+    availability_body,
+    availability_calendar_ids,
+    availability_headers,
+    batch_body,
+    booking_details,
+    booking_response,
+    cache_headers,
+    calendar_api_endpoint,
+    calendar_unavailable,
+    calendar_webhook_settings,
+    check_not_modified,
+    client_ip,
+    create_circuit_breaker,
+    create_rate_limiters,
+    etag_matches,
+    get_credentials,
+    load_config,
+    log_booking_confirmed,
+    metrics_authorized,
+    metrics_settings,
+    parse_availability_query,
+    parse_batch_query,
+    parse_booking_request,
+    parse_search_query,
+    parse_staff_at_query,
+    revalidate_after_fetch,
+    search_body,
+    search_free_intervals,
+    stale_busy_fallback,
+    staff_at_body,
+)
+from app_config import AppConfig
+from async_calendar_service import CALENDAR_UNAVAILABLE_ERRORS, AsyncCalendarService
+from availability_snapshot import (
+    SSE_KEEPALIVE,
+    AvailabilitySnapshot,
+    format_sse_event,
+    format_sse_retry,
+)
+from booking_store import BookingStore
+from calendar_service import SlotConflictError
+from calendar_sync import CalendarMirror, notification_calendar
+from credential_manager import CredentialManager
+from metrics import (
+    BOOKING_CONFLICTS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    HTTP_REQUEST_DURATION,
+    RATE_LIMIT_REJECTIONS,
+    registry as metrics_registry,
+)
+from rate_limiter import InMemoryBackend, RateLimiter
+from reservation import ReservationManager
+from structured_logging import setup_logging
+
+# Quart app
+app = Quart(__name__)
+
+# 設定読み込み
+config = load_config()
+
+# ログ設定（JSON 形式、出力はキュー経由で別スレッド）
+log_listener = setup_logging(config.get("logging", {}))
+logger = logging.getLogger(__name__)
+app_config = AppConfig(config)
+
+# /metrics は Bearer トークン（METRICS_TOKEN）を設定した場合のみ有効
+metrics_enabled, metrics_auth_token = metrics_settings(config.get("metrics", {}))
+
+
+# 処理時間の計測（他のフックより先に登録し、開始は最初・記録は最後に行う）
+@app.before_request
+async def start_request_timer():
+    """リクエストの開始時刻を記録"""
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def record_request_duration(response):
+    """ルート（URLテンプレート）ごとの処理時間を記録（SSE は配信開始までの時間）"""
+    started = g.get("request_started")
+    if metrics_enabled and started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - started, route, request.method, str(response.status_code)
+        )
+    return response
+
+# レート制限
+rate_limit_config = config["rate_limit"]
+rate_limiter: Optional[RateLimiter]
+rate_limit_routes: Dict[str, Tuple[RateLimiter, int]]
+rate_limiter, rate_limit_routes = create_rate_limiters(rate_limit_config)
+
+# 予約枠の仮押さえ（check-then-insert の競合防止）
+reservation_manager = ReservationManager()
+
+# グローバル変数
+calendar_service: Optional[AsyncCalendarService] = None
+credential_manager: Optional[CredentialManager] = None
+availability_snapshot: Optional[AvailabilitySnapshot] = None
+snapshot_task: Optional[asyncio.Task] = None
+snapshot_wakeup: Optional[asyncio.Event] = None
+calendar_mirror: Optional[CalendarMirror] = None
+calendar_sync_task: Optional[asyncio.Task] = None
+calendar_sync_wakeup: Optional[asyncio.Event] = None
+
+# カレンダーの差分同期（プッシュ通知の通知先とトークン）
+sync_config = config.get("calendar_sync", {})
+webhook_address, webhook_token = calendar_webhook_settings(sync_config)
+
+# 空き枠スナップショットの配信（SSE はスレッドを占有しないため同期版より多く受け付ける）
+snapshot_config = config.get("availability_snapshot", {})
+open_streams = 0
+# 検索で使うスナップショットを古いとみなす、最後の全体更新からの経過秒数（更新間隔 + 1回の取得にかかりうる時間）
+snapshot_max_age_seconds = (
+    snapshot_config.get("refresh_interval_seconds", 30)
+    + (config["google_calendar"].get("read_timeout_seconds") or 0)
+)
+
+# 起動設定
+startup_config = config.get("startup", {})
+startup_mode = os.environ.get("STARTUP_MODE", startup_config.get("mode", "eager"))
+init_lock = asyncio.Lock()
+init_error: Optional[str] = None
+
+
+@app.after_request
+async def check_cors_origin(response):
+    """CORSヘッダーを動的に設定"""
+    origin = request.headers.get("Origin")
+
+    # オリジンが許可リストに含まれる場合のみ、明示的に設定
+    if origin and app_config.is_origin_allowed(origin):
+        response.headers["Access-Control-Allow-Origin"] = origin
+        response.vary.add("Origin")  # 共有キャッシュがオリジンごとに保持するように
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+    elif origin:
+        # 許可されていないオリジンの場合はログ出力
+        logger.warning("CORS blocked origin: %s", origin)
+        # server.py（flask-cors の origins="*"）と同じく /api/* は応答を返す
+        if request.path.startswith("/api/"):
+            response.headers["Access-Control-Allow-Origin"] = origin
+            response.headers["Vary"] = "Origin"
+
+    return response
+
+
+async def check_rate_limit() -> Optional[Tuple[Dict, int]]:
+    """レート制限チェック"""
+    if not rate_limiter:
+        return None
+
+    # エンドポイントに対応するポリシーは1回の辞書参照で決まる
+    limiter, cost = rate_limit_routes.get(request.endpoint, (rate_limiter, 1))
+
+    ip_address = client_ip(request.headers.get("X-Forwarded-For"), request.remote_addr)
+    if isinstance(limiter.backend, InMemoryBackend):
+        allowed, message = limiter.is_allowed(ip_address, cost)
+    else:
+        # Redis はネットワーク越しのためイベントループを止めない
+        allowed, message = await asyncio.to_thread(limiter.is_allowed, ip_address, cost)
+
+    if not allowed:
+        logger.warning("Rate limit exceeded for IP: %s (%s)", ip_address, request.endpoint)
+        RATE_LIMIT_REJECTIONS.inc(request.endpoint or "unknown")
+        return {"error": message}, 429
+
+    return None
+
+
+async def init_calendar_service():
+    """AsyncCalendarService 初期化"""
+    global calendar_service, credential_manager, availability_snapshot, snapshot_task, snapshot_wakeup
+    global calendar_mirror, calendar_sync_task, calendar_sync_wakeup
+    try:
+        # 認証情報の取得と初回のトークン更新はブロッキング処理のためスレッドで実行
+        credential_manager = CredentialManager(
+            await asyncio.to_thread(get_credentials, config),
+            refresh_margin_seconds=config["google_calendar"].get("token_refresh_margin_seconds", 300)
+        )
+        await asyncio.to_thread(credential_manager.start)
+
+        cache_config = config.get("cache", {})
+        store_config = config.get("booking_store", {})
+        async_server_config = config.get("async_server", {})
+        breaker_config = config.get("circuit_breaker", {})
+        booking_store = (
+            BookingStore(store_config["path"], store_config.get("synced_hold_seconds", 300))
+            if store_config.get("enabled") else None
+        )
+        if sync_config.get("enabled"):
+            calendar_mirror = CalendarMirror(
+                (staff["calendar_id"] for staff in app_config.staff_list),
+                app_config.timezone_name,
+                max_age_seconds=sync_config.get("max_age_seconds")
+            )
+        calendar_service = AsyncCalendarService(
+            credential_manager,
+            cache_ttl_seconds=cache_config.get("busy_ttl_seconds", 0) if cache_config.get("enabled") else 0,
+            cache_max_entries=cache_config.get("max_entries", 256),
+            booking_store=booking_store,
+            http_timeout_seconds=config["google_calendar"].get("http_timeout_seconds"),
+            api_endpoint=calendar_api_endpoint(config),
+            max_connections=async_server_config.get("max_connections", 100),
+            freebusy_group_size=async_server_config.get("freebusy_group_size", 50),
+            coalesce_freebusy=cache_config.get("coalesce_freebusy", True),
+            read_timeout_seconds=config["google_calendar"].get("read_timeout_seconds"),
+            stale_max_age_seconds=breaker_config.get("stale_max_age_seconds", 0),
+            circuit_breaker=create_circuit_breaker(breaker_config),
+            calendar_mirror=calendar_mirror
+        )
+
+        # 空き枠スナップショット（初回の生成はバックグラウンドで行う）
+        if snapshot_config.get("enabled"):
+            availability_snapshot = AvailabilitySnapshot(app_config, calendar_service)
+            snapshot_wakeup = asyncio.Event()
+            snapshot_task = asyncio.create_task(
+                refresh_snapshot_periodically(snapshot_config.get("refresh_interval_seconds", 30))
+            )
+
+        # カレンダーの差分同期（初回の全件取得はバックグラウンドで行い、完了までは freebusy.query を使う）
+        if calendar_mirror:
+            calendar_sync_wakeup = asyncio.Event()
+            calendar_sync_task = asyncio.create_task(
+                sync_calendars_periodically(sync_config.get("poll_interval_seconds", 60))
+            )
+        logger.info("AsyncCalendarService initialized successfully")
+    except Exception as e:
+        logger.error("Failed to initialize AsyncCalendarService: %s", e)
+        raise
+
+
+async def refresh_snapshot_periodically(interval_seconds: float):
+    """
+    スナップショットを一定間隔（またはミラーの変更時）で全カレンダーの最新のbusy枠から作り直す
+
+    差分同期が有効ならミラーから（Google への問い合わせなし）、無効ならキャッシュを使わずに取得する
+    """
+    while True:
+        try:
+            since = availability_snapshot.mark()
+            busy_by_calendar = await calendar_service.get_busy_slots_batch(
+                calendar_ids=availability_snapshot.calendar_ids,
+                date=availability_snapshot.date,
+                start_time=app_config.start_time_str,
+                end_time=app_config.end_time_str,
+                timezone=app_config.timezone_name,
+                use_cache=calendar_mirror is not None
+            )
+            availability_snapshot.replace(busy_by_calendar, since)
+        except Exception as e:
+            logger.error("Availability snapshot refresh failed: %s", e)
+        await wait_for_wakeup(snapshot_wakeup, interval_seconds)
+
+
+async def wait_for_wakeup(event: asyncio.Event, timeout: float):
+    """event がセットされるか timeout 秒経つまで待ち、event をリセットする"""
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    event.clear()
+
+
+async def sync_calendars_periodically(poll_interval_seconds: float):
+    """
+    カレンダーのミラーを差分同期し続ける（同期版の CalendarSyncWorker と同じ動作）
+
+    プッシュ通知を受けたカレンダーはすぐに、全カレンダーは poll_interval_seconds ごとに同期し、
+    通知チャンネルを期限前に作り直す
+    """
+    webhook_config = sync_config.get("webhook", {})
+    next_poll = 0.0
+    while True:
+        poll = time.monotonic() >= next_poll
+        if poll:
+            next_poll = time.monotonic() + poll_interval_seconds
+        changed = False
+        for calendar_id in calendar_mirror.take_due(poll):
+            try:
+                changed = await calendar_service.sync_calendar(calendar_id) > 0 or changed
+            except Exception as e:
+                logger.error("Calendar sync failed for %s...: %s", calendar_id[:8], e)
+        if changed and snapshot_wakeup:
+            snapshot_wakeup.set()
+
+        if webhook_address:
+            for calendar_id in calendar_mirror.calendars_to_watch(
+                webhook_config.get("renew_before_seconds", 3600), poll_interval_seconds
+            ):
+                try:
+                    await calendar_service.watch_calendar(
+                        calendar_id, webhook_address, webhook_token, webhook_config.get("ttl_seconds", 86400)
+                    )
+                except Exception as e:
+                    logger.error("Calendar watch failed for %s...: %s", calendar_id[:8], e)
+
+        await wait_for_wakeup(calendar_sync_wakeup, max(next_poll - time.monotonic(), 0))
+
+
+async def ensure_calendar_service() -> bool:
+    """
+    AsyncCalendarService の初期化を待つ（未初期化で初期化中でなければここで初期化）
+
+    Returns:
+        初期化済みの場合 True
+    """
+    global init_error
+    if calendar_service is not None:
+        return True
+
+    # 初期化中は完了を待ち、初期化中でなければ自分で初期化する
+    try:
+        await asyncio.wait_for(init_lock.acquire(), startup_config.get("ready_wait_seconds", 10))
+    except asyncio.TimeoutError:
+        return False
+    try:
+        if calendar_service is None:
+            await init_calendar_service()
+            init_error = None
+    except Exception as e:
+        init_error = str(e)
+    finally:
+        init_lock.release()
+    return calendar_service is not None
+
+
+@app.before_serving
+async def start_calendar_service():
+    """起動モードに応じて AsyncCalendarService を初期化"""
+    logger.info("Startup mode: %s", startup_mode)
+    if startup_mode == "background":
+        app.add_background_task(ensure_calendar_service)
+    elif startup_mode != "lazy":
+        await init_calendar_service()
+
+
+@app.after_serving
+async def stop_calendar_service():
+    """スナップショット更新・差分同期・HTTP 接続・トークン更新スレッドを停止"""
+    if snapshot_task:
+        snapshot_task.cancel()
+    if calendar_sync_task:
+        calendar_sync_task.cancel()
+    if calendar_service:
+        await calendar_service.aclose()
+    if credential_manager:
+        credential_manager.stop()
+
+
+@app.before_request
+async def require_calendar_service():
+    """API リクエストの前に AsyncCalendarService の初期化を待つ"""
+    if not request.path.startswith("/api/") or request.method == "OPTIONS":
+        return None
+    if not await ensure_calendar_service():
+        return jsonify({"error": "Service is starting. Please retry shortly."}), 503, {"Retry-After": "1"}
+    return None
+
+
+async def fetch_busy_slots(calendar_ids: List[str], date: datetime) -> Tuple[Dict[str, List], bool]:
+    """イベント当日のbusy枠を取得（server.py と同じく、Calendar API が使えない間は古いbusy枠で代替）"""
+    try:
+        busy_by_calendar = await calendar_service.get_busy_slots_batch(
+            calendar_ids=calendar_ids,
+            date=date,
+            start_time=app_config.start_time_str,
+            end_time=app_config.end_time_str,
+            timezone=app_config.timezone_name
+        )
+        return busy_by_calendar, False
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        return stale_busy_fallback(calendar_service, app_config, calendar_ids, date, e), True
+
+
+@app.route("/health", methods=["GET"])
+async def health_check():
+    """ヘルスチェック"""
+    return jsonify({"status": "ok", "service": "booking-api"}), 200
+
+
+@app.route("/ready", methods=["GET"])
+async def readiness_check():
+    """レディネスチェック（AsyncCalendarService の初期化が完了しているか）"""
+    if calendar_service is not None:
+        return jsonify({"status": "ready", "startup_mode": startup_mode}), 200
+    status = "error" if init_error else "starting"
+    return jsonify({"status": status, "startup_mode": startup_mode, "error": init_error}), 503
+
+
+@app.route("/metrics", methods=["GET"])
+async def get_metrics():
+    """メトリクス（Prometheus テキスト形式、Authorization: Bearer <METRICS_TOKEN> が必要）"""
+    if not metrics_enabled:
+        return jsonify({"error": "Endpoint not found"}), 404
+    if not metrics_authorized(request.headers.get("Authorization"), metrics_auth_token):
+        return jsonify({"error": "Unauthorized"}), 401, {"WWW-Authenticate": "Bearer"}
+    return Response(metrics_registry.render(), status=200, content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/webhooks/calendar", methods=["POST"])
+async def calendar_webhook():
+    """Google Calendar のプッシュ通知（server.py と同じく、同期はバックグラウンドで行いすぐに応答する）"""
+    if not sync_config.get("enabled"):
+        return jsonify({"error": "Endpoint not found"}), 404
+    if not calendar_sync_wakeup:
+        # 初期化前（Google は 503 を時間をおいて再送する）
+        return "", 503, {"Retry-After": "1"}
+
+    calendar_id, status = notification_calendar(request.headers, webhook_token, calendar_mirror)
+    if calendar_id and calendar_mirror.request_sync(calendar_id):
+        calendar_sync_wakeup.set()
+    return "", status
+
+
+@app.route("/api/availability", methods=["GET"])
+async def get_availability():
+    """空き枠取得API（server.py と同じ形式）"""
+    # レート制限チェック
+    rate_limit_error = await check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    try:
+        # パラメータ取得・検証
+        params, error = parse_availability_query(app_config, request.args)
+        if error:
+            return error
+        calendar_ids = [params["staff"]["calendar_id"]]
+        variant = str(params["duration"])
+
+        if_none_match = request.headers.get("If-None-Match")
+        etag, not_modified = check_not_modified(
+            calendar_service, app_config, calendar_ids, params["date"], variant, if_none_match
+        )
+        if not_modified:
+            return not_modified
+
+        busy_by_calendar, stale = await fetch_busy_slots(calendar_ids, params["date"])
+        not_modified = revalidate_after_fetch(
+            calendar_service, app_config, calendar_ids, variant, if_none_match, stale
+        )
+        if not_modified:
+            return not_modified
+
+        body = availability_body(calendar_service, app_config, params, busy_by_calendar, stale)
+        return jsonify(body), 200, availability_headers(app_config, etag, stale)
+
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, CALENDAR_ERROR_MESSAGE)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error("Unexpected error in get_availability: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route("/api/availability/batch", methods=["GET"])
+async def get_availability_batch():
+    """複数スタッフの空き枠一括取得API（server.py と同じ形式）"""
+    # レート制限チェック（スタッフ数に関わらず1回）
+    rate_limit_error = await check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    try:
+        # パラメータ取得・検証
+        params, error = parse_batch_query(app_config, request.args)
+        if error:
+            return error
+        calendar_ids = availability_calendar_ids(params["staff_list"])
+
+        if_none_match = request.headers.get("If-None-Match")
+        etag, not_modified = check_not_modified(
+            calendar_service, app_config, calendar_ids, params["date"], "", if_none_match
+        )
+        if not_modified:
+            return not_modified
+
+        # busy枠を一括取得
+        busy_by_calendar, stale = await fetch_busy_slots(calendar_ids, params["date"])
+        not_modified = revalidate_after_fetch(
+            calendar_service, app_config, calendar_ids, "", if_none_match, stale
+        )
+        if not_modified:
+            return not_modified
+
+        body = batch_body(calendar_service, app_config, params, busy_by_calendar, stale)
+        return jsonify(body), 200, availability_headers(app_config, etag, stale)
+
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, CALENDAR_ERROR_MESSAGE)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error("Unexpected error in get_availability_batch: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route("/api/availability/at", methods=["GET"])
+async def get_availability_at():
+    """指定時刻に施術できるスタッフの検索API（server.py と同じ形式）"""
+    # レート制限チェック
+    rate_limit_error = await check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    try:
+        # パラメータ取得・検証
+        params, error = parse_staff_at_query(app_config, request.args)
+        if error:
+            return error
+        calendar_ids = availability_calendar_ids(app_config.staff_list)
+        variant = f"{params['time_str']}/{params['duration']}"
+
+        if_none_match = request.headers.get("If-None-Match")
+        etag, not_modified = check_not_modified(
+            calendar_service, app_config, calendar_ids, params["date"], variant, if_none_match
+        )
+        if not_modified:
+            return not_modified
+
+        busy_by_calendar, stale = await fetch_busy_slots(calendar_ids, params["date"])
+        not_modified = revalidate_after_fetch(
+            calendar_service, app_config, calendar_ids, variant, if_none_match, stale
+        )
+        if not_modified:
+            return not_modified
+
+        body = staff_at_body(calendar_service, app_config, params, busy_by_calendar, stale)
+        return jsonify(body), 200, availability_headers(app_config, etag, stale)
+
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, CALENDAR_ERROR_MESSAGE)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error("Unexpected error in get_availability_at: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route("/api/availability/search", methods=["GET"])
+async def search_availability():
+    """早い順の空き枠検索API（server.py と同じ形式）"""
+    # レート制限チェック
+    rate_limit_error = await check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    try:
+        # パラメータ取得・検証
+        params, error = parse_search_query(app_config, request.args)
+        if error:
+            return error
+
+        index, free_by_staff = (
+            availability_snapshot.free_intervals() if availability_snapshot else (None, {})
+        )
+        if index is not None:
+            # 全体更新が止まっている・Calendar API の回路が開いている間は古い可能性がある
+            stale = availability_snapshot.is_stale(snapshot_max_age_seconds)
+        else:
+            # スナップショットが無効・未生成の間は freebusy（キャッシュ）から作る
+            staff_list = [staff for staff, _ in params["candidates"]]
+            busy_by_calendar, stale = await fetch_busy_slots(
+                availability_calendar_ids(staff_list), params["date"]
+            )
+            index, free_by_staff = search_free_intervals(
+                calendar_service, app_config, staff_list, params["date"], busy_by_calendar
+            )
+
+        body = search_body(app_config, params, index, free_by_staff, stale)
+        return jsonify(body), 200, availability_headers(app_config, None, stale)
+
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, CALENDAR_ERROR_MESSAGE)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error("Unexpected error in search_availability: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route("/api/availability/snapshot", methods=["GET"])
+async def get_availability_snapshot():
+    """全スタッフ・全メニューの空き枠（server.py と同じ形式）"""
+    # レート制限チェック
+    rate_limit_error = await check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    if not availability_snapshot:
+        return jsonify({"error": "Availability snapshot is not enabled"}), 404
+
+    body, etag = availability_snapshot.get()
+    if body is None:
+        return jsonify({"error": "Availability snapshot is being prepared. Please retry shortly."}), 503, {"Retry-After": "1"}
+
+    headers = cache_headers(app_config, etag)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return "", 304, headers
+    return Response(body, status=200, mimetype="application/json", headers=headers)
+
+
+@app.route("/api/availability/stream", methods=["GET"])
+async def stream_availability():
+    """空き枠スナップショットの配信（Server-Sent Events、server.py と同じ形式）"""
+    # レート制限チェック
+    rate_limit_error = await check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    if not availability_snapshot:
+        return jsonify({"error": "Availability snapshot is not enabled"}), 404
+
+    if open_streams >= snapshot_config.get("max_streams_async", 500):
+        logger.warning("Availability stream rejected - too many open streams")
+        return jsonify({"error": "Too many open streams. Please retry shortly."}), 503, {"Retry-After": "10"}
+
+    snapshot = availability_snapshot
+    last_event_id = request.headers.get("Last-Event-ID")
+    keepalive_seconds = snapshot_config.get("stream_keepalive_seconds", 15)
+    deadline = time.monotonic() + snapshot_config.get("stream_max_seconds", 50)
+
+    async def generate():
+        global open_streams
+        # 変更通知はスナップショットを更新したスレッドから届くため、イベントループ経由で受け取る
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def notify():
+            loop.call_soon_threadsafe(changed.set)
+
+        open_streams += 1
+        snapshot.add_listener(notify)
+        try:
+            yield format_sse_retry(snapshot_config.get("stream_retry_ms", 3000))
+            sent_etag = last_event_id
+            while True:
+                changed.clear()
+                body, etag = snapshot.get()
+                if body is not None and etag != sent_etag:
+                    yield format_sse_event(body, etag)
+                    sent_etag = etag
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), min(keepalive_seconds, remaining))
+                except asyncio.TimeoutError:
+                    yield SSE_KEEPALIVE
+        finally:
+            snapshot.remove_listener(notify)
+            open_streams -= 1
+
+    response = await make_response(generate(), 200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # プロキシでのバッファリングを無効化
+    })
+    # 配信中は Quart の応答タイムアウトを適用しない（stream_max_seconds で切断する）
+    response.timeout = None
+    return response
+
+
+@app.route("/api/book", methods=["POST"])
+async def create_booking():
+    """予約確定API（server.py と同じ形式、常にその場でカレンダーに登録）"""
+    # レート制限チェック
+    rate_limit_error = await check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    try:
+        # リクエスト本文の検証
+        booking, error = parse_booking_request(app_config, await request.get_json(silent=True))
+        if error:
+            return error
+        staff = booking["staff"]
+        start_str = booking["start_str"]
+        start_time = booking["start_time"]
+        calendar_id = booking["calendar_id"]
+
+        # Calendar API の回路が開いている間は待たずに断る
+        calendar_service.ensure_calendar_available()
+
+        # 枠を仮押さえ（同じスタッフへの同時リクエストは1件だけが先へ進む）
+        reservation = reservation_manager.try_reserve(calendar_id, start_time, booking["end_time"])
+        if reservation is None:
+            logger.warning(
+                "Booking failed - Slot is being reserved - Staff: %s, Time: %s", staff["name"], start_str
+            )
+            BOOKING_CONFLICTS.inc("reserving")
+            return jsonify({"error": SLOT_TAKEN_MESSAGE}), 409  # Conflict
+
+        try:
+            is_available = await calendar_service.is_slot_available(
+                calendar_id=calendar_id,
+                start_time=start_time,
+                duration=booking["duration"],
+                recovery_times=app_config.recovery_times,
+                timezone=app_config.timezone_name
+            )
+
+            if not is_available:
+                logger.warning(
+                    "Booking failed - Slot already taken - Staff: %s, Time: %s", staff["name"], start_str
+                )
+                BOOKING_CONFLICTS.inc("calendar")
+                return jsonify({"error": SLOT_TAKEN_MESSAGE}), 409  # Conflict
+
+            # 予約確定
+            event = await calendar_service.create_booking(
+                calendar_id=calendar_id,
+                **booking_details(app_config, booking)
+            )
+        finally:
+            # 仮押さえは確定（台帳・カレンダーへの記録）までの間だけ。以降の重複は台帳と freebusy で検出する
+            reservation_manager.release(calendar_id, reservation)
+
+        # スナップショットは予約したスタッフの分だけ再計算（SSE で配信される）
+        if availability_snapshot:
+            availability_snapshot.add_busy(calendar_id, start_time, booking["end_time"])
+
+        # マスク処理してログ
+        log_booking_confirmed(booking)
+
+        return jsonify(booking_response(app_config, booking, event["id"], event["id"], "synced")), 200
+
+    except SlotConflictError:
+        logger.warning(
+            "Booking failed - Slot already taken (ledger) - Staff: %s, Time: %s", staff["name"], start_str
+        )
+        BOOKING_CONFLICTS.inc("ledger")
+        return jsonify({"error": SLOT_TAKEN_MESSAGE}), 409  # Conflict
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, BOOKING_ERROR_MESSAGE)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error("Unexpected error in create_booking: %s", e)
+        return jsonify({"error": BOOKING_ERROR_MESSAGE}), 500
+
+
+@app.route("/api/book/<booking_id>", methods=["GET"])
+async def get_booking_status(booking_id):
+    """予約のカレンダー反映状況API（server.py と同じ形式）"""
+    # レート制限チェック
+    rate_limit_error = await check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    booking_store = calendar_service.booking_store if calendar_service else None
+    if not booking_store:
+        return jsonify({"error": "Booking status is not available"}), 404
+
+    booking = booking_store.get(booking_id)
+    if not booking:
+        return jsonify({"error": f"Booking not found: {booking_id}"}), 404
+
+    return jsonify({
+        "booking_id": booking["booking_id"],
+        "status": booking["status"],
+        "event_id": booking["event_id"]
+    }), 200
+
+
+@app.errorhandler(404)
+async def not_found(error):
+    """404エラーハンドラ"""
+    return jsonify({"error": "Endpoint not found"}), 404
+
+
+@app.errorhandler(500)
+async def internal_error(error):
+    """500エラーハンドラ"""
+    logger.error("Internal server error: %s", error)
+    return jsonify({"error": "Internal server error"}), 500
+
+
+if __name__ == "__main__":
+    # 開発用（本番は hypercorn で起動）
+    port = int(os.environ.get("PORT", 8080))
+    app.run(host="0.0.0.0", port=port, debug=False)
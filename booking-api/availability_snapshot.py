@@ -0,0 +1,325 @@
+"""
+空き枠スナップショット
+イベント当日の全スタッフ・全メニューの空き枠を1つの JSON にまとめて保持する。
+リクエストごとに計算せず、事前に組み立てたバイト列と ETag をそのまま返す
+
+- 全体更新: 全カレンダーの busy 枠（freebusy.query 1回分）から作り直す
+- 予約時: 該当カレンダーの busy 枠に予約を追加し、そのスタッフ分だけ再計算する
+- 変更があると version が進み、待機中の購読者（SSE 配信）に通知する
+- 早い順の空き枠検索（/api/availability/search）用に、スタッフごとの空き区間も同時に作る
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from api_common import format_slots
+from app_config import AppConfig
+from calendar_service import CalendarServiceBase
+from occupancy_index import OccupancyIndex
+
+logger = logging.getLogger(__name__)
+
+
+class AvailabilitySnapshot:
+    """全スタッフ・全メニューの空き枠（事前生成済みの JSON）"""
+
+    def __init__(self, app_config: AppConfig, calendar_service: CalendarServiceBase):
+        """
+        初期化
+
+        Args:
+            app_config: 事前計算済みの設定
+            calendar_service: 空き枠計算に使用するサービス（同期版・非同期版どちらでも可）
+        """
+        self.app_config = app_config
+        self.calendar_service = calendar_service
+        self.date = datetime.strptime(app_config.event_date_str, "%Y-%m-%d")
+        # スタッフが共有するカレンダーも1回だけ問い合わせる
+        self.calendar_ids: List[str] = list(dict.fromkeys(
+            staff["calendar_id"] for staff in app_config.staff_list
+        ))
+
+        self._busy_by_calendar: Dict[str, List[Tuple[datetime, datetime]]] = {}
+        self._entries: Dict[str, Dict] = {}
+        # 早い順の検索用（スタッフIDごとの空き区間と、分オフセットの基準になる索引）
+        self._occupancy: Optional[OccupancyIndex] = None
+        self._free_intervals: Dict[str, List[Tuple[int, int]]] = {}
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._version = 0
+        # 最後に全体更新が成功した時刻（time.monotonic()、未生成の間は None）
+        self._refreshed_at: Optional[float] = None
+        # 前回の全体更新以降に追加した予約（取得中に入った予約を全体更新で失わないため）
+        self._added: List[Tuple[int, str, datetime, datetime]] = []
+        self._added_total = 0
+        self._condition = threading.Condition()
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def version(self) -> int:
+        """内容が変わるたびに増える番号（未生成の間は 0）"""
+        return self._version
+
+    def get(self) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        現在のスナップショットを取得
+
+        Returns:
+            (JSON のバイト列, ETag)、未生成の場合は (None, None)
+        """
+        with self._condition:
+            return self._body, self._etag
+
+    def mark(self) -> int:
+        """
+        全体更新の busy 枠を取得する直前に呼び、戻り値を replace に渡す
+
+        Returns:
+            これまでに add_busy で追加した予約の件数
+        """
+        with self._condition:
+            return self._added_total
+
+    def replace(
+        self,
+        busy_by_calendar: Dict[str, List[Tuple[datetime, datetime]]],
+        since: Optional[int] = None
+    ):
+        """
+        全カレンダーの busy 枠から作り直す（定期更新）
+
+        Args:
+            busy_by_calendar: カレンダーIDごとのbusy枠（get_busy_slots_batch の結果）
+            since: 取得前の mark() の値（取得中に追加された予約を引き継ぐ）
+        """
+        with self._condition:
+            self._busy_by_calendar = {
+                calendar_id: list(busy_by_calendar.get(calendar_id, []))
+                for calendar_id in self.calendar_ids
+            }
+            for sequence, calendar_id, start, end in self._added:
+                if since is not None and sequence >= since and calendar_id in self._busy_by_calendar:
+                    self._busy_by_calendar[calendar_id].append((start, end))
+            self._added = []
+            for staff in self.app_config.staff_list:
+                self._entries[staff["id"]] = self._build_entry(staff)
+            self._refreshed_at = time.monotonic()
+            self._publish()
+
+    def is_stale(self, max_age_seconds: float) -> bool:
+        """
+        内容が古い可能性があるか（全体更新の失敗が続いている、または Calendar API の回路が開いている）
+
+        Args:
+            max_age_seconds: 最後の全体更新からの許容経過秒数
+
+        Returns:
+            最後の全体更新から max_age_seconds を過ぎている・回路が開いている場合 True
+        """
+        breaker = self.calendar_service.circuit_breaker
+        if breaker and breaker.is_open():
+            return True
+        with self._condition:
+            refreshed_at = self._refreshed_at
+        return refreshed_at is None or time.monotonic() - refreshed_at > max_age_seconds
+
+    def add_busy(self, calendar_id: str, start: datetime, end: datetime):
+        """
+        予約をbusy枠に追加し、該当スタッフの空き枠だけ再計算する
+
+        Args:
+            calendar_id: カレンダーID
+            start: 予約の開始時刻
+            end: 予約の終了時刻
+        """
+        with self._condition:
+            # 初回の全体更新前は記録のみ（全体更新で反映される）
+            self._added.append((self._added_total, calendar_id, start, end))
+            self._added_total += 1
+            if self._body is None or calendar_id not in self._busy_by_calendar:
+                return
+            self._busy_by_calendar[calendar_id].append((start, end))
+            for staff in self.app_config.staff_list:
+                if staff["calendar_id"] == calendar_id:
+                    self._entries[staff["id"]] = self._build_entry(staff)
+            self._publish()
+
+    def free_intervals(self) -> Tuple[Optional[OccupancyIndex], Dict[str, List[Tuple[int, int]]]]:
+        """
+        スタッフごとの空き区間（早い順の検索用、スナップショットと同じ時点の内容）
+
+        Returns:
+            (営業時間帯の索引, {スタッフID: [(開始, 終了), ...]})、未生成の場合は (None, {})
+        """
+        with self._condition:
+            if self._body is None:
+                return None, {}
+            return self._occupancy, dict(self._free_intervals)
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """
+        version から内容が変わるまで待つ（同期版の SSE 配信用）
+
+        Args:
+            version: 受信済みの version
+            timeout: 最大待ち時間（秒）
+
+        Returns:
+            現在の version（タイムアウト時は引数と同じ）
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def add_listener(self, callback: Callable[[], None]):
+        """
+        変更時に呼び出す関数を登録（非同期版の SSE 配信用）
+
+        Args:
+            callback: 引数なしの関数（更新したスレッドで呼ばれるため、すぐに戻ること）
+        """
+        with self._condition:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[], None]):
+        """add_listener で登録した関数を解除"""
+        with self._condition:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _build_entry(self, staff: Dict) -> Dict:
+        """1スタッフ分の空き枠（枠単位とメニューごと）を計算"""
+        # 占有ビットマスクは1回だけ作り、メニューごとの施術時間はマスク演算で判定
+        calendar_id = staff["calendar_id"]
+        index = self.calendar_service.build_occupancy_index(
+            {calendar_id: self._busy_by_calendar[calendar_id]},
+            self.date,
+            self.app_config.start_time_str,
+            self.app_config.end_time_str,
+            self.app_config.slot_duration,
+            self.app_config.recovery_times,
+            self.app_config.timezone_name
+        )
+        row = index.rows[calendar_id]
+        self._occupancy = index
+        self._free_intervals[staff["id"]] = index.free_intervals(row)
+        slots_by_duration: Dict[int, List[str]] = {}
+
+        def slots_for(duration: int) -> List[str]:
+            # 施術時間が同じメニューは計算結果を共有
+            if duration not in slots_by_duration:
+                slots_by_duration[duration] = format_slots(index.available_starts(row, duration))
+            return slots_by_duration[duration]
+
+        return {
+            "staff": self.app_config.staff_summaries[staff["id"]],
+            "available_slots": slots_for(self.app_config.slot_duration),
+            "menus": {menu["name"]: slots_for(menu["duration"]) for menu in staff["menus"]}
+        }
+
+    def _publish(self):
+        """JSON と ETag を作り直し、内容が変わった場合のみ購読者に通知（ロック取得済みで呼ぶ）"""
+        body = json.dumps({
+            "date": self.app_config.event_date_str,
+            "timezone": self.app_config.timezone_name,
+            "results": [self._entries[staff["id"]] for staff in self.app_config.staff_list]
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        # 内容から作るため、同じ空き状況ならインスタンスが違っても ETag は一致する
+        etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        if etag == self._etag:
+            return
+
+        self._body = body
+        self._etag = etag
+        self._version += 1
+        logger.info("Availability snapshot updated - Version: %s, ETag: %s", self._version, etag)
+
+        self._condition.notify_all()
+        for callback in self._listeners:
+            callback()
+
+
+class SnapshotRefresher:
+    """スナップショットを一定間隔で作り直すバックグラウンドスレッド（同期版サーバー用）"""
+
+    def __init__(
+        self,
+        snapshot: AvailabilitySnapshot,
+        fetch_busy: Callable[[], Dict[str, List[Tuple[datetime, datetime]]]],
+        interval_seconds: float = 30
+    ):
+        """
+        初期化
+
+        Args:
+            snapshot: 更新するスナップショット
+            fetch_busy: 全カレンダーのbusy枠を取得する関数
+            interval_seconds: 全体更新の間隔（秒）。カレンダー側で直接入れた予定はこの間隔で反映される
+        """
+        self.snapshot = snapshot
+        self.fetch_busy = fetch_busy
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self):
+        """全カレンダーのbusy枠を取得して作り直す"""
+        since = self.snapshot.mark()
+        self.snapshot.replace(self.fetch_busy(), since)
+
+    def start(self):
+        """バックグラウンド更新を開始（初回の生成もスレッドで行う）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+            self._thread.start()
+
+    def request_refresh(self):
+        """次の間隔を待たずに作り直す（カレンダーのミラーが変わった時など）"""
+        self._wake.set()
+
+    def stop(self):
+        """バックグラウンド更新を停止"""
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        """一定間隔（または request_refresh の時点）で作り直し続けるループ"""
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Availability snapshot refresh failed: %s", e)
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+
+
+def format_sse_event(body: bytes, etag: str) -> bytes:
+    """
+    スナップショットを Server-Sent Events の1イベントに変換
+
+    Args:
+        body: スナップショットの JSON（改行を含まない）
+        etag: ETag（イベントIDとして送り、再接続時の Last-Event-ID と比較する）
+
+    Returns:
+        送信するバイト列
+    """
+    return f"id: {etag}\nevent: snapshot\ndata: ".encode("utf-8") + body + b"\n\n"
+
+
+def format_sse_retry(retry_ms: int) -> bytes:
+    """ブラウザが再接続するまでの待ち時間（ミリ秒）を指定する行"""
+    return f"retry: {retry_ms}\n\n".encode("utf-8")
+
+
+# 接続維持用のコメント行（プロキシに無通信で切断されないよう定期的に送る）
+SSE_KEEPALIVE = b": keepalive\n\n"
@@ -0,0 +1,130 @@
+"""
+イベント作成のバッチ化
+短い時間内に集まった events.insert を1回のバッチHTTPリクエストにまとめて送信する
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from metrics import CALENDAR_API_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Calendar API のバッチ1回あたりの上限
+MAX_BATCH_SIZE = 50
+
+
+class EventInsertBatcher:
+    """events.insert を集約して new_batch_http_request で送信し、結果を各呼び出し元へ返す"""
+
+    def __init__(
+        self,
+        get_service: Callable[[], Any],
+        window_seconds: float = 0.05,
+        max_batch_size: int = MAX_BATCH_SIZE
+    ):
+        """
+        初期化
+
+        Args:
+            get_service: Calendar API サービスオブジェクトを返す関数
+            window_seconds: 最初の1件が届いてから送信するまでの待ち時間（秒）
+            max_batch_size: 1バッチの最大件数（達した時点で即送信）
+        """
+        self.get_service = get_service
+        self.window_seconds = window_seconds
+        self.max_batch_size = min(max_batch_size, MAX_BATCH_SIZE)
+
+        self._pending: List[Dict] = []
+        self._condition = threading.Condition()
+        self._flusher = threading.Thread(target=self._run, name="event-insert-batcher", daemon=True)
+        self._flusher.start()
+
+    def insert(self, calendar_id: str, body: Dict) -> Dict:
+        """
+        イベント作成を依頼し、バッチ送信の結果を待つ
+
+        Args:
+            calendar_id: カレンダーID
+            body: イベント本文
+
+        Returns:
+            作成されたイベント情報
+
+        Raises:
+            HttpError: Calendar API エラー（このリクエスト分）
+        """
+        item = {
+            "calendar_id": calendar_id,
+            "body": body,
+            "done": threading.Event(),
+            "result": None,
+            "error": None,
+        }
+        with self._condition:
+            self._pending.append(item)
+            self._condition.notify()
+
+        item["done"].wait()
+        if item["error"] is not None:
+            raise item["error"]
+        return item["result"]
+
+    def _run(self):
+        """送信スレッドのメインループ"""
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                # 最初の1件から window_seconds 経過するか上限件数に達するまで集める
+                deadline = time.monotonic() + self.window_seconds
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch_items = self._pending[:self.max_batch_size]
+                del self._pending[:self.max_batch_size]
+
+            self._execute(batch_items)
+
+    def _execute(self, items: List[Dict]):
+        """
+        バッチリクエストを送信し、各リクエストの結果を振り分ける
+
+        Args:
+            items: 送信するリクエスト
+        """
+        def callback(request_id, response, exception):
+            item = items[int(request_id)]
+            item["result"] = response
+            item["error"] = exception
+
+        try:
+            service = self.get_service()
+            batch = service.new_batch_http_request(callback=callback)
+            for index, item in enumerate(items):
+                batch.add(
+                    service.events().insert(calendarId=item["calendar_id"], body=item["body"]),
+                    request_id=str(index)
+                )
+            with CALENDAR_API_DURATION.time("events.batch_insert"):
+                batch.execute()
+            logger.info("Sent batch of %s event insert(s)", len(items))
+
+        except Exception as error:
+            # バッチ全体の送信失敗は、結果未設定のリクエストすべてに伝える
+            logger.error("Batch event insert failed: %s", error)
+            for item in items:
+                if item["result"] is None and item["error"] is None:
+                    item["error"] = error
+
+        finally:
+            for item in items:
+                if item["result"] is None and item["error"] is None:
+                    item["error"] = RuntimeError("No response for batched event insert")
+                item["done"].set()
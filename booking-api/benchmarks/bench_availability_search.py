@@ -0,0 +1,119 @@
+"""
+早い順の空き枠検索のマイクロベンチマーク
+スタッフごとに全空き枠を計算して並べ替える方法（/api/availability をスタッフ数だけ呼ぶのと同じ処理）と、
+作成済みの空き区間を heapq.merge で合流させて limit 件で打ち切る search_earliest を比較（結果の一致も確認する）
+
+実行: python benchmarks/bench_availability_search.py
+"""
+
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from api_common import parse_search_query, search_earliest  # noqa: E402
+from app_config import AppConfig  # noqa: E402
+from bench_occupancy_index import event_window  # noqa: E402
+from bench_slot_engine import synthetic_busy  # noqa: E402
+from occupancy_index import OccupancyIndex  # noqa: E402
+from slot_engine import to_minute_offset  # noqa: E402
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+SERVICES = ("ドライヘッド", "ネイル")
+
+
+def synthetic_config(staff_count: int) -> AppConfig:
+    """config.yaml のスタッフを staff_count 人に増やした設定（サービスは交互）"""
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config["staff"] = [
+        {
+            "id": f"staff{i}",
+            "name": f"スタッフ{i}",
+            "service": SERVICES[i % len(SERVICES)],
+            "calendar_id": f"staff{i}@example.com",
+            "menus": [
+                {"name": f"メニュー{i}-{duration}", "duration": duration, "price": 500}
+                for duration in (10, 30)
+            ]
+        }
+        for i in range(staff_count)
+    ]
+    return AppConfig(config)
+
+
+def fan_out(
+    app_config: AppConfig,
+    index: OccupancyIndex,
+    rows: Dict[str, int],
+    params: Dict
+) -> List[Dict]:
+    """スタッフごとに全空き枠を計算し、まとめて並べ替えて先頭 limit 件を返す"""
+    first = to_minute_offset(params["time_from"], index.time_min)
+    last = to_minute_offset(params["time_to"], index.time_min)
+    pairs = []
+    for order, (staff, menus) in enumerate(params["candidates"]):
+        row = rows[staff["id"]]
+        for offset in index.available_offsets(row, min(menu["duration"] for menu in menus)):
+            if first <= offset < last:
+                pairs.append((offset, order, index.free_minutes(row, offset)))
+    pairs.sort()
+    return [
+        {
+            "staff": app_config.staff_summaries[params["candidates"][order][0]["id"]],
+            "start": (index.time_min + timedelta(minutes=offset)).strftime("%H:%M"),
+            "free_minutes": free_minutes,
+            "menus": [
+                menu["name"] for menu in params["candidates"][order][1] if menu["duration"] <= free_minutes
+            ]
+        }
+        for offset, order, free_minutes in pairs[:params["limit"]]
+    ]
+
+
+def main():
+    date = datetime(2026, 2, 20)
+    time_min, time_max, recovery = event_window(date)
+
+    print(f"{'staff':>6} {'busy/staff':>11} {'limit':>6} {'fan-out (µs)':>13} {'search (µs)':>12} {'speedup':>8}")
+    for staff_count in (5, 50, 500):
+        app_config = synthetic_config(staff_count)
+        for busy_count in (5, 40):
+            # 空き区間はスナップショット更新時に作成済みの想定（計測に含めない）
+            index = OccupancyIndex(time_min, time_max, app_config.slot_duration, recovery)
+            rows = {}
+            free_by_staff = {}
+            for i, staff in enumerate(app_config.staff_list):
+                rows[staff["id"]] = index.busy_row(synthetic_busy(date, busy_count, 1, seed=i))
+                free_by_staff[staff["id"]] = index.free_intervals(rows[staff["id"]])
+
+            for limit in (5, 50):
+                params, error = parse_search_query(
+                    app_config, {"service": ",".join(SERVICES), "limit": str(limit)}
+                )
+                assert error is None, error
+                assert fan_out(app_config, index, rows, params) == search_earliest(
+                    app_config, index, free_by_staff, params
+                )
+
+                number = 5 if staff_count >= 500 else 100
+                t_fan_out = min(timeit.repeat(
+                    lambda: fan_out(app_config, index, rows, params), number=number, repeat=3
+                )) / number
+                t_search = min(timeit.repeat(
+                    lambda: search_earliest(app_config, index, free_by_staff, params), number=number, repeat=3
+                )) / number
+                print(
+                    f"{staff_count:>6} {busy_count:>11} {limit:>6} {t_fan_out * 1e6:>13.1f} "
+                    f"{t_search * 1e6:>12.1f} {t_fan_out / t_search:>7.1f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
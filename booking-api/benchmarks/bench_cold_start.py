@@ -0,0 +1,121 @@
+"""
+コールドスタート時間の計測
+サーバーを別プロセスで起動し、起動開始から /health と最初の API リクエストが応答するまでの時間を
+起動モード（eager / background / lazy）ごとに比較する
+
+Google には接続せず、トークン更新は一定時間待つだけの模擬処理に置き換える
+（Secret Manager は環境変数 REFRESH_TOKEN / CLIENT_SECRET を設定して使わない）
+
+実行: python benchmarks/bench_cold_start.py
+"""
+
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+TOKEN_REFRESH_LATENCY = 0.5  # 模擬トークン更新の所要時間（秒）
+RUNS = 3
+MODES = ["eager", "background", "lazy"]
+POLL_INTERVAL = 0.005
+TIMEOUT = 60
+
+
+def serve(port: int):
+    """子プロセス: Google クライアントを模擬に置き換えてサーバーを起動"""
+    from datetime import datetime, timedelta
+
+    from google.oauth2.credentials import Credentials
+    from werkzeug.serving import make_server
+
+    def simulated_refresh(self, request):
+        time.sleep(TOKEN_REFRESH_LATENCY)
+        self.token = "simulated-token"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    Credentials.refresh = simulated_refresh
+
+    sys.path.insert(0, APP_DIR)
+    import server
+
+    make_server("127.0.0.1", port, server.app, threaded=True).serve_forever()
+
+
+def free_port() -> int:
+    """空いているポート番号"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, started: float, expected_status: int = 200) -> float:
+    """url が expected_status を返すまで待ち、起動開始からの秒数を返す"""
+    while time.perf_counter() - started < TIMEOUT:
+        try:
+            with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        except (urllib.error.URLError, ConnectionError):
+            status = None
+        if status == expected_status:
+            return time.perf_counter() - started
+        time.sleep(POLL_INTERVAL)
+    raise TimeoutError(url)
+
+
+def measure(mode: str) -> dict:
+    """1回起動して各エンドポイントが応答するまでの時間を計測"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        STARTUP_MODE=mode,
+        REFRESH_TOKEN="simulated-refresh-token",
+        CLIENT_SECRET=json.dumps({"installed": {
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "client_id": "simulated-client-id",
+            "client_secret": "simulated-client-secret",
+        }}),
+    )
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port)],
+        cwd=APP_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        health = wait_for(f"{base}/health", started)
+        # 初期化済みの CalendarService を必要とする最初の API 応答
+        # （存在しない予約IDの状態確認。lazy モードではこのリクエストで初期化される）
+        first_api = wait_for(f"{base}/api/book/unknown", started, expected_status=404)
+        return {"health": health, "first_api": first_api}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    print(f"Simulated token refresh: {TOKEN_REFRESH_LATENCY * 1000:.0f} ms, runs: {RUNS}")
+    print(f"{'mode':>12} {'/health (ms)':>14} {'first API (ms)':>16}")
+    for mode in MODES:
+        results = [measure(mode) for _ in range(RUNS)]
+        health = statistics.median(result["health"] for result in results) * 1000
+        first_api = statistics.median(result["first_api"] for result in results) * 1000
+        print(f"{mode:>12} {health:14.0f} {first_api:16.0f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--serve":
+        serve(int(sys.argv[2]))
+    else:
+        main()
@@ -0,0 +1,103 @@
+"""
+ログ出力のオーバーヘッド
+リクエスト処理スレッドから見た logger.info / logger.warning 1回あたりの時間を、
+従来の同期出力（basicConfig + f-string）とキュー経由の JSON 出力（structured_logging）で比較する
+
+出力先は /dev/null（書き込み先のI/O待ちは含まない。実際の標準出力ではさらに差が開く）
+
+実行: python benchmarks/bench_logging.py
+"""
+
+import logging
+import os
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, APP_DIR)
+
+from structured_logging import setup_logging, stop_listener  # noqa: E402
+
+CALLS = 20_000
+
+STAFF = "平尾和子"
+DATE = "2026-02-20"
+ORIGIN = "https://evil.example.com"
+
+
+def per_call_us(func, calls: int = CALLS) -> float:
+    """func を calls 回呼び出し、1回あたりの時間（マイクロ秒）を返す"""
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def reset_root():
+    """ルートロガーのハンドラーを外す"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+
+def main():
+    devnull = open(os.devnull, "w")
+    logger = logging.getLogger("bench")
+
+    def info_fstring():
+        logger.info(f"Availability requested - Staff: {STAFF}, Date: {DATE}, Duration: 60min, Available: 12 slots")
+
+    def info_lazy():
+        logger.info(
+            "Availability requested - Staff: %s, Date: %s, Duration: %smin, Available: %s slots",
+            STAFF, DATE, 60, 12
+        )
+
+    def cors_fstring():
+        logger.warning(f"CORS blocked origin: {ORIGIN}")
+
+    def cors_lazy():
+        logger.warning("CORS blocked origin: %s", ORIGIN)
+
+    # 従来: basicConfig（同期・テキスト）
+    reset_root()
+    logging.basicConfig(stream=devnull, level=logging.INFO,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", force=True)
+    sync_info = per_call_us(info_fstring)
+    sync_cors = per_call_us(cors_fstring)
+
+    # 同期・JSON（キューなし、間引きなし）
+    reset_root()
+    stdout, sys.stdout = sys.stdout, devnull
+    setup_logging({"format": "json", "async": False, "sampling": {"enabled": False}})
+    sys.stdout = stdout
+    json_info = per_call_us(info_lazy)
+
+    # キュー経由・JSON・間引きあり
+    reset_root()
+    stdout, sys.stdout = sys.stdout, devnull
+    listener = setup_logging({"format": "json", "sampling": {"window_seconds": 60, "max_per_window": 10}})
+    sys.stdout = stdout
+    # 間引きの効果を見るため、キューが空の状態で先に計測する
+    async_cors = per_call_us(cors_lazy)
+    time.sleep(0.5)
+    async_info = per_call_us(info_lazy)
+
+    # キューに積んだ分を出し切るまでの時間（出力スレッド側の処理量）
+    started = time.perf_counter()
+    stop_listener(listener)
+    drain = (time.perf_counter() - started) * 1000
+
+    print(f"{'caller-side cost':<44} {'µs/call':>8}")
+    print(f"{'info  sync text (basicConfig, f-string)':<44} {sync_info:>8.2f}")
+    print(f"{'info  sync JSON (lazy %-style)':<44} {json_info:>8.2f}")
+    print(f"{'info  queued JSON (lazy %-style)':<44} {async_info:>8.2f}")
+    print(f"{'CORS warning  sync text':<44} {sync_cors:>8.2f}")
+    print(f"{'CORS warning  queued + sampled':<44} {async_cors:>8.2f}")
+    print()
+    print(f"listener drain after {CALLS} queued info records: {drain:.0f} ms")
+    print("(1 CPU では出力スレッドが呼び出し側と CPU を取り合うため、queued の値には出力処理の一部が含まれる)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+メトリクス記録のオーバーヘッド
+カウンター・ヒストグラム・@timed の1回あたりの時間と、Flask のリクエスト計測フックの
+有無による1リクエストあたりの差、/metrics の出力時間を計測する
+
+Calendar API には接続しない（STARTUP_MODE=lazy で CalendarService を初期化しない）
+
+実行: python benchmarks/bench_metrics.py
+"""
+
+import os
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, APP_DIR)
+
+from metrics import Counter, Histogram, MetricsRegistry, timed  # noqa: E402
+
+CALLS = 200_000
+REQUESTS = 2_000
+ROUNDS = 5
+
+
+def per_call_ns(func, calls: int = CALLS) -> float:
+    """func を calls 回呼び出し、1回あたりの時間（ナノ秒）を返す"""
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def bench_primitives():
+    """記録処理そのものの時間"""
+    counter = Counter("bench_total", "bench", ("result",))
+    histogram = Histogram("bench_seconds", "bench", ("route", "method", "status"))
+
+    def noop():
+        return None
+
+    timed_noop = timed(histogram, "noop", "GET", "200")(noop)
+
+    baseline = per_call_ns(noop)
+    print(f"{'operation':<28} {'ns/call':>10}")
+    print(f"{'function call (baseline)':<28} {baseline:>10.0f}")
+    print(f"{'Counter.inc':<28} {per_call_ns(lambda: counter.inc('hit')):>10.0f}")
+    print(f"{'Histogram.observe':<28} {per_call_ns(lambda: histogram.observe(0.042, '/api/availability', 'GET', '200')):>10.0f}")
+    print(f"{'@timed (no-op body)':<28} {per_call_ns(timed_noop):>10.0f}")
+
+
+def bench_request_hooks():
+    """Flask のリクエスト計測フックあり・なしでの /health の処理時間"""
+    os.chdir(APP_DIR)
+    os.environ["STARTUP_MODE"] = "lazy"
+    import logging
+    logging.disable(logging.INFO)
+    import server
+
+    client = server.app.test_client()
+    before = server.app.before_request_funcs[None]
+    after = server.app.after_request_funcs[None]
+
+    def measure() -> float:
+        for _ in range(500):
+            client.get("/health")
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            client.get("/health")
+        return (time.perf_counter() - started) / REQUESTS * 1e6
+
+    # 計測フックを外した状態と交互に計測し、それぞれの最小値を比較（他のフックはそのまま）
+    server.metrics_enabled = True
+    with_hooks = without_hooks = float("inf")
+    for _ in range(ROUNDS):
+        with_hooks = min(with_hooks, measure())
+        before.remove(server.start_request_timer)
+        after.remove(server.record_request_duration)
+        without_hooks = min(without_hooks, measure())
+        before.insert(0, server.start_request_timer)
+        after.insert(0, server.record_request_duration)
+
+    print()
+    print(f"{'GET /health (test client)':<28} {'µs/req':>10}")
+    print(f"{'without timing hooks':<28} {without_hooks:>10.1f}")
+    print(f"{'with timing hooks':<28} {with_hooks:>10.1f}")
+    print(f"{'overhead':<28} {with_hooks - without_hooks:>10.1f}")
+
+
+def bench_render():
+    """/metrics の出力時間（ルート × メソッド × ステータスの系列数を変えて計測）"""
+    print()
+    print(f"{'series':>8} {'render ms':>10} {'bytes':>10}")
+    for routes in (10, 50, 200):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("bench_seconds", "bench", ("route", "method", "status"))
+        for index in range(routes):
+            for status in ("200", "304", "409"):
+                histogram.observe(0.01, f"/route/{index}", "GET", status)
+        started = time.perf_counter()
+        text = registry.render()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{routes * 3:>8} {elapsed:>10.2f} {len(text):>10}")
+
+
+def main():
+    bench_primitives()
+    bench_request_hooks()
+    bench_render()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+占有ビットマスク索引のマイクロベンチマーク
+datetime のタプルを走査する従来の経路（マージ済みbusy区間の線形スイープ・重複判定ループ）と
+occupancy_index のマスク演算を比較（結果の一致も確認する）
+
+線形スイープ（旧 slot_engine の実装）と1枠の重複判定のマスク版は比較用の参照実装としてこのファイルに置く
+（1枠の重複判定はタプルの比較の方が速いため、is_slot_available はタプルの比較を使う）
+
+実行: python benchmarks/bench_occupancy_index.py
+"""
+
+import os
+import sys
+import timeit
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_slot_engine import RECOVERY_TIMES, TIMEZONE, synthetic_busy  # noqa: E402
+from occupancy_index import OccupancyIndex, interval_mask  # noqa: E402
+from slot_engine import busy_to_offsets, to_minute_offset  # noqa: E402
+
+STAFF_COUNT = 5
+DURATIONS = (5, 10, 15, 30)
+
+
+def event_window(date: datetime) -> Tuple[datetime, datetime, List[Tuple[datetime, datetime]]]:
+    """イベント当日の営業時間帯（10:30〜16:30）と回復枠の時間帯"""
+    tz = pytz.timezone(TIMEZONE)
+    time_min = tz.localize(datetime.combine(date.date(), datetime.strptime("10:30", "%H:%M").time()))
+    time_max = tz.localize(datetime.combine(date.date(), datetime.strptime("16:30", "%H:%M").time()))
+    recovery = []
+    for t, minutes in RECOVERY_TIMES.items():
+        start = tz.localize(datetime.combine(date.date(), datetime.strptime(t, "%H:%M").time()))
+        recovery.append((start, start + timedelta(minutes=minutes)))
+    return time_min, time_max, recovery
+
+
+def sweep_available(
+    merged_busy: List[Tuple[int, int]],
+    window_start: int,
+    window_end: int,
+    step: int,
+    duration: int,
+    blocked_starts: Optional[Set[int]] = None
+) -> List[int]:
+    """
+    候補枠を先頭から順に走査して空き枠を求める（O(枠数 + busy数)、旧 slot_engine の実装）
+
+    開始から duration 分が営業終了までに収まる候補のみを対象とする
+
+    Args:
+        merged_busy: マージ済みbusy区間（昇順）
+        window_start: 営業開始（分オフセット）
+        window_end: 営業終了（分オフセット）
+        step: 候補枠の間隔（分）
+        duration: 各枠が空いている必要がある長さ（分）
+        blocked_starts: 開始できない時刻（回復枠など）
+
+    Returns:
+        空き枠の開始オフセットリスト
+    """
+    blocked_starts = blocked_starts or set()
+    available = []
+    busy_count = len(merged_busy)
+
+    # 営業開始時点で関係しうる最初のbusy区間から走査
+    i = max(bisect_right(merged_busy, (window_start, window_start)) - 1, 0)
+
+    for start in range(window_start, window_end - duration + 1, step):
+        end = start + duration
+
+        # 候補開始より前に終わるbusy区間は以降も重ならない
+        while i < busy_count and merged_busy[i][1] <= start:
+            i += 1
+
+        if start in blocked_starts:
+            continue
+        if i < busy_count and merged_busy[i][0] < end:
+            continue
+
+        available.append(start)
+
+    return available
+
+
+def available_slot_starts(
+    busy_slots: Iterable[Tuple[datetime, datetime]],
+    windows: List[Tuple[datetime, datetime]],
+    step: int,
+    duration: int,
+    blocked_starts: Iterable[datetime] = ()
+) -> List[datetime]:
+    """
+    営業時間帯（複数日可）ごとの空き枠開始時刻を線形スイープで求める（参照実装）
+
+    Args:
+        busy_slots: busy枠リスト [(開始時刻, 終了時刻), ...]
+        windows: 営業時間帯リスト [(開始時刻, 終了時刻), ...]
+        step: 候補枠の間隔（分）
+        duration: 各枠が空いている必要がある長さ（分）
+        blocked_starts: 開始できない時刻（回復枠など）
+
+    Returns:
+        空き枠の開始時刻リスト
+    """
+    if not windows:
+        return []
+
+    windows = sorted(windows)
+    origin = windows[0][0]
+    merged_busy = busy_to_offsets(busy_slots, origin)
+    blocked = {to_minute_offset(dt, origin) for dt in blocked_starts}
+
+    available = []
+    for window_start, window_end in windows:
+        start_offset = to_minute_offset(window_start, origin)
+        end_offset = to_minute_offset(window_end, origin)
+        for offset in sweep_available(
+            merged_busy, start_offset, end_offset, step, duration, blocked
+        ):
+            available.append(window_start + timedelta(minutes=offset - start_offset))
+
+    return available
+
+
+def tuple_overlaps(busy: List[Tuple[datetime, datetime]], start: datetime, end: datetime) -> bool:
+    """タプルの比較による重複判定（CalendarServiceBase._overlaps_busy と同じ）"""
+    return any(start < busy_end and busy_start < end for busy_start, busy_end in busy)
+
+
+def bitmask_overlaps(busy: List[Tuple[datetime, datetime]], start: datetime, end: datetime) -> bool:
+    """指定枠の開始を基準にした占有ビットマスクによる重複判定（比較用）"""
+    width = to_minute_offset(end, start, round_up=True)
+    return interval_mask(busy_to_offsets(busy, start), width) != 0
+
+
+def tuple_staff_at(
+    busy_by_staff: Dict[str, List[Tuple[datetime, datetime]]],
+    start: datetime,
+    duration: int,
+    recovery: List[Tuple[datetime, datetime]]
+) -> List[str]:
+    """スタッフごとにbusy枠のタプルを走査して、指定時刻から duration 分空いているスタッフを求める（回復枠は全員のbusy枠）"""
+    end = start + timedelta(minutes=duration)
+    if tuple_overlaps(recovery, start, end):
+        return []
+    return [staff for staff, busy in busy_by_staff.items() if not tuple_overlaps(busy, start, end)]
+
+
+def index_staff_at(index: OccupancyIndex, start: datetime, duration: int) -> List[str]:
+    """占有ビットマスク索引で、指定時刻から duration 分空いているスタッフを求める"""
+    free = index.free_minutes_at(index.offset(start))
+    return [staff for staff, minutes in free.items() if minutes >= duration]
+
+
+def bench(fn, number: int) -> float:
+    """1回あたりの秒数（3回計測の最小）"""
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number
+
+
+def main():
+    date = datetime(2026, 2, 20)
+    time_min, time_max, recovery = event_window(date)
+    width = (time_max - time_min) // timedelta(minutes=1)
+
+    print("1 staff: available slots for every menu duration (step 15 / 5)")
+    print(f"{'busy':>6} {'step':>5} {'sweep (µs)':>11} {'bitmask (µs)':>13} {'row reused (µs)':>16} {'speedup':>8}")
+    for busy_count in (10, 100, 1000):
+        busy = synthetic_busy(date, busy_count, 1)
+        for step in (15, 5):
+            index = OccupancyIndex(time_min, time_max, step, recovery)
+            for duration in DURATIONS:
+                assert index.available_starts(index.busy_row(busy), duration) == available_slot_starts(
+                    busy + recovery, [(time_min, time_max)], step, duration
+                )
+
+            def sweep():
+                for duration in DURATIONS:
+                    available_slot_starts(busy + recovery, [(time_min, time_max)], step, duration)
+
+            def bitmask():
+                for duration in DURATIONS:
+                    index.available_starts(index.busy_row(busy), duration)
+
+            def row_reused():
+                # スナップショットと同じく、行は1回だけ作ってメニューごとにマスク演算
+                row = index.busy_row(busy)
+                for duration in DURATIONS:
+                    index.available_starts(row, duration)
+
+            number = 20 if busy_count >= 1000 else 500
+            t_sweep, t_bitmask, t_reused = bench(sweep, number), bench(bitmask, number), bench(row_reused, number)
+            print(
+                f"{busy_count:>6} {step:>5} {t_sweep * 1e6:>11.1f} {t_bitmask * 1e6:>13.1f} "
+                f"{t_reused * 1e6:>16.1f} {t_sweep / t_reused:>7.1f}x"
+            )
+
+    print()
+    print(f"{STAFF_COUNT} staff: who can take a menu at each minute of the day (index built once)")
+    print(f"{'busy/staff':>10} {'duration':>9} {'tuples (µs)':>12} {'bitmask (µs)':>13} {'speedup':>8}")
+    for busy_count in (10, 100):
+        busy_by_staff = {
+            f"staff{i}": synthetic_busy(date, busy_count, 1, seed=i) for i in range(STAFF_COUNT)
+        }
+        index = OccupancyIndex(time_min, time_max, 15, recovery)
+        for staff, busy in busy_by_staff.items():
+            index.add(staff, busy)
+        starts = [time_min + timedelta(minutes=m) for m in range(width)]
+
+        for duration in (15, 30):
+            # 営業終了をはみ出す開始時刻は索引側だけが除外するため、比較は収まる範囲で行う
+            for start in starts[:width - duration + 1]:
+                assert tuple_staff_at(busy_by_staff, start, duration, recovery) == (
+                    index_staff_at(index, start, duration)
+                )
+
+            def tuples():
+                for start in starts:
+                    tuple_staff_at(busy_by_staff, start, duration, recovery)
+
+            def bitmask():
+                for start in starts:
+                    index_staff_at(index, start, duration)
+
+            number = 5
+            t_tuples, t_bitmask = bench(tuples, number) / width, bench(bitmask, number) / width
+            print(
+                f"{busy_count:>10} {duration:>9} {t_tuples * 1e6:>12.2f} {t_bitmask * 1e6:>13.2f} "
+                f"{t_tuples / t_bitmask:>7.1f}x"
+            )
+
+    print()
+    print("is_slot_available: overlap check of one 30-minute slot")
+    print(f"{'busy':>6} {'tuples (µs)':>12} {'bitmask (µs)':>13}")
+    for busy_count in (2, 10, 100):
+        busy = synthetic_busy(date, busy_count, 1)
+        for minute in range(0, width - 30):
+            start = time_min + timedelta(minutes=minute)
+            end = start + timedelta(minutes=30)
+            assert tuple_overlaps(busy, start, end) == bitmask_overlaps(busy, start, end)
+        start = time_min + timedelta(minutes=165)
+        end = start + timedelta(minutes=30)
+        t_tuples = bench(lambda: tuple_overlaps(busy, start, end), 2000)
+        t_bitmask = bench(lambda: bitmask_overlaps(busy, start, end), 2000)
+        print(f"{busy_count:>6} {t_tuples * 1e6:>12.2f} {t_bitmask * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
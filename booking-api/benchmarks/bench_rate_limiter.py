@@ -0,0 +1,82 @@
+"""
+レート制限のIP数別オーバーヘッド
+従来のタイムスタンプリスト方式とスライディングウィンドウ・カウンター方式で、
+1リクエストあたりの判定時間と保持メモリを比較する
+
+実行: python benchmarks/bench_rate_limiter.py
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from threading import Lock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rate_limiter import InMemoryBackend, RateLimiter  # noqa: E402
+
+CALLS = 200_000
+
+
+class LegacyRateLimiter:
+    """従来実装（IPごとのタイムスタンプリスト + グローバルロック）"""
+
+    def __init__(self, max_per_minute: int = 10, max_per_hour: int = 60):
+        self.max_per_minute = max_per_minute
+        self.max_per_hour = max_per_hour
+        self.minute_requests = defaultdict(list)
+        self.hour_requests = defaultdict(list)
+        self.lock = Lock()
+
+    def is_allowed(self, ip_address: str):
+        with self.lock:
+            current_time = time.time()
+            self.minute_requests[ip_address] = [t for t in self.minute_requests[ip_address] if t > current_time - 60]
+            self.hour_requests[ip_address] = [t for t in self.hour_requests[ip_address] if t > current_time - 3600]
+            if len(self.minute_requests[ip_address]) >= self.max_per_minute:
+                return False, "minute"
+            if len(self.hour_requests[ip_address]) >= self.max_per_hour:
+                return False, "hour"
+            self.minute_requests[ip_address].append(current_time)
+            self.hour_requests[ip_address].append(current_time)
+            return True, ""
+
+
+def measure(limiter_factory, ips):
+    """ランダムなIPで CALLS 回判定し、(1回あたりの時間[µs], 保持メモリ[KiB]) を返す"""
+    rng = random.Random(0)
+    sequence = [rng.choice(ips) for _ in range(CALLS)]
+
+    tracemalloc.start()
+    limiter = limiter_factory()
+    started = time.perf_counter()
+    for ip in sequence:
+        limiter.is_allowed(ip)
+    elapsed = time.perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if hasattr(limiter, "backend"):
+        limiter.backend.stop()
+    return elapsed / CALLS * 1e6, memory / 1024
+
+
+def main():
+    # 実運用に近い上限（1時間に数百リクエストまで履歴が溜まる）
+    limits = dict(max_per_minute=100, max_per_hour=1000)
+    print(f"{'IPs':>8} {'legacy µs/req':>14} {'legacy KiB':>11} {'counter µs/req':>15} {'counter KiB':>12}")
+
+    for ip_count in (1, 10, 1_000, 10_000, 100_000):
+        ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(ip_count)]
+        legacy_us, legacy_kib = measure(lambda: LegacyRateLimiter(**limits), ips)
+        counter_us, counter_kib = measure(
+            lambda: RateLimiter(**limits, backend=InMemoryBackend(cleanup_interval=0)), ips
+        )
+        print(f"{ip_count:>8} {legacy_us:>14.2f} {legacy_kib:>11.0f} {counter_us:>15.2f} {counter_kib:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+空き枠計算のマイクロベンチマーク
+従来の O(枠数 × busy数) ループと、現在の空き枠計算（occupancy_index の占有ビットマスク）を比較
+
+実行: python benchmarks/bench_slot_engine.py
+"""
+
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from occupancy_index import OccupancyIndex  # noqa: E402
+
+TIMEZONE = "Asia/Tokyo"
+RECOVERY_TIMES = {"12:00": 15, "14:00": 15}  # {開始時刻: 長さ（分）}
+
+
+def legacy_generate_available_slots(
+    busy_slots: List[Tuple[datetime, datetime]],
+    date: datetime,
+    start_time: str,
+    end_time: str,
+    slot_duration: int,
+    recovery_times: Dict[str, int],
+    timezone: str = TIMEZONE
+) -> List[datetime]:
+    """従来実装（CalendarService.generate_available_slots の旧ロジック。回復枠は時間帯として判定する）"""
+    tz = pytz.timezone(timezone)
+    time_min = tz.localize(datetime.combine(date.date(), datetime.strptime(start_time, "%H:%M").time()))
+    time_max = tz.localize(datetime.combine(date.date(), datetime.strptime(end_time, "%H:%M").time()))
+
+    all_slots = []
+    current = time_min
+    while current < time_max:
+        all_slots.append(current)
+        current += timedelta(minutes=slot_duration)
+
+    recovery_slots = []
+    for recovery_time, minutes in recovery_times.items():
+        recovery_start = tz.localize(datetime.combine(
+            date.date(), datetime.strptime(recovery_time, "%H:%M").time()
+        ))
+        recovery_slots.append((recovery_start, recovery_start + timedelta(minutes=minutes)))
+
+    available_slots = []
+    for slot in all_slots:
+        slot_end = slot + timedelta(minutes=slot_duration)
+        if any(slot < recovery_end and recovery_start < slot_end for recovery_start, recovery_end in recovery_slots):
+            continue
+        if all(not (slot < busy_end and busy_start < slot_end) for busy_start, busy_end in busy_slots):
+            available_slots.append(slot)
+    return available_slots
+
+
+def engine_generate_available_slots(
+    busy_slots: List[Tuple[datetime, datetime]],
+    date: datetime,
+    start_time: str,
+    end_time: str,
+    slot_duration: int,
+    recovery_times: Dict[str, int],
+    timezone: str = TIMEZONE
+) -> List[datetime]:
+    """占有ビットマスク索引による実装（CalendarServiceBase.generate_available_slots と同じ経路）"""
+    tz = pytz.timezone(timezone)
+    time_min = tz.localize(datetime.combine(date.date(), datetime.strptime(start_time, "%H:%M").time()))
+    time_max = tz.localize(datetime.combine(date.date(), datetime.strptime(end_time, "%H:%M").time()))
+    recovery_slots = []
+    for t, minutes in recovery_times.items():
+        recovery_start = tz.localize(datetime.combine(date.date(), datetime.strptime(t, "%H:%M").time()))
+        recovery_slots.append((recovery_start, recovery_start + timedelta(minutes=minutes)))
+    index = OccupancyIndex(time_min, time_max, slot_duration, recovery_slots)
+    return index.available_starts(index.busy_row(busy_slots), slot_duration)
+
+
+def synthetic_busy(date: datetime, count: int, days: int, seed: int = 0) -> List[Tuple[datetime, datetime]]:
+    """
+    対象日を含む days 日間にランダムな短いbusy枠を count 個生成
+
+    freebusy のレスポンスと同じく UTC の datetime で返す（重複あり）
+    """
+    rng = random.Random(seed)
+    first_day = date - timedelta(days=days // 2)
+    busy = []
+    for _ in range(count):
+        day = first_day + timedelta(days=rng.randrange(days))
+        day_start = pytz.timezone(TIMEZONE).localize(datetime.combine(day.date(), datetime.min.time()))
+        start = day_start + timedelta(minutes=rng.randrange(7 * 60, 18 * 60), seconds=rng.choice([0, 0, 30]))
+        end = start + timedelta(minutes=rng.randrange(1, 20))
+        busy.append((
+            datetime.fromisoformat(start.astimezone(pytz.utc).isoformat()),
+            datetime.fromisoformat(end.astimezone(pytz.utc).isoformat())
+        ))
+    return busy
+
+
+def main():
+    date = datetime(2026, 2, 20)
+    print(f"{'busy':>6} {'days':>5} {'step':>5} {'legacy (ms)':>12} {'engine (ms)':>12} {'speedup':>8}")
+
+    for busy_count, days in ((10, 1), (100, 1), (1000, 1), (1000, 30), (5000, 30), (5000, 90)):
+        busy = synthetic_busy(date, busy_count, days)
+        for step in (15, 5, 1):
+            args = (busy, date, "10:30", "16:30", step, RECOVERY_TIMES)
+            assert legacy_generate_available_slots(*args) == engine_generate_available_slots(*args)
+
+            number = 3 if busy_count >= 1000 else 20
+            legacy = min(timeit.repeat(lambda: legacy_generate_available_slots(*args), number=number, repeat=3)) / number
+            engine = min(timeit.repeat(lambda: engine_generate_available_slots(*args), number=number, repeat=3)) / number
+            print(f"{busy_count:>6} {days:>5} {step:>5} {legacy * 1000:>12.3f} {engine * 1000:>12.3f} {legacy / engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+HTTP トランスポートのスレッド数別スループット
+1つの HTTP 接続を全スレッドで共有する場合（httplib2 は同時利用できないため直列化）と、
+スレッドごとに keep-alive 接続を持つ場合の空き枠取得スループットを比較する
+
+Google には接続せず、応答遅延と TLS 接続確立コストを模擬した HTTP クライアントを使う
+
+実行: python benchmarks/bench_transport.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import httplib2
+from google.oauth2.credentials import Credentials
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from calendar_service import CalendarService  # noqa: E402
+
+RESPONSE_LATENCY = 0.02   # 1リクエストの応答待ち（秒）
+CONNECT_LATENCY = 0.05    # 新規接続（TLS ハンドシェイク）のコスト（秒）
+REQUESTS_PER_THREAD = 20
+CALENDAR_ID = "bench@group.calendar.google.com"
+
+
+class SimulatedHttp:
+    """httplib2.Http 互換の模擬クライアント（1接続 = 同時に1リクエスト）"""
+
+    def __init__(self):
+        self._connection_lock = threading.Lock()
+        self._connected = False
+        self.timeout = None
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        with self._connection_lock:
+            if not self._connected:
+                time.sleep(CONNECT_LATENCY)
+                self._connected = True
+            time.sleep(RESPONSE_LATENCY)
+        content = json.dumps({
+            "calendars": {CALENDAR_ID: {"busy": [
+                {"start": "2026-02-20T02:00:00Z", "end": "2026-02-20T02:30:00Z"}
+            ]}}
+        }).encode("utf-8")
+        return httplib2.Response({"status": "200", "content-type": "application/json"}), content
+
+
+def run(service: CalendarService, threads: int) -> float:
+    """threads 並列で空き枠取得を繰り返し、1秒あたりの処理数を返す"""
+    date = datetime(2026, 2, 20)
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(REQUESTS_PER_THREAD):
+            busy = service.get_busy_slots(CALENDAR_ID, date, "10:30", "16:30")
+            service.generate_available_slots(busy, date, "10:30", "16:30", 15, {"12:00": 15, "14:00": 15})
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    return threads * REQUESTS_PER_THREAD / (time.perf_counter() - started)
+
+
+def main():
+    credentials = Credentials(token="benchmark")
+    print(f"{'threads':>7} {'shared conn (req/s)':>20} {'per-thread conn (req/s)':>24}")
+
+    for threads in (1, 2, 4, 8, 16):
+        shared_http = SimulatedHttp()
+        # 同時の freebusy.query を1回にまとめると通信回数が減り、接続の比較にならないため無効化
+        shared = CalendarService(credentials, http_factory=lambda: shared_http, coalesce_freebusy=False)
+        per_thread = CalendarService(credentials, http_factory=SimulatedHttp, coalesce_freebusy=False)
+
+        print(f"{threads:>7} {run(shared, threads):>20.1f} {run(per_thread, threads):>24.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+同期版（gunicorn --threads 8）と非同期版（hypercorn + Quart）の負荷試験
+スタブの Calendar API / OAuth トークンエンドポイントに対して両サーバーを起動し、
+同時接続数を変えて空き枠取得の 1秒あたりの処理数と p50 / p99 レイテンシを比較する
+
+Google には接続しない（client_secret の token_uri と Calendar API のベースURLをスタブに向ける）
+busy枠キャッシュとレート制限は無効にし、毎回 freebusy.query が実行されるようにする
+スタブ・負荷生成側も同じマシンで動くため、CPU コア数が少ない環境では上限が低く出る
+（1コア環境ではスタブ単体でも同時接続 64 で頭打ちになる。その場合は 64 の行は参考値）
+
+実行: python benchmarks/load_test_async.py
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import yaml
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+FREEBUSY_LATENCY = 0.25  # スタブの freebusy.query 応答時間（秒）
+INSERT_LATENCY = 0.15   # スタブの events.insert 応答時間（秒）
+CONCURRENCY_LEVELS = [8, 32, 64]
+DURATION_SECONDS = 10
+STARTUP_TIMEOUT = 60
+
+
+async def stub_app(scope, receive, send):
+    """Calendar API と OAuth トークンエンドポイントのスタブ（ASGI）"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    path = scope["path"]
+    if path == "/token":
+        response = {"access_token": "stub-token", "expires_in": 3600, "token_type": "Bearer"}
+    elif path.endswith("/freeBusy"):
+        await asyncio.sleep(FREEBUSY_LATENCY)
+        request = json.loads(body)
+        response = {"calendars": {
+            item["id"]: {"busy": [{"start": "2026-02-20T03:00:00Z", "end": "2026-02-20T03:30:00Z"}]}
+            for item in request["items"]
+        }}
+    elif path.endswith("/events") and scope["method"] == "POST":
+        await asyncio.sleep(INSERT_LATENCY)
+        response = json.loads(body)
+    else:
+        response = {"id": path.rsplit("/", 1)[-1]}
+
+    content = json.dumps(response).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(content)).encode())]
+    })
+    await send({"type": "http.response.body", "body": content})
+
+
+def serve_stub(port: int):
+    """子プロセス: スタブサーバーを起動"""
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.backlog = 1024
+    config.accesslog = None
+    asyncio.run(serve(stub_app, config))
+
+
+def free_port() -> int:
+    """空いているポート番号"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_config(stub_url: str, directory: str) -> str:
+    """スタブ向けの設定ファイルを作成し、パスを返す"""
+    with open(os.path.join(APP_DIR, "config.yaml"), "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config["cache"]["enabled"] = False
+    config["rate_limit"]["enabled"] = False
+    config["booking_store"]["path"] = os.path.join(directory, "bookings.db")
+    config["startup"]["mode"] = "eager"
+    config["development"]["use_local_credentials"] = False
+    config["google_calendar"]["api_endpoint"] = f"{stub_url}/calendar/v3/"
+    path = os.path.join(directory, "config.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return path
+
+
+def wait_until_ready(base_url: str):
+    """/ready が 200 を返すまで待つ"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/ready").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(base_url)
+
+
+async def run_load(base_url: str, staff_ids: list, concurrency: int) -> dict:
+    """concurrency 本の同時接続で DURATION_SECONDS 秒間 /api/availability を呼び続ける"""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + DURATION_SECONDS
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker(index: int):
+            nonlocal errors
+            count = 0
+            while time.perf_counter() < deadline:
+                staff_id = staff_ids[(index + count) % len(staff_ids)]
+                started = time.perf_counter()
+                response = await client.get("/api/availability", params={"staff": staff_id})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+                count += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        "errors": errors,
+    }
+
+
+def start_server(name: str, port: int, env: dict) -> subprocess.Popen:
+    """同期版または非同期版のサーバーを起動"""
+    bind = f"127.0.0.1:{port}"
+    if name == "sync":
+        command = [sys.executable, "-m", "gunicorn", "--bind", bind,
+                   "--workers", "1", "--threads", "8", "--timeout", "0", "server:app"]
+    else:
+        command = [sys.executable, "-m", "hypercorn", "--bind", bind,
+                   "--workers", "1", "--backlog", "1024", "async_server:app"]
+    return subprocess.Popen(
+        command, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def main():
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--stub", str(stub_port)])
+
+    with tempfile.TemporaryDirectory() as directory:
+        config_path = write_config(stub_url, directory)
+        with open(config_path, "r", encoding="utf-8") as f:
+            staff_ids = [staff["id"] for staff in yaml.safe_load(f)["staff"]]
+        env = dict(
+            os.environ,
+            CONFIG_PATH=config_path,
+            REFRESH_TOKEN="stub-refresh-token",
+            CLIENT_SECRET=json.dumps({"installed": {
+                "token_uri": f"{stub_url}/token",
+                "client_id": "stub-client-id",
+                "client_secret": "stub-client-secret",
+            }}),
+        )
+
+        print(
+            f"Stub latency: freebusy {FREEBUSY_LATENCY * 1000:.0f} ms, "
+            f"{DURATION_SECONDS} s per run"
+        )
+        print(f"{'server':>8} {'concurrency':>12} {'req/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'errors':>8}")
+        try:
+            for name in ["sync", "async"]:
+                port = free_port()
+                server = start_server(name, port, env)
+                try:
+                    base_url = f"http://127.0.0.1:{port}"
+                    wait_until_ready(base_url)
+                    for concurrency in CONCURRENCY_LEVELS:
+                        result = asyncio.run(run_load(base_url, staff_ids, concurrency))
+                        print(
+                            f"{name:>8} {concurrency:12d} {result['rps']:10.1f} "
+                            f"{result['p50']:10.1f} {result['p99']:10.1f} {result['errors']:8d}"
+                        )
+                finally:
+                    server.terminate()
+                    server.wait()
+        finally:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--stub":
+        serve_stub(int(sys.argv[2]))
+    else:
+        main()
@@ -0,0 +1,381 @@
+"""
+カレンダーの差分同期（calendar_sync）の動作確認
+ローカルで起動した偽の Calendar API サーバー（127.0.0.1、syncToken・410 Gone・ページ送り・events.watch に対応）に対して、
+同期版・非同期版の CalendarService でミラーを同期し、以下を確認する
+
+- 初回の全件取得（複数ページ）後、ミラーのbusy枠が freebusy.query の結果と一致し、以降の空き枠取得で freebusy.query を呼ばない
+- 予定の追加・移動・取り消し・「予定なし」への変更が、差分取得1回（変更分のみ）で反映される
+- 同期トークンの期限切れ（410 Gone）で全件取得からやり直す
+- プッシュ通知（トークン照合）を受けて、ポーリングを待たずに同期される
+- 予約確定（confirm_booking）が次の同期を待たずにミラーへ反映される
+
+Google には接続しない
+
+実行: python benchmarks/stress_calendar_sync.py
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+from google.oauth2.credentials import Credentials
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from async_calendar_service import AsyncCalendarService  # noqa: E402
+from calendar_service import CalendarService  # noqa: E402
+from calendar_sync import CalendarMirror, CalendarSyncWorker, notification_calendar  # noqa: E402
+from credential_manager import CredentialManager  # noqa: E402
+
+CALENDAR_A = "calendar-a@group.calendar.google.com"
+CALENDAR_B = "calendar-b@group.calendar.google.com"
+DATE = datetime(2026, 2, 20)
+START, END, TZ = "10:30", "16:30", "Asia/Tokyo"
+PAGE_SIZE = 3  # 偽サーバーの1ページの件数（ページ送りを必ず発生させる）
+WEBHOOK_ADDRESS = "https://booking-api.example.invalid/webhooks/calendar"
+WEBHOOK_TOKEN = "stress-webhook-token"
+
+
+def timed_event(event_id: str, start: str, end: str, **fields) -> dict:
+    """時刻指定の予定（start / end は当日の HH:MM、JST）"""
+    return dict(
+        id=event_id,
+        status="confirmed",
+        start={"dateTime": f"2026-02-20T{start}:00+09:00"},
+        end={"dateTime": f"2026-02-20T{end}:00+09:00"},
+        **fields
+    )
+
+
+class FakeCalendar:
+    """
+    Calendar API の偽物（予定の保存と変更履歴）
+
+    予定を変更するたびに通し番号を進め、syncToken は「その時点の通し番号」とする。
+    expire_tokens() 以前の syncToken は 410 Gone を返す
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.valid_from = 0
+        # {カレンダーID: {イベントID: (変更時の通し番号, 予定)}}
+        self.events = {CALENDAR_A: {}, CALENDAR_B: {}}
+        self.calls = {"events.list": 0, "freebusy.query": 0, "events.watch": 0}
+        # {チャンネルID: (カレンダーID, トークン, resourceUri)}
+        self.channels = {}
+
+    def put(self, calendar_id: str, event: dict):
+        with self.lock:
+            self.sequence += 1
+            self.events[calendar_id][event["id"]] = (self.sequence, event)
+
+    def cancel(self, calendar_id: str, event_id: str):
+        self.put(calendar_id, {"id": event_id, "status": "cancelled"})
+
+    def expire_tokens(self):
+        with self.lock:
+            self.valid_from = self.sequence
+
+    def list_events(self, calendar_id: str, query: dict):
+        """events.list（(ステータス, 本文)）"""
+        with self.lock:
+            self.calls["events.list"] += 1
+            sync_token = query.get("syncToken")
+            offset, snapshot = 0, self.sequence
+            if query.get("pageToken"):
+                offset, snapshot = map(int, query["pageToken"].split(":"))
+            if sync_token and int(sync_token) < self.valid_from:
+                return 410, {"error": {"code": 410, "message": "Sync token is no longer valid, a full sync is required."}}
+
+            since = int(sync_token) if sync_token else 0
+            items = [
+                event for sequence, event in sorted(self.events[calendar_id].values(), key=lambda item: item[0])
+                if since < sequence <= snapshot
+                # 全件取得では取り消し済みの予定を返さない（差分では返す）
+                and (sync_token or event.get("status") != "cancelled")
+            ]
+            page = {"kind": "calendar#events", "timeZone": TZ, "items": items[offset:offset + PAGE_SIZE]}
+            if offset + PAGE_SIZE < len(items):
+                page["nextPageToken"] = f"{offset + PAGE_SIZE}:{snapshot}"
+            else:
+                page["nextSyncToken"] = str(snapshot)
+            return 200, page
+
+    def freebusy(self, body: dict):
+        """freebusy.query（取り消し・予定なし・辞退済みを除く）"""
+        time_min = datetime.fromisoformat(body["timeMin"])
+        time_max = datetime.fromisoformat(body["timeMax"])
+        with self.lock:
+            self.calls["freebusy.query"] += 1
+            calendars = {}
+            for item in body["items"]:
+                busy = []
+                for _, event in self.events[item["id"]].values():
+                    if event.get("status") == "cancelled" or event.get("transparency") == "transparent":
+                        continue
+                    if any(a.get("self") and a.get("responseStatus") == "declined" for a in event.get("attendees", [])):
+                        continue
+                    start = datetime.fromisoformat(event["start"]["dateTime"])
+                    end = datetime.fromisoformat(event["end"]["dateTime"])
+                    if start < time_max and time_min < end:
+                        busy.append({"start": start.isoformat(), "end": end.isoformat()})
+                calendars[item["id"]] = {"busy": sorted(busy, key=lambda period: (period["start"], period["end"]))}
+            return 200, {"calendars": calendars}
+
+    def watch(self, calendar_id: str, body: dict, base_url: str):
+        """events.watch"""
+        with self.lock:
+            self.calls["events.watch"] += 1
+            resource_uri = f"{base_url}calendars/{quote(calendar_id, safe='')}/events?alt=json"
+            self.channels[body["id"]] = (calendar_id, body["token"], resource_uri)
+            expiration = int((time.time() + int(body["params"]["ttl"])) * 1000)
+            return 200, {
+                "kind": "api#channel", "id": body["id"], "resourceId": f"res-{body['id'][:8]}",
+                "resourceUri": resource_uri, "expiration": str(expiration)
+            }
+
+    def notification_headers(self, calendar_id: str) -> dict:
+        """予定の変更時に Google が送る通知のヘッダー（最後に作成されたチャンネル）"""
+        with self.lock:
+            channel_id, (_, token, resource_uri) = [
+                (channel_id, channel) for channel_id, channel in self.channels.items() if channel[0] == calendar_id
+            ][-1]
+        return {
+            "X-Goog-Channel-ID": channel_id,
+            "X-Goog-Channel-Token": token,
+            "X-Goog-Resource-State": "exists",
+            "X-Goog-Resource-URI": resource_uri,
+            "X-Goog-Message-Number": "2",
+        }
+
+
+def start_fake_server(fake: FakeCalendar) -> str:
+    """偽サーバーを起動し、Calendar API のベースURLを返す"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict):
+            content = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            calendar_id = unquote(url.path.split("/calendars/", 1)[1].split("/", 1)[0])
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            self._reply(*fake.list_events(calendar_id, query))
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            path = urlparse(self.path).path
+            if path.endswith("/freeBusy"):
+                self._reply(*fake.freebusy(body))
+            elif path.endswith("/events/watch"):
+                calendar_id = unquote(path.split("/calendars/", 1)[1].split("/", 1)[0])
+                self._reply(*fake.watch(calendar_id, body, base_url))
+            else:
+                self._reply(404, {"error": {"code": 404, "message": "not found"}})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/calendar/v3/"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return base_url
+
+
+def seed(fake: FakeCalendar):
+    """初期の予定（カレンダーA は8件で3ページ、busy として扱わない予定を含む）"""
+    fake.put(CALENDAR_A, timed_event("a1", "10:30", "11:00"))
+    fake.put(CALENDAR_A, timed_event("a2", "11:30", "12:00"))
+    fake.put(CALENDAR_A, timed_event("a3", "13:00", "13:45"))
+    fake.put(CALENDAR_A, timed_event("a4", "14:30", "15:00", transparency="transparent"))
+    fake.put(CALENDAR_A, timed_event(
+        "a5", "15:00", "15:30", attendees=[{"email": "staff@example.com", "self": True, "responseStatus": "declined"}]
+    ))
+    fake.put(CALENDAR_A, timed_event("a6", "16:00", "16:30"))
+    fake.put(CALENDAR_A, timed_event("a7", "09:00", "10:00"))  # 営業時間外
+    fake.put(CALENDAR_A, timed_event("a8", "12:30", "12:45"))
+    fake.cancel(CALENDAR_A, "a8")
+    fake.put(CALENDAR_B, timed_event("b1", "10:30", "12:30"))
+
+
+def mutate(fake: FakeCalendar):
+    """スタッフがカレンダーを直接編集（追加・移動・取り消し・予定なしへの変更）"""
+    fake.put(CALENDAR_A, timed_event("a9", "15:30", "16:00"))
+    fake.put(CALENDAR_A, timed_event("a2", "11:45", "12:15"))
+    fake.cancel(CALENDAR_A, "a1")
+    fake.put(CALENDAR_A, timed_event("a3", "13:00", "13:45", transparency="transparent"))
+
+
+def credentials() -> Credentials:
+    """有効期限内のダミー認証情報（更新は発生しない）"""
+    return Credentials(token="stress-test", expiry=datetime.utcnow() + timedelta(hours=1))
+
+
+def expected_busy(service, calendar_ids):
+    """freebusy.query（偽サーバー）の結果（ミラーを使わずに取得）"""
+    return service.get_busy_slots_batch(calendar_ids, DATE, START, END, TZ, use_cache=False)
+
+
+def check(name: str, condition: bool, detail=""):
+    assert condition, f"{name}: {detail}"
+    print(f"  ok  {name}")
+
+
+def run_sync():
+    """同期版（CalendarService + CalendarSyncWorker）"""
+    fake = FakeCalendar()
+    seed(fake)
+    base_url = start_fake_server(fake)
+    mirror = CalendarMirror([CALENDAR_A, CALENDAR_B], TZ)
+    service = CalendarService(credentials(), api_endpoint=base_url, calendar_mirror=mirror)
+    ids = [CALENDAR_A, CALENDAR_B]
+    print("sync (CalendarService)")
+
+    # 同期前は freebusy.query
+    service.get_busy_slots_batch(ids, DATE, START, END, TZ)
+    check("freebusy before first sync", fake.calls["freebusy.query"] == 1)
+
+    # 初回の全件取得
+    for calendar_id in ids:
+        service.sync_calendar(calendar_id)
+    check("full sync pages", fake.calls["events.list"] == 4, fake.calls)
+    truth = expected_busy(service, ids)
+    freebusy_calls = fake.calls["freebusy.query"]
+    served = service.get_busy_slots_batch(ids, DATE, START, END, TZ)
+    check("mirror matches freebusy", served == truth, (served, truth))
+    check("no freebusy after sync", fake.calls["freebusy.query"] == freebusy_calls)
+    check("is_busy_cached via mirror", service.is_busy_cached(ids, DATE, START, END, TZ))
+
+    # 差分取得
+    etag = service.versions.etag([CALENDAR_A])
+    mutate(fake)
+    list_calls = fake.calls["events.list"]
+    changed = service.sync_calendar(CALENDAR_A)
+    # 変更4件のみ（3件/ページで2ページ）
+    check("incremental sync fetches only changes", fake.calls["events.list"] == list_calls + 2, fake.calls)
+    check("incremental changes counted", changed == 4, changed)
+    served = service.get_busy_slots_batch(ids, DATE, START, END, TZ)
+    check("mirror matches freebusy after changes", served == expected_busy(service, ids))
+    check("etag advanced", service.versions.etag([CALENDAR_A]) != etag)
+    check("unchanged calendar keeps etag", service.sync_calendar(CALENDAR_B) == 0)
+
+    # 410 Gone → 全件取得
+    fake.expire_tokens()
+    fake.put(CALENDAR_A, timed_event("a10", "14:00", "14:15"))
+    service.sync_calendar(CALENDAR_A)
+    served = service.get_busy_slots_batch(ids, DATE, START, END, TZ)
+    check("resync after 410 matches freebusy", served == expected_busy(service, ids))
+
+    # 予約確定は次の同期を待たずに反映
+    start = datetime.fromisoformat("2026-02-20T10:30:00+09:00")
+    service.confirm_booking("booking1", CALENDAR_B, start + timedelta(hours=3), start + timedelta(hours=3, minutes=15), "evt1")
+    served = service.get_busy_slots(CALENDAR_B, DATE, START, END, TZ)
+    check("write-through to mirror", (start + timedelta(hours=3), start + timedelta(hours=3, minutes=15)) in served)
+
+    # プッシュ通知で即時に同期（ポーリングは1時間間隔）
+    changes = []
+    worker = CalendarSyncWorker(
+        mirror,
+        sync_calendar=service.sync_calendar,
+        poll_interval_seconds=3600,
+        watch_calendar=lambda calendar_id: service.watch_calendar(calendar_id, WEBHOOK_ADDRESS, WEBHOOK_TOKEN, 3600),
+        on_change=changes.append
+    )
+    worker.start()
+    deadline = time.monotonic() + 5
+    while len(fake.channels) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    check("watch channels created", len(fake.channels) == 2, fake.channels)
+
+    bad = dict(fake.notification_headers(CALENDAR_A), **{"X-Goog-Channel-Token": "forged"})
+    check("forged token rejected", notification_calendar(bad, WEBHOOK_TOKEN, mirror) == (None, 403))
+
+    latencies = []
+    for i in range(20):
+        # 毎回別の枠に予定を入れ、前回の予定を取り消す
+        slot = datetime(2026, 2, 20, 10, 30) + timedelta(minutes=15 * i)
+        fake.put(CALENDAR_A, timed_event(
+            f"n{i}", slot.strftime("%H:%M"), (slot + timedelta(minutes=15)).strftime("%H:%M")
+        ))
+        if i:
+            fake.cancel(CALENDAR_A, f"n{i - 1}")
+        truth = expected_busy(service, [CALENDAR_A])[CALENDAR_A]
+        started = time.perf_counter()
+        calendar_id, status = notification_calendar(fake.notification_headers(CALENDAR_A), WEBHOOK_TOKEN, mirror)
+        worker.notify(calendar_id)
+        while service.get_busy_slots(CALENDAR_A, DATE, START, END, TZ) != truth:
+            assert time.perf_counter() - started < 5, "notification did not trigger a sync"
+            time.sleep(0.001)
+        latencies.append(time.perf_counter() - started)
+    worker.stop()
+    check("notification triggers sync", bool(changes) and set(changes) == {CALENDAR_A}, changes)
+    latencies.sort()
+    print(f"      notification → mirror updated: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"max {latencies[-1] * 1000:.1f} ms")
+
+    # 空き枠取得1回あたり（ミラー vs freebusy.query）
+    for label, use_cache in (("mirror", True), ("freebusy.query (local fake)", False)):
+        started = time.perf_counter()
+        for _ in range(200):
+            service.get_busy_slots_batch(ids, DATE, START, END, TZ, use_cache=use_cache)
+        print(f"      busy slots via {label:<28} {(time.perf_counter() - started) / 200 * 1e6:8.0f} µs/call")
+
+
+def run_async():
+    """非同期版（AsyncCalendarService）"""
+    fake = FakeCalendar()
+    seed(fake)
+    base_url = start_fake_server(fake)
+    ids = [CALENDAR_A, CALENDAR_B]
+    print("async (AsyncCalendarService)")
+
+    async def scenario():
+        mirror = CalendarMirror(ids, TZ)
+        service = AsyncCalendarService(
+            CredentialManager(credentials()), api_endpoint=base_url, calendar_mirror=mirror
+        )
+        for calendar_id in ids:
+            await service.sync_calendar(calendar_id)
+        check("full sync pages", fake.calls["events.list"] == 4, fake.calls)
+        truth = await service.get_busy_slots_batch(ids, DATE, START, END, TZ, use_cache=False)
+        served = await service.get_busy_slots_batch(ids, DATE, START, END, TZ)
+        check("mirror matches freebusy", served == truth)
+        check("no freebusy after sync", fake.calls["freebusy.query"] == 1)
+
+        mutate(fake)
+        check("incremental changes counted", await service.sync_calendar(CALENDAR_A) == 4)
+        fake.expire_tokens()
+        fake.cancel(CALENDAR_B, "b1")
+        await service.sync_calendar(CALENDAR_B)
+        truth = await service.get_busy_slots_batch(ids, DATE, START, END, TZ, use_cache=False)
+        check("resync after 410 matches freebusy", await service.get_busy_slots_batch(ids, DATE, START, END, TZ) == truth)
+
+        channel = await service.watch_calendar(CALENDAR_B, WEBHOOK_ADDRESS, WEBHOOK_TOKEN, 600)
+        check("watch channel registered", mirror.channel_calendar(channel["id"]) == CALENDAR_B)
+        await service.aclose()
+
+    asyncio.run(scenario())
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    run_sync()
+    run_async()
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+レート制限（RedisBackend）の共有カウンターのテスト
+fakeredis（Lua スクリプト対応）の1つのサーバーを2つのクライアントから使い、
+複数インスタンスが同じ Redis のカウンターを共有する構成を再現する
+
+- 別インスタンスの RateLimiter 2つで合計が上限に達したら、どちらも拒否する（並行時も上限ちょうど）
+- cost > 1 のリクエストは残りが足りなければ拒否し、カウンターは加算しない
+- ウィンドウが進むと直前ウィンドウの件数を経過割合で按分し、2ウィンドウ後には元に戻る（キーには有効期限）
+- 拒否したキーは local_deny_seconds の間 Redis に問い合わせずに拒否する（他インスタンスは Redis で判定）
+- Redis に接続できない場合は許可する
+
+Redis サーバーには接続しない（pip install "fakeredis[lua]" が必要）
+
+実行: python benchmarks/stress_rate_limiter_redis.py [スレッド数]
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import fakeredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import rate_limiter  # noqa: E402
+from rate_limiter import HIT_SCRIPT, HOUR, MINUTE, RateLimiter, RedisBackend  # noqa: E402
+
+T0 = 1_800_000_000.0  # 分・時のウィンドウの境界に揃えた時刻
+IP = "203.0.113.7"
+
+
+class CountingRedis(fakeredis.FakeStrictRedis):
+    """Lua スクリプトの実行（Redis への往復）を数える fakeredis クライアント"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.round_trips = 0
+        self._count_lock = threading.Lock()
+
+    def evalsha(self, *args, **kwargs):
+        with self._count_lock:
+            self.round_trips += 1
+        return super().evalsha(*args, **kwargs)
+
+
+class UnavailableRedis(fakeredis.FakeStrictRedis):
+    """スクリプトの実行が常に接続エラーになるクライアント"""
+
+    def evalsha(self, *args, **kwargs):
+        raise RedisConnectionError("connection refused")
+
+
+class FakeClock:
+    """RateLimiter.is_allowed が参照する time.time() の代わり"""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@contextmanager
+def frozen_time(clock: FakeClock):
+    """rate_limiter モジュールの time を FakeClock に差し替える"""
+    original = rate_limiter.time
+    rate_limiter.time = clock
+    try:
+        yield clock
+    finally:
+        rate_limiter.time = original
+
+
+def instances(name: str = "booking", max_per_minute: int = 10, max_per_hour: int = 1000):
+    """同じ Redis を共有する2インスタンス分の (RateLimiter, クライアント)"""
+    server = fakeredis.FakeServer()
+    # 読み込み済みにしておく（初回の NOSCRIPT からの再送を往復回数に含めない）
+    fakeredis.FakeStrictRedis(server=server).script_load(HIT_SCRIPT)
+    pairs = []
+    for _ in range(2):
+        client = CountingRedis(server=server)
+        limiter = RateLimiter(max_per_minute, max_per_hour, RedisBackend(client), name)
+        pairs.append((limiter, client))
+    return pairs
+
+
+def check(name: str, condition: bool, detail=""):
+    assert condition, f"{name}: {detail}"
+    print(f"  ok  {name}")
+
+
+def run_shared_counter(threads: int):
+    """別インスタンスの RateLimiter が1つのカウンターを共有する"""
+    print("shared counter (2 instances)")
+    (a, _), (b, _) = instances(max_per_minute=10)
+    with frozen_time(FakeClock(T0)):
+        results = [(a if i % 2 == 0 else b).is_allowed(IP)[0] for i in range(10)]
+        check("alternating hits up to the limit are allowed", all(results), results)
+        allowed_a, message_a = a.is_allowed(IP)
+        allowed_b, message_b = b.is_allowed(IP)
+        check("both instances deny the 11th", not allowed_a and not allowed_b)
+        check("message names the minute limit", "per minute" in message_a and message_a == message_b, message_a)
+        check("other IPs are counted separately", a.is_allowed("198.51.100.1")[0])
+
+    (a, _), (b, _) = instances(max_per_minute=threads // 2)
+    allowed = []
+    barrier = threading.Barrier(threads)
+
+    def worker(limiter):
+        barrier.wait()
+        allowed.append(limiter.is_allowed(IP)[0])
+
+    with frozen_time(FakeClock(T0)):
+        workers = [threading.Thread(target=worker, args=(a if i % 2 == 0 else b,)) for i in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+    check(
+        f"{threads} concurrent hits allow exactly {threads // 2}",
+        allowed.count(True) == threads // 2,
+        allowed.count(True)
+    )
+
+
+def run_cost():
+    """cost > 1 のリクエスト"""
+    print("cost > 1")
+    (a, client), (b, _) = instances(max_per_minute=10)
+    key = f"ratelimit:{{booking:{IP}}}:{MINUTE}:{int(T0 // MINUTE)}"
+    with frozen_time(FakeClock(T0)) as clock:
+        check("cost 3 x 3 allowed", all(limiter.is_allowed(IP, cost=3)[0] for limiter in (a, b, a)))
+        check("counter is 9", int(client.get(key)) == 9, client.get(key))
+        check("cost 3 with 1 left is denied", not b.is_allowed(IP, cost=3)[0])
+        check("denied request is not counted", int(client.get(key)) == 9, client.get(key))
+        check("cost 1 on the other instance still fits", a.is_allowed(IP, cost=1)[0])
+        check("counter is 10", int(client.get(key)) == 10, client.get(key))
+        clock.now += 2
+        check("cost 1 over the limit is denied", not b.is_allowed(IP, cost=1)[0])
+        check("cost above the limit is denied on a fresh key", not a.is_allowed("198.51.100.2", cost=11)[0])
+
+
+def run_window_expiry():
+    """ウィンドウの切り替わり（スライディングウィンドウ・カウンター）"""
+    print("window expiry")
+    server = fakeredis.FakeServer()
+    backend = RedisBackend(CountingRedis(server=server))
+    limits = ((MINUTE, 10), (HOUR, 1000))
+    key = "booking:" + IP
+
+    check("10 hits allowed", all(backend.hit(key, limits, T0 + i) is None for i in range(10)))
+    check("11th is denied by the minute window", backend.hit(key, limits, T0 + 10) == MINUTE)
+    ttl = backend.client.ttl(f"ratelimit:{{{key}}}:{MINUTE}:{int(T0 // MINUTE)}")
+    check("minute counter expires within 2 windows", 0 < ttl <= MINUTE * 2, ttl)
+
+    # 次のウィンドウの開始直後は直前の10件がほぼそのまま残る
+    check("denied right after the window rolls", backend.hit(key, limits, T0 + MINUTE) == MINUTE)
+    # 半分経過すると直前の10件は5件と見積もる
+    now = T0 + MINUTE * 1.5
+    results = [backend.hit(key, limits, now) for _ in range(6)]
+    check("half way through the next window 5 more are allowed", results == [None] * 5 + [MINUTE], results)
+    # 2ウィンドウ後は（5件入った直前ウィンドウも過ぎて）元に戻る
+    now = T0 + MINUTE * 3
+    check("2 windows later the full limit is back", all(backend.hit(key, limits, now) is None for _ in range(10)))
+
+    # 時のウィンドウ（分の上限には達しないよう1分おきに加算）
+    limits = ((MINUTE, 100), (HOUR, 15))
+    key = "hourly:" + IP
+    results = [backend.hit(key, limits, T0 + i * MINUTE) for i in range(16)]
+    check("16th hit in the hour is denied by the hour window", results == [None] * 15 + [HOUR], results)
+    now = T0 + HOUR * 1.5
+    results = [backend.hit(key, limits, now) for _ in range(8)]
+    check("half way through the next hour 7 more are allowed", results == [None] * 7 + [HOUR], results)
+
+
+def run_local_deny():
+    """拒否したキーの Redis 呼び出しの省略"""
+    print("local deny short-circuit")
+    (a, client_a), (b, client_b) = instances(max_per_minute=5)
+    with frozen_time(FakeClock(T0)) as clock:
+        for _ in range(5):
+            a.is_allowed(IP)
+        check("5 allowed hits = 5 round trips", client_a.round_trips == 5, client_a.round_trips)
+        check("6th is denied", not a.is_allowed(IP)[0])
+        check("the denial is a round trip", client_a.round_trips == 6, client_a.round_trips)
+
+        started = time.perf_counter()
+        denied = [a.is_allowed(IP)[0] for _ in range(1000)]
+        elapsed = time.perf_counter() - started
+        check("repeated hits are denied", not any(denied))
+        check("without a round trip", client_a.round_trips == 6, client_a.round_trips)
+        print(f"      local deny: {elapsed / len(denied) * 1e6:.1f} µs/hit")
+
+        check("the other instance asks Redis and is denied", not b.is_allowed(IP)[0])
+        check("(1 round trip)", client_b.round_trips == 1, client_b.round_trips)
+
+        clock.now += a.backend.local_deny_seconds
+        check("after local_deny_seconds still denied", not a.is_allowed(IP)[0])
+        check("by Redis again", client_a.round_trips == 7, client_a.round_trips)
+
+        a.reset(IP)
+        check("reset clears the local denial and the counters", a.is_allowed(IP)[0])
+        check("(round trip)", client_a.round_trips == 8, client_a.round_trips)
+
+
+def run_unavailable():
+    """Redis に接続できない場合"""
+    print("redis unavailable")
+    limiter = RateLimiter(1, 1, RedisBackend(UnavailableRedis()), "booking")
+    with frozen_time(FakeClock(T0)):
+        check("requests are allowed", all(limiter.is_allowed(IP)[0] for _ in range(3)))
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    logging.disable(logging.CRITICAL)
+    run_shared_counter(threads)
+    run_cost()
+    run_window_expiry()
+    run_local_deny()
+    run_unavailable()
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+予約枠仮押さえの並行ストレステスト
+同じ枠に N スレッドを同時に投げて、確保できるのが1件だけであることを確認する
+
+- ReservationManager 単体: 同じ枠は1件だけ、別カレンダーは全件確保できる
+- /api/book（server.py、app.test_client()）: 同じ枠への同時予約は1件だけが 200/202 で残りは 409、
+  確定後は仮押さえが解放され、以降の同じ枠への予約は台帳・freebusy で 409 になる
+
+Calendar API・OAuth トークンエンドポイントは偽のローカルサーバーに差し替える（Google には接続しない）
+
+実行: python benchmarks/stress_reservation.py [スレッド数] [試行回数]
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import yaml
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, APP_DIR)
+
+from reservation import ReservationManager  # noqa: E402
+
+START = datetime(2026, 2, 20, 11, 30, tzinfo=timezone(timedelta(hours=9)))
+
+# /api/book の並行テスト
+BOOK_STAFF = "hirao_kazuko"
+BOOK_MENU = "ドライヘッドスパ"
+BOOK_STARTS = ["10:30", "10:45", "11:00", "11:15", "11:30"]
+INSERT_DELAY = 0.05  # 偽の events.insert の応答時間（秒、確定までの間に他のリクエストを重ねる）
+
+
+def race_same_slot(manager: ReservationManager, threads: int) -> int:
+    """全スレッドが同じカレンダー・同じ枠を同時に押さえに行き、成功数を返す"""
+    barrier = threading.Barrier(threads)
+    successes = []
+
+    def worker(i: int):
+        # 開始・長さを少しずつずらして部分的な重なりも検査する
+        start = START + timedelta(minutes=i % 3)
+        end = start + timedelta(minutes=15 + i % 2 * 15)
+        barrier.wait()
+        token = manager.try_reserve("calendar-a", start, end)
+        if token is not None:
+            successes.append(token)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return len(successes)
+
+
+def race_distinct_calendars(manager: ReservationManager, threads: int) -> int:
+    """スレッドごとに別カレンダーの同じ枠を押さえ、成功数を返す"""
+    barrier = threading.Barrier(threads)
+    successes = []
+
+    def worker(i: int):
+        barrier.wait()
+        if manager.try_reserve(f"calendar-{i}", START, START + timedelta(minutes=15)):
+            successes.append(i)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return len(successes)
+
+
+class FakeCalendar:
+    """Calendar API の偽物（作成された予定を freebusy に反映する）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {カレンダーID: [(開始, 終了), ...]}（RFC 3339 文字列）
+        self.busy = {}
+        self.inserts = 0
+
+    def freebusy(self, body: dict) -> dict:
+        with self.lock:
+            return {"calendars": {
+                item["id"]: {"busy": [
+                    {"start": start, "end": end} for start, end in self.busy.get(item["id"], [])
+                ]}
+                for item in body["items"]
+            }}
+
+    def insert(self, calendar_id: str, event: dict) -> dict:
+        time.sleep(INSERT_DELAY)
+        with self.lock:
+            self.inserts += 1
+            self.busy.setdefault(calendar_id, []).append(
+                (event["start"]["dateTime"], event["end"]["dateTime"])
+            )
+        return event
+
+
+def start_fake_server(fake: FakeCalendar) -> str:
+    """偽サーバーを起動し、ベースURLを返す"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            content = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            path = self.path.split("?", 1)[0]
+            if path == "/token":
+                body = {"access_token": "stress-test", "expires_in": 3600, "token_type": "Bearer"}
+            elif path.endswith("/freeBusy"):
+                body = fake.freebusy(json.loads(content))
+            else:
+                calendar_id = path.split("/calendars/", 1)[1].split("/", 1)[0]
+                body = fake.insert(unquote(calendar_id), json.loads(content))
+            reply = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+def load_server(base_url: str, directory: str):
+    """偽サーバー向けの設定で server.py を読み込む（読み込み時に CalendarService を初期化する）"""
+    with open(os.path.join(APP_DIR, "config.yaml"), "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config["rate_limit"]["enabled"] = False
+    config["booking_store"]["path"] = os.path.join(directory, "bookings.db")
+    config["availability_snapshot"]["enabled"] = False
+    config["startup"]["mode"] = "eager"
+    config["development"]["use_local_credentials"] = False
+    config["google_calendar"]["api_endpoint"] = f"{base_url}/calendar/v3/"
+    config_path = os.path.join(directory, "config.yaml")
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+
+    os.environ.update(
+        CONFIG_PATH=config_path,
+        REFRESH_TOKEN="stress-test",
+        CLIENT_SECRET=json.dumps({"installed": {
+            "token_uri": f"{base_url}/token",
+            "client_id": "stress-test",
+            "client_secret": "stress-test",
+        }}),
+    )
+    logging.disable(logging.CRITICAL)
+    import server
+    return server
+
+
+def race_book_endpoint(server, start_str: str, threads: int) -> list:
+    """全スレッドが /api/book で同じ枠を同時に予約し、ステータスコードのリストを返す"""
+    payload = {
+        "staff": BOOK_STAFF,
+        "menu": BOOK_MENU,
+        "start": f"{server.app_config.event_date_str}T{start_str}:00",
+        "name": "負荷テスト",
+        "phone": "090-0000-0000"
+    }
+    barrier = threading.Barrier(threads)
+    statuses = []
+
+    def worker():
+        client = server.app.test_client()
+        barrier.wait()
+        statuses.append(client.post("/api/book", json=payload).status_code)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return statuses
+
+
+def run_book_endpoint(threads: int):
+    """/api/book への同時予約（同じ枠は1件だけが確定し、確定後は仮押さえを残さない）"""
+    fake = FakeCalendar()
+    base_url = start_fake_server(fake)
+    with tempfile.TemporaryDirectory() as directory:
+        server = load_server(base_url, directory)
+        calendar_id = server.app_config.staff_by_id[BOOK_STAFF]["calendar_id"]
+        duration = next(menu["duration"] for menu in server.app_config.staff_by_id[BOOK_STAFF]["menus"]
+                        if menu["name"] == BOOK_MENU)
+
+        started = time.perf_counter()
+        for start_str in BOOK_STARTS:
+            statuses = race_book_endpoint(server, start_str, threads)
+            winners = [status for status in statuses if status in (200, 202)]
+            assert len(winners) == 1, f"{start_str}: expected exactly one booking, got {statuses}"
+            assert statuses.count(409) == threads - 1, f"{start_str}: expected 409 for the rest, got {statuses}"
+
+            # 確定後は仮押さえが解放されている（同じ枠をもう一度押さえられる）
+            start = server.app_config.timezone.localize(datetime.combine(
+                datetime.strptime(server.app_config.event_date_str, "%Y-%m-%d").date(),
+                datetime.strptime(start_str, "%H:%M").time()
+            ))
+            token = server.reservation_manager.try_reserve(calendar_id, start, start + timedelta(minutes=duration))
+            assert token is not None, f"{start_str}: reservation was not released after the booking"
+            server.reservation_manager.release(calendar_id, token)
+
+            # 以降の予約は仮押さえではなく台帳・freebusy で断られる
+            retry = race_book_endpoint(server, start_str, 1)
+            assert retry == [409], f"{start_str}: expected 409 after the booking, got {retry}"
+        elapsed = time.perf_counter() - started
+
+    assert fake.inserts == len(BOOK_STARTS), f"expected {len(BOOK_STARTS)} events, got {fake.inserts}"
+    print(
+        f"OK: /api/book {len(BOOK_STARTS)} slots x {threads} threads, exactly one 200/202 per slot, "
+        f"reservation released after commit ({elapsed:.2f}s)"
+    )
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        manager = ReservationManager()
+        same = race_same_slot(manager, threads)
+        assert same == 1, f"expected exactly one reservation, got {same}"
+
+        distinct = race_distinct_calendars(manager, threads)
+        assert distinct == threads, f"expected {threads} reservations, got {distinct}"
+    elapsed = time.perf_counter() - started
+
+    print(f"OK: {rounds} rounds x {threads} threads, exactly one winner per contested slot ({elapsed:.2f}s)")
+
+    run_book_endpoint(min(threads, 16))
+
+
+if __name__ == "__main__":
+    main()
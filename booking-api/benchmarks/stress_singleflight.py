@@ -0,0 +1,166 @@
+"""
+freebusy.query 合流（single-flight）の並行テスト
+同じカレンダー・同じ日の get_busy_slots を N スレッド（asyncio 版は N タスク）から同時に呼び、
+Calendar API への問い合わせ回数を数える
+
+- 合流あり: 1回（全員が同じ結果を受け取る）
+- 合流なし / use_cache=False: N 回
+- API がエラーを返した場合: 1回で、全員に HttpError が届く
+
+Calendar API には接続しない（HTTP 層を応答を遅らせる偽物に差し替える）
+
+実行: python benchmarks/stress_singleflight.py [スレッド数] [試行回数]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import httplib2
+import httpx
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from async_calendar_service import AsyncCalendarService  # noqa: E402
+from calendar_service import CalendarService  # noqa: E402
+from credential_manager import CredentialManager  # noqa: E402
+
+CALENDAR_ID = "calendar-a@group.calendar.google.com"
+DATE = datetime(2026, 2, 20)
+UPSTREAM_DELAY = 0.1  # 偽の Calendar API の応答時間（秒）
+
+
+def freebusy_response(body: bytes):
+    """freebusy.query の偽の応答（全カレンダーに同じ busy 枠を1件）"""
+    items = json.loads(body)["items"]
+    return {
+        "calendars": {
+            item["id"]: {"busy": [{"start": "2026-02-20T02:00:00Z", "end": "2026-02-20T03:00:00Z"}]}
+            for item in items
+        }
+    }
+
+
+class FakeHttp:
+    """freebusy.query の呼び出し回数を数える httplib2.Http の代わり"""
+
+    calls = 0
+    status = 200
+    lock = threading.Lock()
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        with FakeHttp.lock:
+            FakeHttp.calls += 1
+        time.sleep(UPSTREAM_DELAY)
+        if FakeHttp.status != 200:
+            content = json.dumps({"error": {"code": FakeHttp.status, "message": "backend error"}})
+            return httplib2.Response({"status": FakeHttp.status}), content.encode()
+        return httplib2.Response({"status": 200}), json.dumps(freebusy_response(body)).encode()
+
+
+def credentials() -> Credentials:
+    """有効期限内のダミー認証情報（更新は発生しない）"""
+    return Credentials(token="stress-test", expiry=datetime.utcnow() + timedelta(hours=1))
+
+
+def race_threads(service: CalendarService, threads: int, use_cache: bool = True):
+    """全スレッドから同時に get_busy_slots を呼び、(結果, 例外) のリストを返す"""
+    barrier = threading.Barrier(threads)
+    outcomes = []
+
+    def worker():
+        barrier.wait()
+        try:
+            busy = service.get_busy_slots(CALENDAR_ID, DATE, "10:00", "19:00", use_cache=use_cache)
+            outcomes.append((busy, None))
+        except HttpError as error:
+            outcomes.append((None, error))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return outcomes
+
+
+def run_sync(threads: int, coalesce: bool, use_cache: bool = True, status: int = 200):
+    """同期版で1回競わせ、(問い合わせ回数, 成功数, HttpError 数) を返す"""
+    FakeHttp.calls = 0
+    FakeHttp.status = status
+    # busy枠キャッシュは無効（合流だけの効果を見る）
+    service = CalendarService(credentials(), http_factory=FakeHttp, coalesce_freebusy=coalesce)
+    outcomes = race_threads(service, threads, use_cache)
+    results = [busy for busy, error in outcomes if error is None]
+    errors = [error for busy, error in outcomes if error is not None]
+    # 合流した呼び出しも同じ内容を受け取っている
+    assert all(busy == results[0] for busy in results)
+    return FakeHttp.calls, len(results), len(errors)
+
+
+def run_async(tasks: int, coalesce: bool, status: int = 200):
+    """asyncio 版で1回競わせ、(問い合わせ回数, 成功数, HttpError 数) を返す"""
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(UPSTREAM_DELAY)
+        if status != 200:
+            return httpx.Response(status, json={"error": {"code": status, "message": "backend error"}})
+        return httpx.Response(200, json=freebusy_response(request.content))
+
+    async def race():
+        client = httpx.AsyncClient(base_url="http://stub/calendar/v3/", transport=httpx.MockTransport(handler))
+        service = AsyncCalendarService(
+            CredentialManager(credentials()), client=client, coalesce_freebusy=coalesce
+        )
+        outcomes = await asyncio.gather(
+            *(service.get_busy_slots(CALENDAR_ID, DATE, "10:00", "19:00") for _ in range(tasks)),
+            return_exceptions=True
+        )
+        await client.aclose()
+        return outcomes
+
+    outcomes = asyncio.run(race())
+    errors = [outcome for outcome in outcomes if isinstance(outcome, HttpError)]
+    results = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+    assert len(errors) + len(results) == tasks, outcomes
+    return calls, len(results), len(errors)
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    # 503 のケースで全呼び出しがエラーログを出すため抑止
+    logging.disable(logging.CRITICAL)
+
+    cases = [
+        ("sync  coalesced", lambda: run_sync(threads, coalesce=True), (1, threads, 0)),
+        ("sync  not coalesced", lambda: run_sync(threads, coalesce=False), (threads, threads, 0)),
+        ("sync  use_cache=False", lambda: run_sync(threads, coalesce=True, use_cache=False), (threads, threads, 0)),
+        ("sync  upstream 503", lambda: run_sync(threads, coalesce=True, status=503), (1, 0, threads)),
+        ("async coalesced", lambda: run_async(threads, coalesce=True), (1, threads, 0)),
+        ("async not coalesced", lambda: run_async(threads, coalesce=False), (threads, threads, 0)),
+        ("async upstream 503", lambda: run_async(threads, coalesce=True, status=503), (1, 0, threads)),
+    ]
+
+    print(f"{'case':<24} {'API calls':>10} {'ok':>5} {'errors':>7}   ({threads} concurrent callers)")
+    for name, run, expected in cases:
+        for _ in range(rounds):
+            outcome = run()
+            assert outcome == expected, f"{name}: expected {expected}, got {outcome}"
+        print(f"{name:<24} {outcome[0]:>10} {outcome[1]:>5} {outcome[2]:>7}")
+
+    print(f"OK: {rounds} rounds per case")
+
+
+if __name__ == "__main__":
+    main()
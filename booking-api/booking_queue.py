@@ -0,0 +1,200 @@
+"""
+カレンダー書き込みキュー
+予約確定後の events.insert をバックグラウンドのワーカーで実行する
+（リクエストスレッドを Google API の応答待ちで占有しない）
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from calendar_service import CalendarService
+
+logger = logging.getLogger(__name__)
+
+# 再試行する HTTP ステータス
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CalendarWriteQueue:
+    """上限付きキューと再試行付きワーカーによる非同期イベント作成"""
+
+    def __init__(
+        self,
+        calendar_service: CalendarService,
+        max_size: int = 100,
+        workers: int = 2,
+        max_retries: int = 5,
+        retry_base_seconds: float = 1.0,
+        retry_max_seconds: float = 30.0
+    ):
+        """
+        初期化
+
+        Args:
+            calendar_service: CalendarService
+            max_size: キューの最大長（超えた場合は受け付けない）
+            workers: ワーカースレッド数
+            max_retries: 1件あたりの最大再試行回数
+            retry_base_seconds: 再試行間隔の初期値（秒、指数的に増加）
+            retry_max_seconds: 再試行間隔の上限（秒）
+        """
+        self.calendar_service = calendar_service
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=max_size)
+        self._workers: List[threading.Thread] = [
+            threading.Thread(target=self._run, name=f"calendar-writer-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(
+        self,
+        booking_id: str,
+        calendar_id: str,
+        event: Dict,
+        start_time: datetime,
+        end_time: datetime
+    ) -> bool:
+        """
+        イベント作成を依頼
+
+        Args:
+            booking_id: 予約ID（イベントIDとして使用）
+            calendar_id: カレンダーID
+            event: イベント本文
+            start_time: 開始時刻
+            end_time: 終了時刻
+
+        Returns:
+            受け付けた場合 True（キューが満杯の場合 False）
+        """
+        job = {
+            "booking_id": booking_id,
+            "calendar_id": calendar_id,
+            "event": event,
+            "start_time": start_time,
+            "end_time": end_time,
+        }
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            logger.warning("Calendar write queue is full, rejecting booking %s", booking_id)
+            return False
+
+    def requeue_pending(self):
+        """
+        台帳上でカレンダー未反映（pending）の予約を再登録（起動時に呼ぶ）
+
+        前回のプロセスがキューの処理中に停止した予約を書き込む。イベントIDは予約IDのため、
+        停止前に作成済みだった場合も重複しない。キューが空くのを待つため別スレッドで行う
+        """
+        booking_store = self.calendar_service.booking_store
+        if not booking_store:
+            return
+        pending = booking_store.pending()
+        if not pending:
+            return
+        logger.info("Requeueing %s pending booking(s) for calendar write", len(pending))
+        threading.Thread(
+            target=self._requeue, args=(pending,), name="calendar-writer-requeue", daemon=True
+        ).start()
+
+    def _requeue(self, pending: List[Dict]):
+        """未反映の予約をキューに入れる（満杯の間は待つ）"""
+        for booking in pending:
+            if booking["event"] is None:
+                logger.warning("Pending booking %s has no stored event, cannot requeue", booking["booking_id"])
+                continue
+            self._queue.put({
+                "booking_id": booking["booking_id"],
+                "calendar_id": booking["calendar_id"],
+                "event": booking["event"],
+                "start_time": booking["start"],
+                "end_time": booking["end"],
+            })
+
+    def pending_count(self) -> int:
+        """未処理の件数"""
+        return self._queue.qsize()
+
+    def stop(self, timeout: float = 10.0):
+        """
+        キュー内の処理を終えてからワーカーを停止
+
+        Args:
+            timeout: ワーカー1つあたりの待機時間（秒）
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def _run(self):
+        """ワーカーのメインループ"""
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._process(job)
+            except Exception as e:
+                logger.error("Unexpected error in calendar writer: %s", e)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job: Dict):
+        """
+        1件のイベント作成（失敗時は指数バックオフで再試行）
+
+        Args:
+            job: submit で登録した内容
+        """
+        booking_id = job["booking_id"]
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                # booking_id をイベントIDにするため、再試行しても重複作成されない
+                created_event = self.calendar_service.insert_event(
+                    job["calendar_id"], job["event"], event_id=booking_id
+                )
+                self.calendar_service.confirm_booking(
+                    booking_id,
+                    job["calendar_id"],
+                    job["start_time"],
+                    job["end_time"],
+                    created_event["id"]
+                )
+                logger.info("Booking %s written to calendar (attempt %s)", booking_id, attempt + 1)
+                return
+
+            except HttpError as error:
+                if error.resp.status not in RETRYABLE_STATUSES:
+                    logger.error("Calendar write failed for booking %s: %s", booking_id, error)
+                    break
+                logger.warning("Calendar write retry for booking %s: %s", booking_id, error)
+            except Exception as error:
+                # 通信エラー等は再試行
+                logger.warning("Calendar write retry for booking %s: %s", booking_id, error)
+
+            if attempt < self.max_retries:
+                delay = min(self.retry_base_seconds * (2 ** attempt), self.retry_max_seconds)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+        # 反映失敗として記録し、枠は解放する（予約者には GET /api/book/<booking_id> で failed を返す）
+        self.calendar_service.fail_booking(booking_id, job["calendar_id"])
+        logger.error(
+            "Giving up calendar write for booking %s - slot %s released, contact the customer",
+            booking_id, job["start_time"].isoformat()
+        )
@@ -0,0 +1,283 @@
+"""
+予約台帳（SQLite）
+カレンダーに書き込み中（未反映）の予約を記録し、反映までの間の二重予約を防ぐ
+反映済みの予約は Google Calendar（freebusy・ミラー）を正とし、
+反映から synced_hold_seconds 経過後は重複判定・空き枠計算の対象から外す
+（Google 側で削除された予約の枠が台帳に残り続けないようにする）
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 予約ステータス
+STATUS_PENDING = "pending"  # 台帳に記録済み・カレンダー未反映
+STATUS_SYNCED = "synced"    # カレンダー反映済み
+STATUS_FAILED = "failed"    # カレンダー反映に失敗
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    booking_id TEXT PRIMARY KEY,
+    calendar_id TEXT NOT NULL,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    event_id TEXT,
+    created_at INTEGER NOT NULL,
+    event TEXT,
+    synced_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_bookings_calendar_start
+    ON bookings (calendar_id, start_ts);
+"""
+
+# 枠を押さえている予約（未反映、または押さえ期間内に反映された予約。反映失敗の予約は枠を解放済み）
+HOLDING_CONDITION = "(status = ? OR (status = ? AND synced_at > ?))"
+
+
+def _to_ts(dt: datetime) -> int:
+    """タイムゾーン付き datetime を Unix timestamp（秒）に変換"""
+    return int(dt.timestamp())
+
+
+def _from_ts(ts: int) -> datetime:
+    """Unix timestamp（秒）を UTC の datetime に変換"""
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+class BookingStore:
+    """SQLite（WALモード）による予約台帳"""
+
+    def __init__(self, path: str, synced_hold_seconds: float = 300):
+        """
+        初期化
+
+        Args:
+            path: SQLite データベースファイルのパス
+            synced_hold_seconds: カレンダー反映後も台帳で枠を押さえておく秒数
+                                 （反映直前に freebusy で空きを確認した他の予約を断るため）
+        """
+        self.path = path
+        self.synced_hold_seconds = synced_hold_seconds
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        # event 列がない既存の台帳に追加（未反映の予約を再登録するためのイベント本文）
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(bookings)")}
+        if "event" not in columns:
+            conn.execute("ALTER TABLE bookings ADD COLUMN event TEXT")
+        # synced_at 列がない既存の台帳に追加（反映済みの予約は既に押さえ期間を過ぎたものとして扱う）
+        if "synced_at" not in columns:
+            conn.execute("ALTER TABLE bookings ADD COLUMN synced_at INTEGER")
+        logger.info("BookingStore initialized: %s", path)
+
+    def _connection(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def reserve(
+        self,
+        booking_id: str,
+        calendar_id: str,
+        start: datetime,
+        end: datetime,
+        event: Optional[Dict] = None
+    ) -> bool:
+        """
+        重複がなければ予約を台帳に記録（1トランザクションで確認と書き込み）
+
+        Args:
+            booking_id: 予約ID
+            calendar_id: カレンダーID
+            start: 開始時刻
+            end: 終了時刻
+            event: カレンダーに作成するイベント本文（非同期モードで再起動後に再登録するため保存）
+
+        Returns:
+            記録できた場合 True（既存予約と重複する場合 False）
+        """
+        conn = self._connection()
+        start_ts, end_ts = _to_ts(start), _to_ts(end)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._overlaps(conn, calendar_id, start_ts, end_ts):
+                conn.execute("ROLLBACK")
+                return False
+
+            conn.execute(
+                "INSERT INTO bookings "
+                "(booking_id, calendar_id, start_ts, end_ts, status, created_at, event) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    booking_id, calendar_id, start_ts, end_ts, STATUS_PENDING, int(time.time()),
+                    json.dumps(event, ensure_ascii=False) if event is not None else None
+                )
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def has_conflict(self, calendar_id: str, start: datetime, end: datetime) -> bool:
+        """
+        指定枠が台帳上の予約（未反映、または反映直後）と重複するか
+
+        Args:
+            calendar_id: カレンダーID
+            start: 開始時刻
+            end: 終了時刻
+
+        Returns:
+            重複している場合 True
+        """
+        return self._overlaps(self._connection(), calendar_id, _to_ts(start), _to_ts(end))
+
+    def _overlaps(
+        self,
+        conn: sqlite3.Connection,
+        calendar_id: str,
+        start_ts: int,
+        end_ts: int
+    ) -> bool:
+        """重複判定（start_ts < 終了 かつ end_ts > 開始、枠を押さえている予約のみ）"""
+        row = conn.execute(
+            "SELECT 1 FROM bookings "
+            "WHERE calendar_id = ? AND start_ts < ? AND end_ts > ? AND " + HOLDING_CONDITION + " LIMIT 1",
+            (calendar_id, end_ts, start_ts, *self._holding_params())
+        ).fetchone()
+        return row is not None
+
+    def _holding_params(self) -> Tuple:
+        """HOLDING_CONDITION のパラメータ（未反映、または押さえ期間内に反映された予約）"""
+        return STATUS_PENDING, STATUS_SYNCED, int(time.time() - self.synced_hold_seconds)
+
+    def busy_slots(
+        self,
+        calendar_id: str,
+        time_min: datetime,
+        time_max: datetime
+    ) -> List[Tuple[datetime, datetime]]:
+        """
+        指定範囲に重なる台帳上の予約（未反映、または反映直後）をbusy枠として取得
+
+        反映失敗の予約と、押さえ期間を過ぎた反映済みの予約は含めない（カレンダー側のbusy枠を正とする）
+
+        Args:
+            calendar_id: カレンダーID
+            time_min: 範囲の開始
+            time_max: 範囲の終了
+
+        Returns:
+            busy枠のリスト [(開始時刻, 終了時刻), ...]
+        """
+        rows = self._connection().execute(
+            "SELECT start_ts, end_ts FROM bookings "
+            "WHERE calendar_id = ? AND start_ts < ? AND end_ts > ? AND " + HOLDING_CONDITION + " "
+            "ORDER BY start_ts",
+            (calendar_id, _to_ts(time_max), _to_ts(time_min), *self._holding_params())
+        ).fetchall()
+        return [(_from_ts(row["start_ts"]), _from_ts(row["end_ts"])) for row in rows]
+
+    def pending(self) -> List[Dict]:
+        """
+        カレンダー未反映の予約（作成順）
+
+        Returns:
+            [{"booking_id", "calendar_id", "start", "end", "event"}, ...]
+            （event はイベント本文。保存していない予約は None）
+        """
+        rows = self._connection().execute(
+            "SELECT booking_id, calendar_id, start_ts, end_ts, event FROM bookings "
+            "WHERE status = ? ORDER BY created_at",
+            (STATUS_PENDING,)
+        ).fetchall()
+        return [
+            {
+                "booking_id": row["booking_id"],
+                "calendar_id": row["calendar_id"],
+                "start": _from_ts(row["start_ts"]),
+                "end": _from_ts(row["end_ts"]),
+                "event": json.loads(row["event"]) if row["event"] else None,
+            }
+            for row in rows
+        ]
+
+    def mark_synced(self, booking_id: str, event_id: str):
+        """
+        カレンダー反映済みとして記録
+
+        Args:
+            booking_id: 予約ID
+            event_id: 作成されたイベントID
+        """
+        self._connection().execute(
+            "UPDATE bookings SET status = ?, event_id = ?, synced_at = ? WHERE booking_id = ?",
+            (STATUS_SYNCED, event_id, int(time.time()), booking_id)
+        )
+
+    def mark_failed(self, booking_id: str):
+        """
+        カレンダー反映失敗として記録（枠は解放し、予約状態の確認用に行は残す）
+
+        Args:
+            booking_id: 予約ID
+        """
+        self._connection().execute(
+            "UPDATE bookings SET status = ? WHERE booking_id = ?",
+            (STATUS_FAILED, booking_id)
+        )
+
+    def delete(self, booking_id: str):
+        """
+        予約を台帳から削除（カレンダー登録に失敗した場合の取り消し）
+
+        Args:
+            booking_id: 予約ID
+        """
+        self._connection().execute(
+            "DELETE FROM bookings WHERE booking_id = ?",
+            (booking_id,)
+        )
+
+    def get(self, booking_id: str) -> Optional[Dict]:
+        """
+        予約を取得
+
+        Args:
+            booking_id: 予約ID
+
+        Returns:
+            予約情報（存在しない場合 None）
+        """
+        row = self._connection().execute(
+            "SELECT booking_id, calendar_id, start_ts, end_ts, status, event_id "
+            "FROM bookings WHERE booking_id = ?",
+            (booking_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        return {
+            "booking_id": row["booking_id"],
+            "calendar_id": row["calendar_id"],
+            "start": _from_ts(row["start_ts"]),
+            "end": _from_ts(row["end_ts"]),
+            "status": row["status"],
+            "event_id": row["event_id"],
+        }
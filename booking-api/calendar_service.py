@@ -4,75 +4,578 @@ Google Calendar API サービスクラス
 """
 
 import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple, Optional
+import threading
+from threading import Lock
+from typing import Any, Callable, List, Dict, Mapping, Tuple, Optional
 import logging
+import httplib2
 import pytz
 
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
 from googleapiclient.errors import HttpError
 
+from batch_inserter import EventInsertBatcher
+from booking_store import BookingStore
+from calendar_sync import CalendarMirror, MirrorUpdate, watch_request
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from credential_manager import load_discovery_document
+from metrics import (
+    BUSY_CACHE_LOOKUPS,
+    CALENDAR_API_DURATION,
+    CALENDAR_SERVICE_DURATION,
+    CALENDAR_SYNCS,
+    FREEBUSY_COALESCED,
+    timed,
+)
+from singleflight import SingleFlight
+from occupancy_index import OccupancyIndex
+from slot_engine import parse_clock, parse_hhmm
+
 logger = logging.getLogger(__name__)
 
+# Calendar API が使えないことを示す例外（API エラー・回路遮断中・タイムアウト・通信エラー）
+CALENDAR_UNAVAILABLE_ERRORS = (HttpError, CircuitOpenError, OSError, httplib2.HttpLib2Error)
+
+
+class SlotConflictError(Exception):
+    """予約枠が既に埋まっている"""
 
-class CalendarService:
-    """Google Calendar API操作クラス"""
 
-    def __init__(self, credentials: Credentials):
+class BusySlotCache:
+    """freebusy 結果のTTLキャッシュ（カレンダー × 時間範囲単位、LRUで件数上限）"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, stale_max_age_seconds: float = 0):
         """
         初期化
 
         Args:
-            credentials: Google OAuth 2.0 credentials
+            ttl_seconds: キャッシュ有効期間（秒）
+            max_entries: 保持する最大エントリ数
+            stale_max_age_seconds: 期限切れ後も、Calendar API 障害時の代替として
+                                   取得から何秒までのエントリを残すか（ttl_seconds 以下で残さない）
         """
-        self.credentials = credentials
-        self.service = build("calendar", "v3", credentials=credentials)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # 有効期限を過ぎてから破棄するまでの猶予
+        self.stale_grace_seconds = max(stale_max_age_seconds - ttl_seconds, 0)
 
-    def get_busy_slots(
+        # {(calendar_id, time_min, time_max): (有効期限, busy枠リスト)}
+        self._entries: "OrderedDict[Tuple[str, datetime, datetime], Tuple[float, list]]" = OrderedDict()
+        # {calendar_id: 世代}（予約の書き込み・破棄で進め、それより前に始まった取得結果を保存しない）
+        self._generations: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def get(
+        self,
+        calendar_id: str,
+        time_min: datetime,
+        time_max: datetime
+    ) -> Optional[List[Tuple[datetime, datetime]]]:
+        """
+        有効なキャッシュがあればbusy枠のコピーを返す
+
+        Args:
+            calendar_id: カレンダーID
+            time_min: 取得範囲の開始
+            time_max: 取得範囲の終了
+
+        Returns:
+            busy枠リスト（キャッシュがない・期限切れの場合 None）
+        """
+        key = (calendar_id, time_min, time_max)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self._get_covering(calendar_id, time_min, time_max)
+
+            expires_at, busy_slots = entry
+            if expires_at <= time.monotonic():
+                # 障害時の代替に使える間は残す
+                if expires_at + self.stale_grace_seconds <= time.monotonic():
+                    del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return list(busy_slots)
+
+    def get_stale(
+        self,
+        calendar_id: str,
+        time_min: datetime,
+        time_max: datetime
+    ) -> Optional[List[Tuple[datetime, datetime]]]:
+        """
+        有効期限切れでも猶予内のエントリがあればbusy枠のコピーを返す（Calendar API 障害時用）
+
+        Args:
+            calendar_id: カレンダーID
+            time_min: 取得範囲の開始
+            time_max: 取得範囲の終了
+
+        Returns:
+            busy枠リスト（猶予を過ぎている・エントリがない場合 None）
+        """
+        with self._lock:
+            return self._get_covering(calendar_id, time_min, time_max, self.stale_grace_seconds)
+
+    def _get_covering(
+        self,
+        calendar_id: str,
+        time_min: datetime,
+        time_max: datetime,
+        grace_seconds: float = 0
+    ) -> Optional[List[Tuple[datetime, datetime]]]:
+        """
+        指定範囲を含む有効なエントリがあれば、範囲に重なるbusy枠を返す（ロック取得済みで呼ぶ）
+
+        grace_seconds を指定すると、有効期限をその秒数だけ過ぎたエントリも対象にする
+        """
+        now = time.monotonic() - grace_seconds
+        for (cached_id, cached_min, cached_max), (expires_at, busy_slots) in self._entries.items():
+            if (
+                cached_id == calendar_id
+                and expires_at > now
+                and cached_min <= time_min
+                and time_max <= cached_max
+            ):
+                return [
+                    (start, end) for start, end in busy_slots
+                    if start < time_max and time_min < end
+                ]
+        return None
+
+    def generation(self, calendar_id: str) -> int:
+        """
+        カレンダーの世代（freebusy.query の開始前に取得し、set に渡す）
+
+        Args:
+            calendar_id: カレンダーID
+
+        Returns:
+            世代
+        """
+        with self._lock:
+            return self._generations.get(calendar_id, 0)
+
+    def set(
+        self,
+        calendar_id: str,
+        time_min: datetime,
+        time_max: datetime,
+        busy_slots: List[Tuple[datetime, datetime]],
+        generation: Optional[int] = None
+    ) -> bool:
+        """
+        busy枠をキャッシュに保存
+
+        Args:
+            calendar_id: カレンダーID
+            time_min: 取得範囲の開始
+            time_max: 取得範囲の終了
+            busy_slots: busy枠リスト
+            generation: 取得開始前の generation()（取得中に add_busy・invalidate があれば保存しない）
+
+        Returns:
+            保存した場合 True
+        """
+        key = (calendar_id, time_min, time_max)
+        with self._lock:
+            # 取得中に書き込まれた予約を含まない可能性がある結果で上書きしない
+            if generation is not None and generation != self._generations.get(calendar_id, 0):
+                return False
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, list(busy_slots))
+            self._entries.move_to_end(key)
+
+            # 上限を超えたら古いものから削除
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def add_busy(self, calendar_id: str, start: datetime, end: datetime):
+        """
+        予約確定時にキャッシュ済みのbusy枠へ書き込む（write-through）
+
+        Args:
+            calendar_id: カレンダーID
+            start: 予約開始時刻
+            end: 予約終了時刻
+        """
+        with self._lock:
+            self._generations[calendar_id] = self._generations.get(calendar_id, 0) + 1
+            for (cached_id, time_min, time_max), (expires_at, busy_slots) in self._entries.items():
+                if cached_id == calendar_id and start < time_max and time_min < end:
+                    busy_slots.append((start, end))
+
+    def invalidate(self, calendar_id: str):
+        """
+        指定カレンダーのキャッシュを破棄
+
+        Args:
+            calendar_id: カレンダーID
+        """
+        with self._lock:
+            self._generations[calendar_id] = self._generations.get(calendar_id, 0) + 1
+            for key in [key for key in self._entries if key[0] == calendar_id]:
+                del self._entries[key]
+
+    def is_fresh(self, calendar_id: str, time_min: datetime, time_max: datetime) -> bool:
+        """
+        指定範囲の有効なキャッシュがあるか（busy枠はコピーしない）
+
+        Args:
+            calendar_id: カレンダーID
+            time_min: 取得範囲の開始
+            time_max: 取得範囲の終了
+
+        Returns:
+            キャッシュから返せる場合 True
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((calendar_id, time_min, time_max))
+            if entry is not None:
+                return entry[0] > now
+            return any(
+                cached_id == calendar_id and expires_at > now
+                and cached_min <= time_min and time_max <= cached_max
+                for (cached_id, cached_min, cached_max), (expires_at, _) in self._entries.items()
+            )
+
+
+class CalendarVersions:
+    """
+    カレンダーごとの変更カウンター（空き枠レスポンスの ETag に使用）
+
+    このインスタンスでの予約の記録・取り消しと、Google から取得したbusy枠の変化で進む
+    """
+
+    def __init__(self):
+        """初期化"""
+        # 再起動後・別インスタンスのカウンター値と区別するため ETag に含める
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._versions: Dict[str, int] = {}
+        # {(calendar_id, time_min, time_max): 前回取得したbusy枠のハッシュ}
+        self._fingerprints: Dict[Tuple[str, datetime, datetime], int] = {}
+        self._lock = Lock()
+
+    def bump(self, calendar_id: str):
+        """
+        カウンターを進める
+
+        Args:
+            calendar_id: カレンダーID
+        """
+        with self._lock:
+            self._versions[calendar_id] = self._versions.get(calendar_id, 0) + 1
+
+    def observe(
         self,
         calendar_id: str,
+        time_min: datetime,
+        time_max: datetime,
+        busy_slots: List[Tuple[datetime, datetime]]
+    ):
+        """
+        Google から取得したbusy枠が同じ範囲の前回の取得結果と違えばカウンターを進める
+
+        Args:
+            calendar_id: カレンダーID
+            time_min: 取得範囲の開始
+            time_max: 取得範囲の終了
+            busy_slots: 取得したbusy枠（台帳を重ねる前）
+        """
+        key = (calendar_id, time_min, time_max)
+        fingerprint = hash(tuple(busy_slots))
+        with self._lock:
+            previous = self._fingerprints.get(key)
+            self._fingerprints[key] = fingerprint
+            if previous is not None and previous != fingerprint:
+                self._versions[calendar_id] = self._versions.get(calendar_id, 0) + 1
+
+    def etag(self, calendar_ids: List[str], variant: str = "") -> str:
+        """
+        カレンダーの組み合わせに対する ETag
+
+        Args:
+            calendar_ids: レスポンスに含まれるカレンダーID
+            variant: 同じカレンダーでも内容が変わるパラメータ（施術時間など）
+
+        Returns:
+            引用符付きの ETag
+        """
+        with self._lock:
+            versions = ".".join(str(self._versions.get(calendar_id, 0)) for calendar_id in calendar_ids)
+        return f'"{self.instance_id}-{versions}{"-" + variant if variant else ""}"'
+
+
+class CalendarServiceBase:
+    """同期版・非同期版で共通の処理（通信を伴わない部分）"""
+
+    # Calendar API の不調として回路の失敗に数える通信系の例外（HttpError は 5xx・429 のみ数える）
+    upstream_errors: Tuple[type, ...] = (OSError, httplib2.HttpLib2Error)
+
+    def __init__(
+        self,
+        cache_ttl_seconds: float = 0,
+        cache_max_entries: int = 256,
+        booking_store: Optional[BookingStore] = None,
+        stale_max_age_seconds: float = 0,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        calendar_mirror: Optional[CalendarMirror] = None
+    ):
+        """
+        初期化
+
+        Args:
+            cache_ttl_seconds: busy枠キャッシュの有効期間（秒）、0 以下で無効
+            cache_max_entries: busy枠キャッシュの最大エントリ数
+            booking_store: 予約台帳（指定時は予約確認・空き枠計算で台帳を優先）
+            stale_max_age_seconds: Calendar API 障害時に代わりに返すbusy枠の、取得からの最大経過秒数
+            circuit_breaker: Calendar API 呼び出しに使うサーキットブレーカー（None で使わない）
+            calendar_mirror: 差分同期するカレンダーのミラー（同期済みのカレンダーは freebusy.query を呼ばない）
+        """
+        self.busy_cache = (
+            BusySlotCache(cache_ttl_seconds, cache_max_entries, stale_max_age_seconds)
+            if cache_ttl_seconds > 0 else None
+        )
+        self.circuit_breaker = circuit_breaker
+        self.booking_store = booking_store
+        self.calendar_mirror = calendar_mirror
+        self.versions = CalendarVersions()
+
+    @staticmethod
+    def _time_range(
+        date: datetime,
+        start_time: str,
+        end_time: str,
+        timezone: str
+    ) -> Tuple[datetime, datetime]:
+        """
+        対象日の時刻範囲（タイムゾーン付き）
+
+        Args:
+            date: 対象日
+            start_time: 開始時刻 (HH:MM)
+            end_time: 終了時刻 (HH:MM)
+            timezone: タイムゾーン
+
+        Returns:
+            (開始, 終了)
+        """
+        tz = pytz.timezone(timezone)
+        time_min = tz.localize(datetime.combine(
+            date.date(),
+            parse_clock(start_time)
+        ))
+        time_max = tz.localize(datetime.combine(
+            date.date(),
+            parse_clock(end_time)
+        ))
+        return time_min, time_max
+
+    def is_busy_cached(
+        self,
+        calendar_ids: List[str],
         date: datetime,
         start_time: str,
         end_time: str,
         timezone: str = "Asia/Tokyo"
-    ) -> List[Tuple[datetime, datetime]]:
+    ) -> bool:
         """
-        指定日のbusy枠を取得
+        指定カレンダーのbusy枠がすべてキャッシュから返せるか（Google への問い合わせが不要か）
 
         Args:
-            calendar_id: カレンダーID
+            calendar_ids: カレンダーIDのリスト
             date: 対象日
             start_time: 開始時刻 (HH:MM)
             end_time: 終了時刻 (HH:MM)
             timezone: タイムゾーン
 
         Returns:
-            busy枠のリスト [(開始時刻, 終了時刻), ...]
+            すべて同期済みのミラーか有効なキャッシュから返せる場合 True
         """
-        try:
-            # 時刻範囲を作成（タイムゾーン付き）
-            tz = pytz.timezone(timezone)
-            time_min = tz.localize(datetime.combine(
-                date.date(),
-                datetime.strptime(start_time, "%H:%M").time()
-            ))
-            time_max = tz.localize(datetime.combine(
-                date.date(),
-                datetime.strptime(end_time, "%H:%M").time()
-            ))
-
-            # freebusy.query 実行
-            body = {
-                "timeMin": time_min.isoformat(),
-                "timeMax": time_max.isoformat(),
-                "timeZone": timezone,
-                "items": [{"id": calendar_id}]
-            }
+        mirror = self.calendar_mirror
+        if not self.busy_cache:
+            return mirror is not None and all(mirror.is_synced(calendar_id) for calendar_id in calendar_ids)
+        time_min, time_max = self._time_range(date, start_time, end_time, timezone)
+        return all(
+            (mirror is not None and mirror.is_synced(calendar_id))
+            or self.busy_cache.is_fresh(calendar_id, time_min, time_max)
+            for calendar_id in calendar_ids
+        )
+
+    def _is_upstream_failure(self, error: Exception) -> bool:
+        """回路の失敗として数える例外か（4xx は上流が正常に応答しているので数えない）"""
+        if isinstance(error, HttpError):
+            return error.resp.status >= 500 or error.resp.status == 429
+        return isinstance(error, self.upstream_errors)
+
+    def _upstream_guard(self):
+        """Calendar API 呼び出しを囲むコンテキスト（サーキットブレーカーがあれば経由する）"""
+        if not self.circuit_breaker:
+            return nullcontext()
+        return self.circuit_breaker.guard(self._is_upstream_failure)
+
+    def ensure_calendar_available(self):
+        """
+        Calendar API の回路が開いていれば、呼び出す前に失敗させる（予約を待たせずに断る）
+
+        Raises:
+            CircuitOpenError: 回路が開いている
+        """
+        if self.circuit_breaker and self.circuit_breaker.is_open():
+            raise CircuitOpenError(self.circuit_breaker.retry_after())
+
+    def get_stale_busy_slots(
+        self,
+        calendar_ids: List[str],
+        date: datetime,
+        start_time: str,
+        end_time: str,
+        timezone: str = "Asia/Tokyo"
+    ) -> Optional[Dict[str, List[Tuple[datetime, datetime]]]]:
+        """
+        最後に取得したbusy枠（有効期限切れを含む）に台帳上の予約を重ねて返す（Calendar API 障害時用）
+
+        Args:
+            calendar_ids: カレンダーIDのリスト
+            date: 対象日
+            start_time: 開始時刻 (HH:MM)
+            end_time: 終了時刻 (HH:MM)
+            timezone: タイムゾーン
+
+        Returns:
+            カレンダーIDごとのbusy枠（1件でも残っていないカレンダーがあれば None）
+        """
+        if not self.busy_cache:
+            return None
+        time_min, time_max = self._time_range(date, start_time, end_time, timezone)
+        busy_by_calendar = {}
+        for calendar_id in calendar_ids:
+            busy_slots = self.busy_cache.get_stale(calendar_id, time_min, time_max)
+            if busy_slots is None:
+                return None
+            busy_by_calendar[calendar_id] = busy_slots
+        self._overlay_ledger(busy_by_calendar, calendar_ids, time_min, time_max)
+        return busy_by_calendar
+
+    def _get_local(
+        self,
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime,
+        use_cache: bool
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """
+        Calendar API を呼ばずに返せるカレンダーのbusy枠（同期済みのミラー、なければキャッシュ）
+
+        use_cache=False（常に最新を取得する呼び出し）ではどちらも使わない
+        """
+        if not use_cache:
+            return {}
+        busy_by_calendar = {}
+        if self.calendar_mirror:
+            busy_by_calendar = self.calendar_mirror.busy_slots(calendar_ids, time_min, time_max)
+            BUSY_CACHE_LOOKUPS.inc("mirror", amount=len(busy_by_calendar))
+        busy_by_calendar.update(self._get_cached(
+            [calendar_id for calendar_id in calendar_ids if calendar_id not in busy_by_calendar],
+            time_min, time_max, self.busy_cache
+        ))
+        return busy_by_calendar
+
+    @staticmethod
+    def _get_cached(
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime,
+        cache: Optional[BusySlotCache]
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """キャッシュにあるカレンダーのbusy枠"""
+        busy_by_calendar = {}
+        if cache and calendar_ids:
+            for calendar_id in calendar_ids:
+                cached = cache.get(calendar_id, time_min, time_max)
+                if cached is not None:
+                    busy_by_calendar[calendar_id] = cached
+            BUSY_CACHE_LOOKUPS.inc("hit", amount=len(busy_by_calendar))
+            BUSY_CACHE_LOOKUPS.inc("miss", amount=len(calendar_ids) - len(busy_by_calendar))
+        return busy_by_calendar
 
-            result = self.service.freebusy().query(body=body).execute()
+    @staticmethod
+    def _freebusy_body(
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime,
+        timezone: str
+    ) -> Dict:
+        """freebusy.query のリクエスト本文（カレンダーを items にまとめる）"""
+        return {
+            "timeMin": time_min.isoformat(),
+            "timeMax": time_max.isoformat(),
+            "timeZone": timezone,
+            "items": [{"id": calendar_id} for calendar_id in calendar_ids]
+        }
+
+    @staticmethod
+    def _freebusy_flight_key(
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime,
+        timezone: str
+    ) -> Tuple:
+        """同時に実行中の freebusy.query と合流するためのキー"""
+        return tuple(sorted(calendar_ids)), time_min, time_max, timezone
+
+    @staticmethod
+    def _coalesced_result(
+        busy_by_calendar: Dict[str, List[Tuple[datetime, datetime]]],
+        shared: bool
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """合流した結果は呼び出し元ごとにリストをコピーして返す"""
+        if not shared:
+            return busy_by_calendar
+        FREEBUSY_COALESCED.inc()
+        return {calendar_id: list(busy_slots) for calendar_id, busy_slots in busy_by_calendar.items()}
+
+    def _parse_freebusy(
+        self,
+        result: Dict,
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime,
+        cache: Optional[BusySlotCache],
+        generations: Optional[Dict[str, int]] = None
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """
+        freebusy.query の結果を変換し、キャッシュに保存（前回から変わったカレンダーはカウンターを進める）
+
+        Args:
+            result: freebusy.query のレスポンス
+            calendar_ids: カレンダーIDのリスト
+            time_min: 取得範囲の開始
+            time_max: 取得範囲の終了
+            cache: 保存先キャッシュ（None の場合は保存しない）
+            generations: 問い合わせ前のカレンダーごとの世代（_cache_generations）
+
+        Returns:
+            カレンダーIDごとのbusy枠
+        """
+        busy_by_calendar = {}
+        for calendar_id in calendar_ids:
             calendar_busy = result["calendars"].get(calendar_id, {})
+            if calendar_busy.get("errors"):
+                logger.warning(
+                    "freebusy returned errors for calendar %s...: %s",
+                    calendar_id[:8], calendar_busy["errors"]
+                )
             busy_periods = calendar_busy.get("busy", [])
 
             # datetimeオブジェクトに変換
@@ -82,15 +585,77 @@ class CalendarService:
                 end = datetime.fromisoformat(period["end"].replace("Z", "+00:00"))
                 busy_slots.append((start, end))
 
-            logger.info(f"Retrieved {len(busy_slots)} busy slots for calendar {calendar_id[:8]}...")
-            return busy_slots
+            busy_by_calendar[calendar_id] = busy_slots
+            if not calendar_busy.get("errors"):
+                self.versions.observe(calendar_id, time_min, time_max, busy_slots)
+                if cache and not cache.set(
+                    calendar_id, time_min, time_max, busy_slots, (generations or {}).get(calendar_id)
+                ):
+                    logger.debug("Calendar %s... changed during freebusy, not cached", calendar_id[:8])
+
+        return busy_by_calendar
 
-        except HttpError as error:
-            logger.error(f"Calendar API error: {error}")
-            raise
-        except Exception as error:
-            logger.error(f"Unexpected error in get_busy_slots: {error}")
-            raise
+    @staticmethod
+    def _cache_generations(
+        calendar_ids: List[str],
+        cache: Optional[BusySlotCache]
+    ) -> Optional[Dict[str, int]]:
+        """freebusy.query の前に記録するカレンダーごとの世代（問い合わせ中の予約の書き込みを上書きしないため）"""
+        if not cache:
+            return None
+        return {calendar_id: cache.generation(calendar_id) for calendar_id in calendar_ids}
+
+    def _overlay_ledger(
+        self,
+        busy_by_calendar: Dict[str, List[Tuple[datetime, datetime]]],
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime
+    ):
+        """台帳で枠を押さえている予約（カレンダー未反映・反映直後）をbusy枠に重ねる"""
+        if self.booking_store:
+            for calendar_id in calendar_ids:
+                busy_by_calendar[calendar_id] = (
+                    busy_by_calendar[calendar_id]
+                    + self.booking_store.busy_slots(calendar_id, time_min, time_max)
+                )
+
+    def build_occupancy_index(
+        self,
+        busy_by_calendar: Dict[str, List[Tuple[datetime, datetime]]],
+        date: datetime,
+        start_time: str,
+        end_time: str,
+        slot_duration: int,
+        recovery_times: Mapping[str, int],
+        timezone: str = "Asia/Tokyo"
+    ) -> OccupancyIndex:
+        """
+        営業時間帯の占有ビットマスク索引を作成（カレンダーごとに1行）
+
+        Args:
+            busy_by_calendar: カレンダーIDごとのbusy枠
+            date: 対象日
+            start_time: 営業開始時刻 (HH:MM)
+            end_time: 営業終了時刻 (HH:MM)
+            slot_duration: 1枠の長さ（分）
+            recovery_times: 回復枠 {開始時刻 (HH:MM): 長さ（分）}
+            timezone: タイムゾーン
+
+        Returns:
+            占有ビットマスク索引
+        """
+        # 営業時間帯（タイムゾーン付き）
+        time_min, time_max = self._time_range(date, start_time, end_time, timezone)
+
+        # 回復枠（当日 0:00 からの差分で算出し、全行に埋まっている時間帯として重ねる）
+        day_start = time_min - timedelta(minutes=parse_hhmm(start_time))
+        recovery_slots = self._recovery_intervals(day_start, recovery_times)
+
+        index = OccupancyIndex(time_min, time_max, slot_duration, recovery_slots)
+        for calendar_id, busy_slots in busy_by_calendar.items():
+            index.add(calendar_id, busy_slots)
+        return index
 
     def generate_available_slots(
         self,
@@ -99,8 +664,9 @@ class CalendarService:
         start_time: str,
         end_time: str,
         slot_duration: int,
-        recovery_times: List[str],
-        timezone: str = "Asia/Tokyo"
+        recovery_times: Mapping[str, int],
+        timezone: str = "Asia/Tokyo",
+        duration: Optional[int] = None
     ) -> List[datetime]:
         """
         空き枠リストを生成
@@ -111,87 +677,86 @@ class CalendarService:
             start_time: 営業開始時刻 (HH:MM)
             end_time: 営業終了時刻 (HH:MM)
             slot_duration: 1枠の長さ（分）
-            recovery_times: 回復枠の時刻リスト ["12:00", "14:00"]
+            recovery_times: 回復枠 {開始時刻 (HH:MM): 長さ（分）}
             timezone: タイムゾーン
+            duration: 施術時間（分）。指定時は開始から施術終了まで空いている枠のみ返す
+                      （省略時は slot_duration）
 
         Returns:
             空き枠の開始時刻リスト
         """
-        # 全枠を生成（タイムゾーン付き）
-        tz = pytz.timezone(timezone)
-        time_min = tz.localize(datetime.combine(
-            date.date(),
-            datetime.strptime(start_time, "%H:%M").time()
-        ))
-        time_max = tz.localize(datetime.combine(
-            date.date(),
-            datetime.strptime(end_time, "%H:%M").time()
-        ))
-
-        all_slots = []
-        current = time_min
-        while current < time_max:
-            all_slots.append(current)
-            current += timedelta(minutes=slot_duration)
-
-        # 回復枠を除外（タイムゾーン付き）
-        recovery_slots = []
-        for recovery_time in recovery_times:
-            recovery_dt = tz.localize(datetime.combine(
-                date.date(),
-                datetime.strptime(recovery_time, "%H:%M").time()
-            ))
-            recovery_slots.append(recovery_dt)
-
-        # busy枠と回復枠を除外
-        available_slots = []
-        for slot in all_slots:
-            slot_end = slot + timedelta(minutes=slot_duration)
-
-            # 回復枠チェック
-            if slot in recovery_slots:
-                continue
-
-            # busy枠チェック
-            is_available = True
-            for busy_start, busy_end in busy_slots:
-                # 重複判定
-                if self._slots_overlap(
-                    (slot, slot_end),
-                    (busy_start, busy_end)
-                ):
-                    is_available = False
-                    break
-
-            if is_available:
-                available_slots.append(slot)
+        # busy枠を占有ビットマスクにしてマスク演算で判定
+        index = self.build_occupancy_index(
+            {}, date, start_time, end_time, slot_duration, recovery_times, timezone
+        )
+        available_slots = index.available_starts(
+            index.busy_row(busy_slots), duration or slot_duration
+        )
 
-        logger.info(f"Generated {len(available_slots)} available slots from {len(all_slots)} total slots")
+        logger.info("Generated %s available slots", len(available_slots))
         return available_slots
 
-    def _slots_overlap(
-        self,
-        slot1: Tuple[datetime, datetime],
-        slot2: Tuple[datetime, datetime]
-    ) -> bool:
+    @staticmethod
+    def _recovery_intervals(
+        day_start: datetime,
+        recovery_times: Mapping[str, int]
+    ) -> List[Tuple[datetime, datetime]]:
         """
-        2つの時間枠が重複しているか判定
+        回復枠を指定日の時間帯に変換
 
         Args:
-            slot1: (開始, 終了)
-            slot2: (開始, 終了)
+            day_start: 対象日の 0:00（タイムゾーン付き）
+            recovery_times: 回復枠 {開始時刻 (HH:MM): 長さ（分）}
 
         Returns:
-            重複している場合 True
+            [(開始時刻, 終了時刻), ...]
         """
-        start1, end1 = slot1
-        start2, end2 = slot2
-        return start1 < end2 and start2 < end1
+        intervals = []
+        for recovery_time, recovery_duration in recovery_times.items():
+            recovery_start = day_start + timedelta(minutes=parse_hhmm(recovery_time))
+            intervals.append((recovery_start, recovery_start + timedelta(minutes=recovery_duration)))
+        return intervals
 
-    def create_booking(
+    def _is_blocked_locally(
         self,
         calendar_id: str,
         start_time: datetime,
+        end_time: datetime,
+        recovery_times: Mapping[str, int]
+    ) -> bool:
+        """回復枠または台帳上の予約と重なるか（API 呼び出しなし）"""
+        # 回復枠チェック（開始時刻だけでなく施術時間中に回復枠が始まる場合も断る）
+        day_start = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        for recovery_start, recovery_end in self._recovery_intervals(day_start, recovery_times):
+            if start_time < recovery_end and recovery_start < end_time:
+                logger.warning(
+                    "Slot %s - %s overlaps the recovery slot %s",
+                    start_time.strftime("%H:%M"), end_time.strftime("%H:%M"), recovery_start.strftime("%H:%M")
+                )
+                return True
+
+        # 台帳チェック（ローカル）
+        if self.booking_store and self.booking_store.has_conflict(calendar_id, start_time, end_time):
+            logger.warning("Slot %s is already booked in the ledger", start_time.isoformat())
+            return True
+
+        return False
+
+    def _overlaps_busy(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        busy_slots: List[Tuple[datetime, datetime]]
+    ) -> bool:
+        """指定枠がbusy枠と重なるか（1枠の判定はタプルの比較の方が索引を作るより速い）"""
+        if any(start_time < busy_end and busy_start < end_time for busy_start, busy_end in busy_slots):
+            logger.warning("Slot %s - %s overlaps with a busy period", start_time, end_time)
+            return True
+        return False
+
+    def build_event(
+        self,
+        start_time: datetime,
         duration: int,
         customer_name: str,
         customer_phone: str,
@@ -203,10 +768,9 @@ class CalendarService:
         timezone: str = "Asia/Tokyo"
     ) -> Dict:
         """
-        予約を確定（イベント作成）
+        予約イベントの本文を作成
 
         Args:
-            calendar_id: カレンダーID
             start_time: 開始時刻
             duration: 施術時間（分）
             customer_name: 予約者名
@@ -219,10 +783,7 @@ class CalendarService:
             timezone: タイムゾーン
 
         Returns:
-            作成されたイベント情報
-
-        Raises:
-            HttpError: Calendar API エラー
+            events.insert に渡すイベント
         """
         end_time = start_time + timedelta(minutes=duration)
 
@@ -247,7 +808,7 @@ class CalendarService:
         description = "\n".join(description_lines)
 
         # イベント作成
-        event = {
+        return {
             "summary": f"【予約】{staff_name} / {service_name} / {customer_name}様",
             "location": location,
             "description": description,
@@ -265,70 +826,543 @@ class CalendarService:
             },
         }
 
+    def reserve_booking(
+        self,
+        calendar_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        event: Optional[Dict] = None
+    ) -> str:
+        """
+        予約IDを発行し、台帳に枠を記録
+
+        Args:
+            calendar_id: カレンダーID
+            start_time: 開始時刻
+            end_time: 終了時刻
+            event: イベント本文（台帳に保存し、未反映のまま再起動した場合の再登録に使う）
+
+        Returns:
+            予約ID（イベントIDとしても使用）
+
+        Raises:
+            SlotConflictError: 台帳上で既に予約済みの枠
+        """
+        # 台帳に先に記録（重複確認と書き込みを1トランザクションで行う）
+        booking_id = uuid.uuid4().hex
+        if self.booking_store and not self.booking_store.reserve(
+            booking_id, calendar_id, start_time, end_time, event
+        ):
+            raise SlotConflictError(f"Slot {start_time.isoformat()} is already booked")
+        self.versions.bump(calendar_id)
+        return booking_id
+
+    def release_booking(self, booking_id: str, calendar_id: str):
+        """
+        台帳から予約を取り消す（カレンダーに反映できなかった場合）
+
+        Args:
+            booking_id: 予約ID
+            calendar_id: カレンダーID
+        """
+        if self.booking_store:
+            self.booking_store.delete(booking_id)
+            self.versions.bump(calendar_id)
+
+    def fail_booking(self, booking_id: str, calendar_id: str):
+        """
+        カレンダーに反映できなかった予約を失敗として記録し、枠を解放する
+
+        Args:
+            booking_id: 予約ID
+            calendar_id: カレンダーID
+        """
+        if self.booking_store:
+            self.booking_store.mark_failed(booking_id)
+            self.versions.bump(calendar_id)
+
+    def confirm_booking(
+        self,
+        booking_id: str,
+        calendar_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        event_id: str
+    ):
+        """
+        カレンダー反映済みとして台帳・キャッシュを更新
+
+        Args:
+            booking_id: 予約ID
+            calendar_id: カレンダーID
+            start_time: 開始時刻
+            end_time: 終了時刻
+            event_id: 作成されたイベントID
+        """
+        if self.booking_store:
+            self.booking_store.mark_synced(booking_id, event_id)
+
+        # キャッシュ・ミラーへ即時反映（直後の空き枠取得で予約済み枠を返さない）
+        if self.busy_cache:
+            self.busy_cache.add_busy(calendar_id, start_time, end_time)
+        if self.calendar_mirror:
+            self.calendar_mirror.add_busy(calendar_id, event_id, start_time, end_time)
+        self.versions.bump(calendar_id)
+
+    def _commit_sync(self, update: MirrorUpdate, resynced: bool = False) -> int:
+        """
+        events.list の取得結果をミラーに反映（予定が変わったカレンダーはカウンターを進める）
+
+        Args:
+            update: 全ページ取得済みの MirrorUpdate
+            resynced: 同期トークンの期限切れによる全件取得か
+
+        Returns:
+            busy枠が変わった予定の件数
+        """
+        changed = update.commit()
+        mode = "resync" if resynced else "full" if update.full else "incremental"
+        CALENDAR_SYNCS.inc(mode)
+        if changed:
+            self.versions.bump(update.calendar_id)
+        logger.info(
+            "Calendar %s... synced (%s) - %s event(s), %s changed",
+            update.calendar_id[:8], mode, len(update.changes), changed
+        )
+        return changed
+
+
+class CalendarService(CalendarServiceBase):
+    """Google Calendar API操作クラス"""
+
+    def __init__(
+        self,
+        credentials: Credentials,
+        cache_ttl_seconds: float = 0,
+        cache_max_entries: int = 256,
+        booking_store: Optional[BookingStore] = None,
+        insert_batch_window_seconds: float = 0,
+        insert_batch_max_size: int = 50,
+        http_timeout_seconds: Optional[float] = None,
+        http_factory: Optional[Callable[[], Any]] = None,
+        api_endpoint: Optional[str] = None,
+        coalesce_freebusy: bool = True,
+        read_timeout_seconds: Optional[float] = None,
+        stale_max_age_seconds: float = 0,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        calendar_mirror: Optional[CalendarMirror] = None
+    ):
+        """
+        初期化
+
+        Args:
+            credentials: Google OAuth 2.0 credentials
+            cache_ttl_seconds: busy枠キャッシュの有効期間（秒）、0 以下で無効
+            cache_max_entries: busy枠キャッシュの最大エントリ数
+            booking_store: 予約台帳（指定時は予約確認・空き枠計算で台帳を優先）
+            insert_batch_window_seconds: イベント作成をバッチ化する待ち時間（秒）、0 以下で無効
+            insert_batch_max_size: 1バッチの最大件数
+            http_timeout_seconds: HTTP 通信のタイムアウト（秒）
+            http_factory: スレッドごとの HTTP クライアントを作る関数（省略時は httplib2.Http）
+            api_endpoint: Calendar API のベースURL（省略時は Google の既定値、負荷試験用のスタブ等で変更）
+            coalesce_freebusy: 同じ範囲への同時の freebusy.query を1回にまとめるか
+            read_timeout_seconds: freebusy.query のタイムアウト（秒）、省略時は http_timeout_seconds
+                                  （空き枠表示を待たせないよう予約作成より短くする）
+            stale_max_age_seconds: Calendar API 障害時に代わりに返すbusy枠の、取得からの最大経過秒数
+            circuit_breaker: Calendar API 呼び出しに使うサーキットブレーカー（None で使わない）
+            calendar_mirror: 差分同期するカレンダーのミラー（同期済みのカレンダーは freebusy.query を呼ばない）
+        """
+        super().__init__(
+            cache_ttl_seconds, cache_max_entries, booking_store, stale_max_age_seconds, circuit_breaker,
+            calendar_mirror
+        )
+        self.credentials = credentials
+        self.http_factory = http_factory or (lambda: httplib2.Http(timeout=http_timeout_seconds))
+        self.read_timeout_seconds = read_timeout_seconds
+        self.api_endpoint = api_endpoint
+
+        # httplib2 はスレッドセーフでないため、サービスオブジェクトはスレッドごとに持つ
+        # （各スレッドの接続は keep-alive で再利用される）
+        self._local = threading.local()
+        self.insert_batcher = (
+            EventInsertBatcher(
+                lambda: self.service,
+                window_seconds=insert_batch_window_seconds,
+                max_batch_size=insert_batch_max_size
+            )
+            if insert_batch_window_seconds > 0 else None
+        )
+        self.freebusy_flight = SingleFlight() if coalesce_freebusy else None
+
+    @property
+    def service(self):
+        """このスレッド専用の Calendar API サービスオブジェクト"""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self._build_service()
+        return service
+
+    @property
+    def read_service(self):
+        """このスレッド専用の、freebusy.query 用サービスオブジェクト（read_timeout_seconds を適用）"""
+        if self.read_timeout_seconds is None:
+            return self.service
+        service = getattr(self._local, "read_service", None)
+        if service is None:
+            service = self._local.read_service = self._build_service(self.read_timeout_seconds)
+        return service
+
+    def _build_service(self, timeout_seconds: Optional[float] = None):
+        """Calendar API サービスオブジェクトを作成（timeout_seconds 指定時は HTTP クライアントに設定）"""
+        http = self.http_factory()
+        if timeout_seconds is not None:
+            http.timeout = timeout_seconds
+        # Discovery ドキュメントはプロセス内で共有（ネットワーク取得・再パースなし）
+        return build_from_document(
+            load_discovery_document("calendar", "v3"),
+            http=AuthorizedHttp(self.credentials, http=http),
+            client_options={"api_endpoint": self.api_endpoint} if self.api_endpoint else None
+        )
+
+    @timed(CALENDAR_SERVICE_DURATION, "get_busy_slots")
+    def get_busy_slots(
+        self,
+        calendar_id: str,
+        date: datetime,
+        start_time: str,
+        end_time: str,
+        timezone: str = "Asia/Tokyo",
+        use_cache: bool = True
+    ) -> List[Tuple[datetime, datetime]]:
+        """
+        指定日のbusy枠を取得
+
+        Args:
+            calendar_id: カレンダーID
+            date: 対象日
+            start_time: 開始時刻 (HH:MM)
+            end_time: 終了時刻 (HH:MM)
+            timezone: タイムゾーン
+            use_cache: キャッシュを利用するか（False で常に API から取得）
+
+        Returns:
+            busy枠のリスト [(開始時刻, 終了時刻), ...]
+        """
+        busy_by_calendar = self.get_busy_slots_batch(
+            calendar_ids=[calendar_id],
+            date=date,
+            start_time=start_time,
+            end_time=end_time,
+            timezone=timezone,
+            use_cache=use_cache
+        )
+        return busy_by_calendar[calendar_id]
+
+    @timed(CALENDAR_SERVICE_DURATION, "get_busy_slots_batch")
+    def get_busy_slots_batch(
+        self,
+        calendar_ids: List[str],
+        date: datetime,
+        start_time: str,
+        end_time: str,
+        timezone: str = "Asia/Tokyo",
+        use_cache: bool = True
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """
+        複数カレンダーのbusy枠を1回の freebusy.query でまとめて取得
+
+        キャッシュにないカレンダーだけを問い合わせ、台帳上の予約を重ねて返す
+
+        Args:
+            calendar_ids: カレンダーIDのリスト
+            date: 対象日
+            start_time: 開始時刻 (HH:MM)
+            end_time: 終了時刻 (HH:MM)
+            timezone: タイムゾーン
+            use_cache: キャッシュを利用するか（False で常に API から取得）
+
+        Returns:
+            カレンダーIDごとのbusy枠 {calendar_id: [(開始時刻, 終了時刻), ...]}
+        """
+        try:
+            # 時刻範囲を作成（タイムゾーン付き）
+            time_min, time_max = self._time_range(date, start_time, end_time, timezone)
+
+            # ミラー・キャッシュ確認
+            cache = self.busy_cache if use_cache else None
+            busy_by_calendar = self._get_local(calendar_ids, time_min, time_max, use_cache)
+
+            missing_ids = [cid for cid in calendar_ids if cid not in busy_by_calendar]
+            if missing_ids:
+                if self.freebusy_flight and use_cache:
+                    # 同じ範囲を問い合わせ中のスレッドがあれば結果を共有
+                    # （常に最新を取得する呼び出しは、自分より前に始まった問い合わせには合流しない）
+                    result, shared = self.freebusy_flight.do(
+                        self._freebusy_flight_key(missing_ids, time_min, time_max, timezone),
+                        lambda: self._query_freebusy(missing_ids, time_min, time_max, timezone, cache)
+                    )
+                    busy_by_calendar.update(self._coalesced_result(result, shared))
+                else:
+                    busy_by_calendar.update(
+                        self._query_freebusy(missing_ids, time_min, time_max, timezone, cache)
+                    )
+                logger.info(
+                    "Retrieved busy slots for %s calendar(s) from API (%s cached)",
+                    len(missing_ids), len(calendar_ids) - len(missing_ids)
+                )
+            else:
+                logger.info("Busy slots served from mirror/cache for %s calendar(s)", len(calendar_ids))
+
+            self._overlay_ledger(busy_by_calendar, calendar_ids, time_min, time_max)
+            return busy_by_calendar
+
+        except HttpError as error:
+            logger.error("Calendar API error: %s", error)
+            raise
+        except Exception as error:
+            logger.error("Unexpected error in get_busy_slots: %s", error)
+            raise
+
+    @timed(CALENDAR_SERVICE_DURATION, "sync_calendar")
+    def sync_calendar(self, calendar_id: str) -> int:
+        """
+        カレンダーのミラーを events.list で同期（前回の同期トークンがあれば変更分のみ取得）
+
+        同期トークンが期限切れ（410 Gone）の場合は全件取得からやり直す
+
+        Args:
+            calendar_id: カレンダーID
+
+        Returns:
+            busy枠が変わった予定の件数
+
+        Raises:
+            HttpError: Calendar API エラー
+            CircuitOpenError: Calendar API の回路が開いている
+        """
         try:
-            created_event = self.service.events().insert(
+            return self._commit_sync(self._list_events(calendar_id))
+        except HttpError as error:
+            if error.resp.status != 410:
+                raise
+            logger.warning("Sync token expired for calendar %s..., running a full sync", calendar_id[:8])
+            self.calendar_mirror.reset(calendar_id)
+            return self._commit_sync(self._list_events(calendar_id), resynced=True)
+
+    def _list_events(self, calendar_id: str) -> MirrorUpdate:
+        """events.list の全ページを取得"""
+        update = self.calendar_mirror.begin(calendar_id)
+        page_token = None
+        while True:
+            with self._upstream_guard(), CALENDAR_API_DURATION.time("events.list"):
+                page = self.service.events().list(
+                    calendarId=calendar_id,
+                    **update.params(page_token)
+                ).execute()
+            page_token = update.add_page(page)
+            if not page_token:
+                return update
+
+    def watch_calendar(self, calendar_id: str, address: str, token: str, ttl_seconds: int) -> Dict:
+        """
+        カレンダーの変更通知チャンネルを作成（events.watch）し、ミラーに記録
+
+        Args:
+            calendar_id: カレンダーID
+            address: 通知先（HTTPS の /webhooks/calendar）
+            token: 通知に付けるトークン
+            ttl_seconds: チャンネルの有効期間（秒）
+
+        Returns:
+            作成されたチャンネル
+        """
+        with self._upstream_guard(), CALENDAR_API_DURATION.time("events.watch"):
+            channel = self.service.events().watch(
                 calendarId=calendar_id,
-                body=event
+                body=watch_request(address, token, ttl_seconds)
             ).execute()
+        self.calendar_mirror.register_channel(calendar_id, channel)
+        logger.info("Calendar %s... watch channel created, expires %s", calendar_id[:8], channel.get("expiration"))
+        return channel
+
+    def _query_freebusy(
+        self,
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime,
+        timezone: str,
+        cache: Optional[BusySlotCache]
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """
+        freebusy.query を実行し、結果をキャッシュに保存
+
+        Args:
+            calendar_ids: カレンダーIDのリスト
+            time_min: 取得範囲の開始
+            time_max: 取得範囲の終了
+            timezone: タイムゾーン
+            cache: 保存先キャッシュ（None の場合は保存しない）
+
+        Returns:
+            カレンダーIDごとのbusy枠
+        """
+        body = self._freebusy_body(calendar_ids, time_min, time_max, timezone)
+        generations = self._cache_generations(calendar_ids, cache)
+        with self._upstream_guard(), CALENDAR_API_DURATION.time("freebusy.query"):
+            result = self.read_service.freebusy().query(body=body).execute()
+        return self._parse_freebusy(result, calendar_ids, time_min, time_max, cache, generations)
+
+    @timed(CALENDAR_SERVICE_DURATION, "insert_event")
+    def insert_event(self, calendar_id: str, event: Dict, event_id: str) -> Dict:
+        """
+        イベントを作成（同じ event_id での再実行は冪等）
+
+        Args:
+            calendar_id: カレンダーID
+            event: イベント本文
+            event_id: イベントID（base32hex: 小文字 a-v と数字）
+
+        Returns:
+            作成されたイベント情報
+
+        Raises:
+            HttpError: Calendar API エラー
+            CircuitOpenError: Calendar API の回路が開いている
+        """
+        body = dict(event, id=event_id)
+        try:
+            # バッチ有効時は同時期の作成依頼とまとめて送信
+            if self.insert_batcher:
+                with self._upstream_guard():
+                    return self.insert_batcher.insert(calendar_id, body)
+            with self._upstream_guard(), CALENDAR_API_DURATION.time("events.insert"):
+                return self.service.events().insert(
+                    calendarId=calendar_id,
+                    body=body
+                ).execute()
+        except HttpError as error:
+            # 前回の試行で作成済み（レスポンスだけ失われたケース）
+            if error.resp.status == 409:
+                logger.info("Event %s already exists, treating insert as done", event_id)
+                with self._upstream_guard(), CALENDAR_API_DURATION.time("events.get"):
+                    return self.service.events().get(
+                        calendarId=calendar_id,
+                        eventId=event_id
+                    ).execute()
+            raise
+
+    @timed(CALENDAR_SERVICE_DURATION, "create_booking")
+    def create_booking(
+        self,
+        calendar_id: str,
+        start_time: datetime,
+        duration: int,
+        customer_name: str,
+        customer_phone: str,
+        staff_name: str,
+        service_name: str,
+        location: str,
+        customer_email: Optional[str] = None,
+        note: Optional[str] = None,
+        timezone: str = "Asia/Tokyo"
+    ) -> Dict:
+        """
+        予約を確定（イベント作成）
+
+        Args:
+            calendar_id: カレンダーID
+            start_time: 開始時刻
+            duration: 施術時間（分）
+            customer_name: 予約者名
+            customer_phone: 電話番号
+            staff_name: 施術者名
+            service_name: サービス名
+            location: 会場住所
+            customer_email: メールアドレス（任意）
+            note: 備考（任意）
+            timezone: タイムゾーン
+
+        Returns:
+            作成されたイベント情報
+
+        Raises:
+            SlotConflictError: 台帳上で既に予約済みの枠
+            HttpError: Calendar API エラー
+            CircuitOpenError: Calendar API の回路が開いている（台帳には記録しない）
+        """
+        self.ensure_calendar_available()
+        end_time = start_time + timedelta(minutes=duration)
+        booking_id = self.reserve_booking(calendar_id, start_time, end_time)
+
+        event = self.build_event(
+            start_time=start_time,
+            duration=duration,
+            customer_name=customer_name,
+            customer_phone=customer_phone,
+            staff_name=staff_name,
+            service_name=service_name,
+            location=location,
+            customer_email=customer_email,
+            note=note,
+            timezone=timezone
+        )
+
+        try:
+            created_event = self.insert_event(calendar_id, event, event_id=booking_id)
+            self.confirm_booking(booking_id, calendar_id, start_time, end_time, created_event["id"])
 
             logger.info(
-                f"Booking created - Staff: {staff_name}, "
-                f"Time: {start_time.isoformat()}, "
-                f"Customer: {customer_name[:2]}** (masked)"
+                "Booking created - Staff: %s, Time: %s, Customer: %s** (masked)",
+                staff_name, start_time, customer_name[:2]
             )
 
             return created_event
 
-        except HttpError as error:
-            logger.error(f"Failed to create booking: {error}")
+        except (HttpError, CircuitOpenError) as error:
+            logger.error("Failed to create booking: %s", error)
+            self.release_booking(booking_id, calendar_id)
             raise
 
+    @timed(CALENDAR_SERVICE_DURATION, "is_slot_available")
     def is_slot_available(
         self,
         calendar_id: str,
         start_time: datetime,
         duration: int,
-        recovery_times: List[str],
+        recovery_times: Mapping[str, int],
         timezone: str = "Asia/Tokyo"
     ) -> bool:
         """
         指定枠が予約可能かチェック（二重予約防止用）
 
+        台帳がある場合は台帳を先に確認して早めに断り、freebusy はキャッシュ・ミラーを使わずに問い合わせる
+        （台帳はインスタンスごとのため、他インスタンスの予約は Google 側でしか検出できない）
+
         Args:
             calendar_id: カレンダーID
             start_time: 開始時刻
             duration: 施術時間（分）
-            recovery_times: 回復枠時刻リスト
+            recovery_times: 回復枠 {開始時刻 (HH:MM): 長さ（分）}
             timezone: タイムゾーン
 
         Returns:
             予約可能な場合 True
         """
-        # 回復枠チェック
-        start_time_str = start_time.strftime("%H:%M")
-        if start_time_str in recovery_times:
-            logger.warning(f"Slot {start_time_str} is a recovery slot")
+        end_time = start_time + timedelta(minutes=duration)
+
+        # 回復枠・台帳チェック
+        if self._is_blocked_locally(calendar_id, start_time, end_time, recovery_times):
             return False
 
         # busy枠チェック
-        date = start_time
         busy_slots = self.get_busy_slots(
             calendar_id=calendar_id,
-            date=date,
+            date=start_time,
             start_time=start_time.strftime("%H:%M"),
-            end_time=(start_time + timedelta(hours=1)).strftime("%H:%M"),
-            timezone=timezone
+            end_time=end_time.strftime("%H:%M"),
+            timezone=timezone,
+            # 台帳はインスタンスごとのため、他インスタンスの予約を見落とさないよう常に最新を取得
+            use_cache=False
         )
 
-        end_time = start_time + timedelta(minutes=duration)
-        requested_slot = (start_time, end_time)
-
-        for busy_start, busy_end in busy_slots:
-            if self._slots_overlap(requested_slot, (busy_start, busy_end)):
-                logger.warning(
-                    f"Slot {start_time.isoformat()} overlaps with busy period "
-                    f"{busy_start.isoformat()} - {busy_end.isoformat()}"
-                )
-                return False
-
-        return True
+        return not self._overlaps_busy(start_time, end_time, busy_slots)
@@ -0,0 +1,544 @@
+"""
+Calendar の差分同期（メモリ上のミラー）
+各スタッフのカレンダーの予定を events.list で取得してメモリに保持し、以降は syncToken による
+差分だけを取得して反映する。同期済みのカレンダーは freebusy.query を呼ばずにbusy枠を返す
+
+- 初回（および同期トークンの期限切れ 410 Gone の後）は全件取得、以降は前回からの変更分のみ取得
+- 変更の取得は Google からのプッシュ通知（POST /webhooks/calendar）を受けて即時に行い、
+  通知が届かない場合に備えて一定間隔の差分ポーリングも行う
+- 通知チャンネル（events.watch）は期限前に作り直す（古いチャンネルは期限まで残るが、差分同期は何度行っても同じ結果になる）
+"""
+
+import hmac
+import logging
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from urllib.parse import unquote, urlparse
+
+import pytz
+
+from metrics import CALENDAR_NOTIFICATIONS
+
+logger = logging.getLogger(__name__)
+
+# events.list 1ページの最大件数（API の上限）
+LIST_PAGE_SIZE = 2500
+
+# 書き込み直後の予定を、同期で確認できるまで保持する最大秒数
+LOCAL_EVENT_MAX_AGE_SECONDS = 300
+
+# 通知の X-Goog-Resource-URI からカレンダーIDを取り出す
+RESOURCE_URI_PATTERN = re.compile(r"/calendars/([^/]+)/events")
+
+
+def parse_event_busy(event: Dict, timezone: str) -> Optional[Tuple[datetime, datetime]]:
+    """
+    予定1件のbusy枠（freebusy.query と同じく、取り消し・「予定なし」・辞退済みの予定は含めない）
+
+    Args:
+        event: events.list の items の1件
+        timezone: 終日の予定に使うカレンダーのタイムゾーン
+
+    Returns:
+        (開始, 終了)、busy として扱わない予定は None
+    """
+    if event.get("status") == "cancelled" or event.get("transparency") == "transparent":
+        return None
+    for attendee in event.get("attendees", []):
+        if attendee.get("self") and attendee.get("responseStatus") == "declined":
+            return None
+
+    start, end = event.get("start", {}), event.get("end", {})
+    if "dateTime" in start and "dateTime" in end:
+        return (
+            datetime.fromisoformat(start["dateTime"].replace("Z", "+00:00")),
+            datetime.fromisoformat(end["dateTime"].replace("Z", "+00:00"))
+        )
+    if "date" in start and "date" in end:
+        # 終日の予定（end.date はその日を含まない）
+        tz = pytz.timezone(timezone)
+        return (
+            tz.localize(datetime.strptime(start["date"], "%Y-%m-%d")),
+            tz.localize(datetime.strptime(end["date"], "%Y-%m-%d"))
+        )
+    return None
+
+
+def watch_request(address: str, token: str, ttl_seconds: int) -> Dict:
+    """
+    events.watch のリクエスト本文
+
+    Args:
+        address: 通知先（HTTPS の /webhooks/calendar）
+        token: 通知の X-Goog-Channel-Token に付く値（受信時に照合する）
+        ttl_seconds: チャンネルの有効期間（秒）
+
+    Returns:
+        リクエスト本文
+    """
+    return {
+        "id": uuid.uuid4().hex,
+        "type": "web_hook",
+        "address": address,
+        "token": token,
+        "params": {"ttl": str(int(ttl_seconds))}
+    }
+
+
+class _CalendarState:
+    """1カレンダー分のミラー"""
+
+    __slots__ = ("events", "local", "sync_token", "timezone", "synced_at", "channel_expires_at", "watch_attempted_at")
+
+    def __init__(self, timezone: str):
+        # {イベントID: (開始, 終了)}（busy として扱う予定のみ）
+        self.events: Dict[str, Tuple[datetime, datetime]] = {}
+        # このインスタンスが作成し、まだ同期で確認していない予定 {イベントID: (開始, 終了, 追加時刻)}
+        self.local: Dict[str, Tuple[datetime, datetime, float]] = {}
+        self.sync_token: Optional[str] = None
+        self.timezone = timezone
+        # 最後に同期に成功した時刻（time.monotonic()、未同期は None）
+        self.synced_at: Optional[float] = None
+        # 通知チャンネルの期限（time.time()）と、最後に作成を試みた時刻（time.monotonic()）
+        self.channel_expires_at = 0.0
+        self.watch_attempted_at: Optional[float] = None
+
+
+class MirrorUpdate:
+    """
+    1回の同期（events.list の全ページ）の取得結果
+
+    全ページを受け取ってから commit() でまとめて反映する（途中で失敗した場合はミラーを変えない）
+    """
+
+    def __init__(self, mirror: "CalendarMirror", calendar_id: str, sync_token: Optional[str], timezone: str):
+        """
+        初期化
+
+        Args:
+            mirror: 反映先のミラー
+            calendar_id: カレンダーID
+            sync_token: 前回の同期トークン（None の場合は全件取得）
+            timezone: 終日の予定に使うタイムゾーン（レスポンスにあればそちらを使う）
+        """
+        self.mirror = mirror
+        self.calendar_id = calendar_id
+        self.sync_token = sync_token
+        self.timezone = timezone
+        self.started_at = time.monotonic()
+        # {イベントID: busy枠（busy として扱わない・削除された予定は None）}
+        self.changes: Dict[str, Optional[Tuple[datetime, datetime]]] = {}
+        self.next_sync_token: Optional[str] = None
+
+    @property
+    def full(self) -> bool:
+        """全件取得か"""
+        return self.sync_token is None
+
+    def params(self, page_token: Optional[str] = None) -> Dict:
+        """
+        events.list のクエリパラメータ
+
+        差分取得（syncToken 指定時）は全件取得と同じパラメータにする必要がある
+        （timeMin 等の絞り込みは syncToken と併用できないため全期間を対象にする）
+        """
+        params = {"singleEvents": True, "maxResults": LIST_PAGE_SIZE}
+        if self.sync_token:
+            params["syncToken"] = self.sync_token
+        if page_token:
+            params["pageToken"] = page_token
+        return params
+
+    def add_page(self, page: Dict) -> Optional[str]:
+        """
+        1ページ分の結果を取り込む
+
+        Args:
+            page: events.list のレスポンス
+
+        Returns:
+            次のページのトークン（最終ページの場合は None）
+        """
+        self.timezone = page.get("timeZone", self.timezone)
+        for event in page.get("items", []):
+            self.changes[event["id"]] = parse_event_busy(event, self.timezone)
+        self.next_sync_token = page.get("nextSyncToken")
+        return page.get("nextPageToken")
+
+    def commit(self) -> int:
+        """
+        取得結果をミラーに反映
+
+        Returns:
+            busy枠が変わった予定の件数
+        """
+        return self.mirror._commit(self)
+
+
+class CalendarMirror:
+    """スタッフのカレンダーの予定（busy枠）のメモリ上の複製（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        calendar_ids: Iterable[str],
+        timezone: str = "Asia/Tokyo",
+        max_age_seconds: Optional[float] = None
+    ):
+        """
+        初期化
+
+        Args:
+            calendar_ids: 同期するカレンダーID
+            timezone: 終日の予定に使うタイムゾーン（カレンダーのタイムゾーンが分かるまでの既定値）
+            max_age_seconds: 最後の同期からこの秒数を過ぎたカレンダーはミラーから返さない
+                             （同期に失敗し続けている間は freebusy.query に戻す。None で無期限）
+        """
+        self.calendar_ids: List[str] = list(dict.fromkeys(calendar_ids))
+        self.max_age_seconds = max_age_seconds
+        self._states = {calendar_id: _CalendarState(timezone) for calendar_id in self.calendar_ids}
+        # 通知を受けて同期待ちのカレンダー
+        self._pending: Set[str] = set()
+        # {チャンネルID: カレンダーID}
+        self._channels: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def is_synced(self, calendar_id: str) -> bool:
+        """
+        ミラーからbusy枠を返せるか（同期済みで、最後の同期から max_age_seconds 以内）
+
+        Args:
+            calendar_id: カレンダーID
+        """
+        state = self._states.get(calendar_id)
+        return state is not None and self._is_fresh(state)
+
+    def _is_fresh(self, state: _CalendarState) -> bool:
+        """同期済みで、最後の同期から max_age_seconds 以内か"""
+        if state.synced_at is None:
+            return False
+        return self.max_age_seconds is None or time.monotonic() - state.synced_at <= self.max_age_seconds
+
+    def busy_slots(
+        self,
+        calendar_ids: List[str],
+        time_min: datetime,
+        time_max: datetime
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """
+        同期済みのカレンダーについて、範囲に重なるbusy枠を返す
+
+        Args:
+            calendar_ids: カレンダーIDのリスト
+            time_min: 取得範囲の開始
+            time_max: 取得範囲の終了
+
+        Returns:
+            カレンダーIDごとのbusy枠（未同期・同期が途絶えているカレンダーは含まない）
+        """
+        busy_by_calendar = {}
+        with self._lock:
+            for calendar_id in calendar_ids:
+                state = self._states.get(calendar_id)
+                if state is None or not self._is_fresh(state):
+                    continue
+                busy_slots = [
+                    (start, end) for start, end in state.events.values()
+                    if start < time_max and time_min < end
+                ]
+                busy_slots.extend(
+                    (start, end) for event_id, (start, end, _) in state.local.items()
+                    if event_id not in state.events and start < time_max and time_min < end
+                )
+                busy_slots.sort()
+                busy_by_calendar[calendar_id] = busy_slots
+        return busy_by_calendar
+
+    def add_busy(self, calendar_id: str, event_id: str, start: datetime, end: datetime):
+        """
+        このインスタンスで作成した予定を、次の同期を待たずに反映する（write-through）
+
+        Args:
+            calendar_id: カレンダーID
+            event_id: 作成したイベントID
+            start: 開始時刻
+            end: 終了時刻
+        """
+        with self._lock:
+            state = self._states.get(calendar_id)
+            if state is not None:
+                state.local[event_id] = (start, end, time.monotonic())
+
+    def begin(self, calendar_id: str) -> MirrorUpdate:
+        """
+        同期を開始（前回の同期トークンがあれば差分取得、なければ全件取得）
+
+        Args:
+            calendar_id: カレンダーID
+
+        Returns:
+            取得結果を受け取る MirrorUpdate
+        """
+        with self._lock:
+            state = self._states[calendar_id]
+            return MirrorUpdate(self, calendar_id, state.sync_token, state.timezone)
+
+    def reset(self, calendar_id: str):
+        """
+        同期トークンを破棄する（次の同期は全件取得。反映済みの予定は全件取得の完了まで返し続ける）
+
+        Args:
+            calendar_id: カレンダーID
+        """
+        with self._lock:
+            self._states[calendar_id].sync_token = None
+
+    def _commit(self, update: MirrorUpdate) -> int:
+        """MirrorUpdate の内容を反映し、busy枠が変わった予定の件数を返す"""
+        with self._lock:
+            state = self._states[update.calendar_id]
+            if update.full:
+                events = {event_id: busy for event_id, busy in update.changes.items() if busy is not None}
+                changed = sum(
+                    events.get(event_id) != state.events.get(event_id)
+                    for event_id in events.keys() | state.events.keys()
+                )
+            else:
+                events = dict(state.events)
+                changed = 0
+                for event_id, busy in update.changes.items():
+                    if busy is None:
+                        changed += events.pop(event_id, None) is not None
+                    elif events.get(event_id) != busy:
+                        events[event_id] = busy
+                        changed += 1
+
+            state.events = events
+            state.sync_token = update.next_sync_token
+            state.timezone = update.timezone
+            state.synced_at = time.monotonic()
+            # 同期開始前に作成した予定は、存在すれば今回の結果に含まれている
+            for event_id in [
+                event_id for event_id, (_, _, added_at) in state.local.items()
+                if event_id in update.changes
+                or added_at < update.started_at
+                or added_at < time.monotonic() - LOCAL_EVENT_MAX_AGE_SECONDS
+            ]:
+                del state.local[event_id]
+            return changed
+
+    def request_sync(self, calendar_id: str) -> bool:
+        """
+        カレンダーを同期待ちにする（プッシュ通知の受信時）
+
+        Args:
+            calendar_id: カレンダーID
+
+        Returns:
+            同期対象のカレンダーの場合 True
+        """
+        if calendar_id not in self._states:
+            return False
+        with self._lock:
+            self._pending.add(calendar_id)
+        return True
+
+    def take_due(self, poll: bool) -> List[str]:
+        """
+        今回同期するカレンダーを取り出す
+
+        Args:
+            poll: 定期ポーリングの時刻か（True なら全カレンダー）
+
+        Returns:
+            同期するカレンダーIDのリスト
+        """
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        if poll:
+            return list(self.calendar_ids)
+        return [calendar_id for calendar_id in self.calendar_ids if calendar_id in pending]
+
+    def register_channel(self, calendar_id: str, channel: Dict):
+        """
+        作成した通知チャンネルを記録
+
+        Args:
+            calendar_id: カレンダーID
+            channel: events.watch のレスポンス（id, resourceId, expiration）
+        """
+        with self._lock:
+            self._channels[channel["id"]] = calendar_id
+            # expiration はミリ秒の UNIX 時刻（文字列）
+            self._states[calendar_id].channel_expires_at = int(channel.get("expiration", 0)) / 1000
+
+    def channel_calendar(self, channel_id: Optional[str]) -> Optional[str]:
+        """このインスタンスが作成した通知チャンネルのカレンダーID（不明なら None）"""
+        with self._lock:
+            return self._channels.get(channel_id)
+
+    def calendars_to_watch(self, renew_before_seconds: float, retry_seconds: float) -> List[str]:
+        """
+        通知チャンネルの作成（作り直し）が必要なカレンダーを取り出す
+
+        Args:
+            renew_before_seconds: チャンネルの期限の何秒前に作り直すか
+            retry_seconds: 作成を試みてから、次に試みるまでの最短秒数（失敗時の連続呼び出しを防ぐ）
+
+        Returns:
+            カレンダーIDのリスト（取り出したカレンダーは作成を試みたものとして記録）
+        """
+        now = time.monotonic()
+        renew_at = time.time() + renew_before_seconds
+        due = []
+        with self._lock:
+            for calendar_id, state in self._states.items():
+                if state.channel_expires_at > renew_at:
+                    continue
+                if state.watch_attempted_at is not None and now - state.watch_attempted_at < retry_seconds:
+                    continue
+                state.watch_attempted_at = now
+                due.append(calendar_id)
+        return due
+
+
+def notification_calendar(
+    headers: Mapping[str, str],
+    token: str,
+    mirror: CalendarMirror
+) -> Tuple[Optional[str], int]:
+    """
+    Google Calendar のプッシュ通知から、同期するカレンダーを決める
+
+    カレンダーは X-Goog-Resource-URI から取り出す（別インスタンスが作成したチャンネルの通知も処理できる）
+
+    Args:
+        headers: 通知のリクエストヘッダー
+        token: 通知チャンネル作成時に指定したトークン
+        mirror: 同期対象のミラー
+
+    Returns:
+        (同期するカレンダーID（同期不要なら None）, 応答のステータスコード)
+    """
+    if not hmac.compare_digest(headers.get("X-Goog-Channel-Token", ""), token):
+        logger.warning("Calendar notification rejected - invalid channel token")
+        CALENDAR_NOTIFICATIONS.inc("rejected")
+        return None, 403
+
+    # sync: チャンネル作成直後の確認通知（変更はない）
+    state = headers.get("X-Goog-Resource-State")
+    if state == "sync":
+        CALENDAR_NOTIFICATIONS.inc("sync")
+        return None, 200
+
+    calendar_id = None
+    match = RESOURCE_URI_PATTERN.search(urlparse(headers.get("X-Goog-Resource-URI", "")).path)
+    if match:
+        calendar_id = unquote(match.group(1))
+    if calendar_id not in mirror.calendar_ids:
+        calendar_id = mirror.channel_calendar(headers.get("X-Goog-Channel-ID"))
+    if calendar_id is None:
+        logger.warning(
+            "Calendar notification ignored - unknown channel %s", headers.get("X-Goog-Channel-ID")
+        )
+        CALENDAR_NOTIFICATIONS.inc("ignored")
+        return None, 200
+    CALENDAR_NOTIFICATIONS.inc("accepted")
+    return calendar_id, 200
+
+
+class CalendarSyncWorker:
+    """ミラーを差分同期するバックグラウンドスレッド（同期版サーバー用）"""
+
+    def __init__(
+        self,
+        mirror: CalendarMirror,
+        sync_calendar: Callable[[str], int],
+        poll_interval_seconds: float = 60,
+        watch_calendar: Optional[Callable[[str], Dict]] = None,
+        renew_before_seconds: float = 3600,
+        on_change: Optional[Callable[[str], None]] = None
+    ):
+        """
+        初期化
+
+        Args:
+            mirror: 同期するミラー
+            sync_calendar: 1カレンダーを同期し、変わった予定の件数を返す関数
+            poll_interval_seconds: 差分ポーリングの間隔（秒）。通知が届かない変更はこの間隔で反映される
+            watch_calendar: 1カレンダーの通知チャンネルを作成する関数（None で通知を使わない）
+            renew_before_seconds: 通知チャンネルを期限の何秒前に作り直すか
+            on_change: 予定が変わったカレンダーごとに呼ぶ関数
+        """
+        self.mirror = mirror
+        self.sync_calendar = sync_calendar
+        self.poll_interval_seconds = poll_interval_seconds
+        self.watch_calendar = watch_calendar
+        self.renew_before_seconds = renew_before_seconds
+        self.on_change = on_change
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def notify(self, calendar_id: str) -> bool:
+        """
+        カレンダーをすぐに同期する（プッシュ通知の受信時）
+
+        Args:
+            calendar_id: カレンダーID
+
+        Returns:
+            同期対象のカレンダーの場合 True
+        """
+        if not self.mirror.request_sync(calendar_id):
+            return False
+        self._wake.set()
+        return True
+
+    def sync(self, calendar_id: str):
+        """1カレンダーを同期（失敗はログのみ。次の通知・ポーリングで再試行される）"""
+        try:
+            changed = self.sync_calendar(calendar_id)
+        except Exception as e:
+            logger.error("Calendar sync failed for %s...: %s", calendar_id[:8], e)
+            return
+        if changed and self.on_change:
+            self.on_change(calendar_id)
+
+    def renew_watches(self):
+        """期限が近い（または未作成の）通知チャンネルを作成"""
+        if not self.watch_calendar:
+            return
+        for calendar_id in self.mirror.calendars_to_watch(self.renew_before_seconds, self.poll_interval_seconds):
+            try:
+                self.watch_calendar(calendar_id)
+            except Exception as e:
+                logger.error("Calendar watch failed for %s...: %s", calendar_id[:8], e)
+
+    def start(self):
+        """バックグラウンド同期を開始（初回の全件取得もスレッドで行う）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="calendar-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """バックグラウンド同期を停止"""
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        """通知を待ちながら、一定間隔で全カレンダーを差分同期し続けるループ"""
+        next_poll = 0.0
+        while not self._stop.is_set():
+            poll = time.monotonic() >= next_poll
+            if poll:
+                next_poll = time.monotonic() + self.poll_interval_seconds
+            for calendar_id in self.mirror.take_due(poll):
+                self.sync(calendar_id)
+            self.renew_watches()
+
+            self._wake.wait(max(next_poll - time.monotonic(), 0))
+            self._wake.clear()
@@ -0,0 +1,148 @@
+"""
+サーキットブレーカー
+Calendar API の失敗（5xx・429・タイムアウト・通信エラー）が続いたら一定時間呼び出しを止め、
+待たずに CircuitOpenError を返す。止めている間は空き枠を最後に取得したbusy枠で返し、予約は即座に断る
+
+状態:
+    closed    通常（連続失敗が failure_threshold 回に達したら open へ）
+    open      呼び出さずに失敗（reset_timeout_seconds 経過後、次の1回を試行として通す）
+    half_open 試行中（成功で closed、失敗で再び open。試行中の他の呼び出しは失敗）
+"""
+
+import logging
+import math
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """回路が開いている（Calendar API を呼び出さずに失敗）"""
+
+    def __init__(self, retry_after: float):
+        """
+        初期化
+
+        Args:
+            retry_after: 試行を再開するまでの秒数
+        """
+        super().__init__(f"Calendar API circuit is open (retry after {math.ceil(retry_after)}s)")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """連続失敗回数で開閉するサーキットブレーカー（スレッドセーフ）"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_seconds: float = 30):
+        """
+        初期化
+
+        Args:
+            failure_threshold: 回路を開く連続失敗回数
+            reset_timeout_seconds: 回路を開いてから試行を再開するまでの秒数
+        """
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout_seconds = reset_timeout_seconds
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        """現在の状態（closed / open / half_open）"""
+        return self._state
+
+    def retry_after(self) -> float:
+        """試行を再開するまでの秒数（開いていなければ 0）"""
+        if self._state == CLOSED:
+            return 0.0
+        return max(self._opened_at + self.reset_timeout_seconds - time.monotonic(), 0.0)
+
+    def is_open(self) -> bool:
+        """呼び出しても即座に失敗する状態か（試行待ちの間、または試行中）"""
+        with self._lock:
+            if self._state == OPEN:
+                return time.monotonic() < self._opened_at + self.reset_timeout_seconds
+            return self._state == HALF_OPEN
+
+    def before_call(self):
+        """
+        呼び出し前の確認（開いていれば CircuitOpenError）
+
+        再開時刻を過ぎていれば、この呼び出しを試行として通す
+
+        Raises:
+            CircuitOpenError: 回路が開いている
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            if self._state == OPEN and time.monotonic() >= self._opened_at + self.reset_timeout_seconds:
+                self._state = HALF_OPEN
+                logger.info("Calendar API circuit half-open, sending a trial request")
+                return
+        raise CircuitOpenError(self.retry_after())
+
+    def record_success(self):
+        """呼び出し成功（試行中なら回路を閉じる）"""
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Calendar API circuit closed")
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        """呼び出し失敗（連続失敗が閾値に達したか、試行が失敗したら回路を開く）"""
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                logger.error(
+                    "Calendar API circuit opened after %s consecutive failure(s), retry in %ss",
+                    self._failures, self.reset_timeout_seconds
+                )
+
+    def abort_call(self):
+        """呼び出しが結果を出さずに中断された（試行中なら、次の呼び出しをすぐ試行として通す）"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._state = OPEN
+                self._opened_at = time.monotonic() - self.reset_timeout_seconds
+
+    @contextmanager
+    def guard(self, is_failure: Callable[[Exception], bool]) -> Iterator[None]:
+        """
+        with ブロック内の呼び出しを回路に通す（async 関数内の await にも使える）
+
+        Args:
+            is_failure: 送出された例外を失敗として数えるか（4xx など上流が正常な応答は数えない）
+
+        Raises:
+            CircuitOpenError: 回路が開いている（ブロックは実行しない）
+        """
+        self.before_call()
+        try:
+            yield
+        except Exception as error:
+            if is_failure(error):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        except BaseException:
+            # キャンセル等
+            self.abort_call()
+            raise
+        self.record_success()
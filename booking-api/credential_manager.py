@@ -0,0 +1,112 @@
+"""
+認証情報・Discovery ドキュメントの共有
+アクセストークンを期限切れ前にバックグラウンドで更新し、
+リクエスト処理中にトークン更新の待ちが発生しないようにする
+"""
+
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Optional
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery_cache import get_static_doc
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def load_discovery_document(service_name: str, version: str) -> Dict:
+    """
+    ライブラリ同梱の Discovery ドキュメントを読み込み（プロセス内で1回だけ）
+
+    Args:
+        service_name: API名（例: "calendar"）
+        version: APIバージョン（例: "v3"）
+
+    Returns:
+        パース済みの Discovery ドキュメント
+    """
+    content = get_static_doc(service_name, version)
+    if content is None:
+        raise FileNotFoundError(f"Static discovery document not found: {service_name}.{version}")
+    return json.loads(content)
+
+
+class CredentialManager:
+    """共有の OAuth 認証情報を保持し、期限前に自動更新する"""
+
+    def __init__(
+        self,
+        credentials: Credentials,
+        refresh_margin_seconds: float = 300,
+        retry_interval_seconds: float = 30
+    ):
+        """
+        初期化
+
+        Args:
+            credentials: Google OAuth 2.0 credentials
+            refresh_margin_seconds: 期限の何秒前に更新するか
+                                    （google-auth の期限判定より前に更新できる値にする）
+            retry_interval_seconds: 更新失敗時の再試行間隔（秒）
+        """
+        self.credentials = credentials
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_interval_seconds = retry_interval_seconds
+
+        # トークン更新用の HTTP セッションは使い回す
+        self._request = Request()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def needs_refresh(self) -> bool:
+        """更新が必要か（未取得・期限切れ・期限間近）"""
+        creds = self.credentials
+        if not creds.token or creds.expiry is None:
+            return not creds.valid
+        # google-auth の expiry は naive UTC
+        margin = timedelta(seconds=self.refresh_margin_seconds)
+        return datetime.utcnow() >= creds.expiry - margin
+
+    def ensure_valid(self):
+        """必要であればトークンを更新（複数スレッドから呼ばれても更新は1回）"""
+        if not self.needs_refresh():
+            return
+        with self._lock:
+            if self.needs_refresh():
+                self.credentials.refresh(self._request)
+                logger.info("Access token refreshed (expires at %s UTC)", self.credentials.expiry)
+
+    def _seconds_until_refresh(self) -> float:
+        """次回更新までの秒数"""
+        expiry = self.credentials.expiry
+        if expiry is None:
+            return self.retry_interval_seconds
+        refresh_at = expiry - timedelta(seconds=self.refresh_margin_seconds)
+        return max((refresh_at - datetime.utcnow()).total_seconds(), 0)
+
+    def start(self):
+        """トークンの初回取得とバックグラウンド更新を開始"""
+        self.ensure_valid()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="credential-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """バックグラウンド更新を停止"""
+        self._stop.set()
+
+    def _run(self):
+        """期限前に更新し続けるループ"""
+        while not self._stop.wait(self._seconds_until_refresh()):
+            try:
+                self.ensure_valid()
+            except Exception as e:
+                logger.error("Background token refresh failed: %s", e)
+                if self._stop.wait(self.retry_interval_seconds):
+                    return
@@ -100,6 +100,7 @@ echo "サービスURL: $SERVICE_URL"
 echo
 echo "エンドポイント:"
 echo "  - GET  $SERVICE_URL/health"
+echo "  - GET  $SERVICE_URL/ready"
 echo "  - GET  $SERVICE_URL/api/availability?staff=hirao_kazuko&date=2026-02-20"
 echo "  - POST $SERVICE_URL/api/book"
 echo
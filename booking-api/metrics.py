@@ -0,0 +1,268 @@
+"""
+メトリクス（Prometheus テキスト形式）
+ルート・CalendarService のメソッド・Calendar API 呼び出しごとの処理時間（ヒストグラム）と、
+busy枠キャッシュ・レート制限・予約競合の件数（カウンター）を集計し、/metrics で出力する
+
+記録は辞書参照と加算のみ（ロックはメトリクスごと）で、リクエストあたり数マイクロ秒に収まる
+（benchmarks/bench_metrics.py で計測）
+"""
+
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# 処理時間のバケット境界（秒）: キャッシュヒットの数ミリ秒から Calendar API のタイムアウトまで
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    """ラベル値のエスケープ"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """{name="value",...} 形式のラベル"""
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """数値の出力（整数は小数点なし）"""
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    """単調増加するカウンター"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        初期化
+
+        Args:
+            name: メトリクス名
+            documentation: 説明（HELP 行）
+            labelnames: ラベル名
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        """
+        加算
+
+        Args:
+            label_values: ラベル値（labelnames と同じ順）
+            amount: 加算量
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        """Prometheus テキスト形式の行"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """処理時間などの分布（バケットごとの件数と合計）"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        """
+        初期化
+
+        Args:
+            name: メトリクス名
+            documentation: 説明（HELP 行）
+            labelnames: ラベル名
+            buckets: バケットの上限値（昇順、+Inf は自動で追加）
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # {ラベル値: [バケットごとの件数（累積前、末尾は +Inf）, 合計]}
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, *label_values: str):
+        """
+        1件記録
+
+        Args:
+            value: 観測値（秒）
+            label_values: ラベル値（labelnames と同じ順）
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        """
+        with ブロックの処理時間を記録（例外で抜けた場合も記録）
+
+        Args:
+            label_values: ラベル値（labelnames と同じ順）
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self) -> List[str]:
+        """Prometheus テキスト形式の行"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_list = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for label_values, counts, total in series_list:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの登録と一括出力"""
+
+    def __init__(self):
+        """初期化"""
+        self._metrics: List = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """カウンターを作成して登録"""
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """ヒストグラムを作成して登録"""
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """登録済みの全メトリクスを Prometheus テキスト形式で出力"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def timed(histogram: Histogram, *label_values: str) -> Callable:
+    """
+    関数の処理時間を記録するデコレーター（async 関数にも対応）
+
+    Args:
+        histogram: 記録先
+        label_values: ラベル値
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, *label_values)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *label_values)
+        return wrapper
+
+    return decorator
+
+
+# プロセス共通のレジストリと、アプリケーションで使用するメトリクス
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "booking_http_request_duration_seconds",
+    "Time spent handling HTTP requests, by route template",
+    ("route", "method", "status")
+)
+CALENDAR_SERVICE_DURATION = registry.histogram(
+    "booking_calendar_service_duration_seconds",
+    "Time spent in CalendarService methods (cache, ledger and upstream calls included)",
+    ("method",)
+)
+CALENDAR_API_DURATION = registry.histogram(
+    "booking_calendar_api_duration_seconds",
+    "Time spent waiting for Google Calendar API calls",
+    ("operation",)
+)
+FREEBUSY_COALESCED = registry.counter(
+    "booking_freebusy_coalesced_total",
+    "freebusy lookups that joined an identical in-flight request instead of calling the API"
+)
+BUSY_CACHE_LOOKUPS = registry.counter(
+    "booking_busy_cache_lookups_total",
+    "Busy slot cache lookups per calendar (result=mirror when served from the synced calendar mirror)",
+    ("result",)
+)
+CALENDAR_SYNCS = registry.counter(
+    "booking_calendar_syncs_total",
+    "events.list synchronisations of the calendar mirror",
+    ("mode",)
+)
+CALENDAR_NOTIFICATIONS = registry.counter(
+    "booking_calendar_notifications_total",
+    "Calendar push notifications received on /webhooks/calendar",
+    ("result",)
+)
+RATE_LIMIT_REJECTIONS = registry.counter(
+    "booking_rate_limit_rejections_total",
+    "Requests rejected by the rate limiter",
+    ("endpoint",)
+)
+BOOKING_CONFLICTS = registry.counter(
+    "booking_conflicts_total",
+    "Booking requests rejected with 409 because the slot was taken",
+    ("reason",)
+)
@@ -0,0 +1,283 @@
+"""
+占有ビットマスク索引
+営業時間帯（イベント当日は 10:30〜16:30 の360分）を1分1ビットの整数で表し、
+スタッフごとの1行を並べた索引で空き枠・予約可否・スタッフ横断の問い合わせをビット演算で判定する
+
+- 行: ビット i が立っていれば営業開始から i 分後の1分間が埋まっている
+- 候補枠: 開始できる分（枠の間隔・営業終了）を表すマスク
+- 回復枠などの予約不可の時間帯は、全行に埋まっている分として重ねる
+- 施術時間 d の枠が置けない開始位置 = 行を 0〜d-1 ビット右シフトして OR したもの（倍々に広げて O(log d) 回）
+- 空き区間: 行の 0 ビットの連続を [開始, 終了) の昇順リストにしたもの（早い順の検索で二分探索する）
+"""
+
+from bisect import bisect_right
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from slot_engine import busy_to_offsets, to_minute_offset, ONE_MINUTE
+
+
+def interval_mask(intervals: Iterable[Tuple[int, int]], width: int) -> int:
+    """
+    分オフセットの区間を占有ビットマスクに変換（営業時間帯の外は切り捨てる）
+
+    Args:
+        intervals: [(開始, 終了), ...]（分オフセット）
+        width: 営業時間帯の長さ（分）
+
+    Returns:
+        占有ビットマスク
+    """
+    mask = 0
+    for start, end in intervals:
+        start = max(start, 0)
+        end = min(end, width)
+        if start < end:
+            mask |= ((1 << (end - start)) - 1) << start
+    return mask
+
+
+def conflict_mask(row: int, duration: int) -> int:
+    """
+    開始から duration 分の間に埋まっている分がある開始位置のマスク
+
+    Args:
+        row: 占有ビットマスク
+        duration: 施術時間（分）
+
+    Returns:
+        ビット s が立っていれば s 分後からの duration 分は空いていない
+    """
+    mask = row
+    span = 1
+    while span < duration:
+        shift = min(span, duration - span)
+        mask |= mask >> shift
+        span += shift
+    return mask
+
+
+@lru_cache(maxsize=256)
+def candidate_mask(width: int, step: int, duration: int) -> int:
+    """
+    枠の間隔ごとの開始位置のうち、施術が営業終了までに収まるもののマスク
+
+    Args:
+        width: 営業時間帯の長さ（分）
+        step: 候補枠の間隔（分）
+        duration: 施術時間（分）
+
+    Returns:
+        候補の開始位置のマスク
+    """
+    mask = 0
+    for start in range(0, width - duration + 1, step):
+        mask |= 1 << start
+    return mask
+
+
+def mask_offsets(mask: int) -> List[int]:
+    """
+    立っているビットの位置を昇順に列挙
+
+    Args:
+        mask: ビットマスク
+
+    Returns:
+        ビット位置のリスト
+    """
+    offsets = []
+    while mask:
+        lowest = mask & -mask
+        offsets.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return offsets
+
+
+class OccupancyIndex:
+    """営業時間帯の占有ビットマスク（キーごとに1行）"""
+
+    def __init__(
+        self,
+        time_min: datetime,
+        time_max: datetime,
+        step: int,
+        blocked_intervals: Iterable[Tuple[datetime, datetime]] = ()
+    ):
+        """
+        初期化
+
+        Args:
+            time_min: 営業開始（タイムゾーン付き）
+            time_max: 営業終了（タイムゾーン付き）
+            step: 候補枠の間隔（分）
+            blocked_intervals: 予約できない時間帯 [(開始時刻, 終了時刻), ...]（回復枠など、全行に重ねる）
+        """
+        self.time_min = time_min
+        self.width = to_minute_offset(time_max, time_min)
+        self.step = step
+        self.blocked = interval_mask(busy_to_offsets(blocked_intervals, time_min), self.width)
+        self.rows: Dict[str, int] = {}
+
+    def busy_row(self, busy_slots: Iterable[Tuple[datetime, datetime]]) -> int:
+        """
+        busy枠を占有ビットマスクに変換（予約できない時間帯も埋まっている分として含める）
+
+        Args:
+            busy_slots: busy枠リスト [(開始時刻, 終了時刻), ...]
+
+        Returns:
+            占有ビットマスク
+        """
+        return interval_mask(busy_to_offsets(busy_slots, self.time_min), self.width) | self.blocked
+
+    def add(self, key: str, busy_slots: Iterable[Tuple[datetime, datetime]]) -> int:
+        """
+        行を追加（同じキーは置き換える）
+
+        Args:
+            key: 行のキー（カレンダーIDなど）
+            busy_slots: busy枠リスト
+
+        Returns:
+            追加した行
+        """
+        row = self.rows[key] = self.busy_row(busy_slots)
+        return row
+
+    def offset(self, dt: datetime) -> Optional[int]:
+        """
+        時刻を営業開始からの分オフセットに変換
+
+        Args:
+            dt: 時刻
+
+        Returns:
+            分オフセット（営業時間帯の外または分の途中の場合 None）
+        """
+        delta = dt - self.time_min
+        if delta % ONE_MINUTE:
+            return None
+        offset = delta // ONE_MINUTE
+        return offset if 0 <= offset < self.width else None
+
+    def available_offsets(self, row: int, duration: int) -> List[int]:
+        """
+        施術時間 duration 分が収まる開始位置（分オフセット）
+
+        Args:
+            row: 占有ビットマスク
+            duration: 施術時間（分）
+
+        Returns:
+            開始位置の昇順リスト
+        """
+        candidates = candidate_mask(self.width, self.step, duration)
+        return mask_offsets(candidates & ~conflict_mask(row, duration))
+
+    def available_starts(self, row: int, duration: int) -> List[datetime]:
+        """
+        施術時間 duration 分が収まる開始時刻
+
+        Args:
+            row: 占有ビットマスク
+            duration: 施術時間（分）
+
+        Returns:
+            開始時刻の昇順リスト
+        """
+        return [
+            self.time_min + offset * ONE_MINUTE
+            for offset in self.available_offsets(row, duration)
+        ]
+
+    def free_minutes(self, row: int, offset: int) -> int:
+        """
+        開始位置から連続して空いている分数（営業終了まで）
+
+        Args:
+            row: 占有ビットマスク
+            offset: 開始位置（分オフセット）
+
+        Returns:
+            空いている分数（開始できない位置は 0）
+        """
+        if not 0 <= offset < self.width:
+            return 0
+        rest = row >> offset
+        if not rest:
+            return self.width - offset
+        return (rest & -rest).bit_length() - 1
+
+    def free_minutes_at(self, offset: int) -> Dict[str, int]:
+        """
+        全行について、開始位置から連続して空いている分数
+
+        Args:
+            offset: 開始位置（分オフセット）
+
+        Returns:
+            {キー: 空いている分数}
+        """
+        return {key: self.free_minutes(row, offset) for key, row in self.rows.items()}
+
+    def free_intervals(self, row: int) -> List[Tuple[int, int]]:
+        """
+        空いている区間（0 ビットの連続）を列挙
+
+        Args:
+            row: 占有ビットマスク
+
+        Returns:
+            [(開始, 終了), ...]（分オフセット、昇順・重複なし）
+        """
+        intervals = []
+        offset = 0
+        while offset < self.width:
+            rest = row >> offset
+            if not rest:
+                intervals.append((offset, self.width))
+                break
+            busy_start = offset + (rest & -rest).bit_length() - 1
+            if busy_start > offset:
+                intervals.append((offset, busy_start))
+            # 埋まっている分の連続を読み飛ばす
+            free = ~(row >> busy_start)
+            offset = busy_start + (free & -free).bit_length() - 1
+        return intervals
+
+    def iter_starts(
+        self,
+        intervals: List[Tuple[int, int]],
+        duration: int,
+        first: int = 0,
+        last: Optional[int] = None
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        空き区間から、施術時間 duration 分が収まる開始位置を早い順に返す（必要な分だけ計算する）
+
+        Args:
+            intervals: free_intervals の結果
+            duration: 施術時間（分）
+            first: この位置以降に開始する枠のみ（分オフセット）
+            last: この位置より前に開始する枠のみ（分オフセット、省略時は営業終了）
+
+        Yields:
+            (開始位置, 開始から連続して空いている分数)
+        """
+        last = self.width if last is None else min(last, self.width)
+        step = self.step
+
+        # first を含む（または first より後の最初の）空き区間から走査
+        i = max(bisect_right(intervals, (first, self.width)) - 1, 0)
+        while i < len(intervals):
+            start, end = intervals[i]
+            if start >= last:
+                return
+            i += 1
+            # 営業開始から step 分ごとの候補に切り上げ
+            offset = -(-max(start, first) // step) * step
+            while offset < last and offset + duration <= end:
+                yield offset, end - offset
+                offset += step
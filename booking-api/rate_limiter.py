@@ -1,87 +1,349 @@
 """
-シンプルなレート制限実装（インメモリ）
-本番環境ではRedisを推奨
+レート制限実装
+カウンターの保存先はバックエンドとして差し替え可能
+- InMemoryBackend: プロセス内（インスタンスごとに独立）
+- RedisBackend: Redis（複数インスタンスで共有、本番のスケールアウト時に推奨）
+
+スライディングウィンドウ・カウンター方式:
+キーごとに「現在のウィンドウの件数」と「直前のウィンドウの件数」だけを保持し、
+直前ウィンドウの件数を経過割合で按分して直近の件数を見積もる（メモリはキーあたり一定）
 """
 
+import logging
 import time
-from collections import defaultdict
-from threading import Lock
-from typing import Dict, Tuple
+from abc import ABC, abstractmethod
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Sequence, Tuple
 
+logger = logging.getLogger(__name__)
 
-class RateLimiter:
-    """IPアドレスベースのレート制限"""
+# ウィンドウ長（秒）
+MINUTE = 60
+HOUR = 3600
+
+# [(ウィンドウ長（秒）, 上限件数), ...]
+Limits = Sequence[Tuple[int, int]]
+
+
+class RateLimitBackend(ABC):
+    """レート制限カウンターの保存先（インターフェース）"""
 
-    def __init__(self, max_per_minute: int = 10, max_per_hour: int = 60):
+    @abstractmethod
+    def hit(self, key: str, limits: Limits, now: float, cost: int = 1) -> Optional[int]:
+        """
+        全ウィンドウで上限を超えなければ件数を加算する（確認と加算はアトミック）
+
+        Args:
+            key: 制限対象のキー（IPアドレスなど）
+            limits: [(ウィンドウ長（秒）, 上限件数), ...]
+            now: 現在時刻（Unix timestamp）
+            cost: このリクエストで消費する件数
+
+        Returns:
+            上限に達したウィンドウ長（秒）。許可した場合 None
+        """
+
+    @abstractmethod
+    def reset(self, key: str):
+        """特定キーのカウンターをリセット"""
+
+    @abstractmethod
+    def reset_all(self):
+        """全キーのカウンターをリセット"""
+
+
+class InMemoryBackend(RateLimitBackend):
+    """プロセス内のカウンター（ロックをストライプ化）"""
+
+    def __init__(self, stripes: int = 16, cleanup_interval: float = 300):
         """
         初期化
 
         Args:
-            max_per_minute: 1分あたりの最大リクエスト数
-            max_per_hour: 1時間あたりの最大リクエスト数
+            stripes: ロック数（キーをハッシュで振り分けて競合を減らす）
+            cleanup_interval: アイドル状態のキーを削除する間隔（秒）、0 以下で無効
         """
-        self.max_per_minute = max_per_minute
-        self.max_per_hour = max_per_hour
+        # キーごとのカウンター
+        # {key: [最終アクセス時刻, ウィンドウ番号, 件数, 直前の件数, (ウィンドウごとに繰り返し)...]}
+        self._stripes: List[Dict[str, list]] = [{} for _ in range(stripes)]
+        self._locks = [Lock() for _ in range(stripes)]
+        self._max_window = HOUR
+
+        self._stop = Event()
+        if cleanup_interval > 0:
+            Thread(
+                target=self._cleanup_loop,
+                args=(cleanup_interval,),
+                name="rate-limiter-cleanup",
+                daemon=True
+            ).start()
 
-        # IPごとのリクエスト履歴 {ip: [(timestamp, count), ...]}
-        self.minute_requests: Dict[str, list] = defaultdict(list)
-        self.hour_requests: Dict[str, list] = defaultdict(list)
+    def _stripe_index(self, key: str) -> int:
+        """キーに対応するストライプ番号"""
+        return hash(key) % len(self._stripes)
 
-        self.lock = Lock()
+    def hit(self, key: str, limits: Limits, now: float, cost: int = 1) -> Optional[int]:
+        index = self._stripe_index(key)
+        with self._locks[index]:
+            counters = self._stripes[index].get(key)
+            if counters is None:
+                counters = self._stripes[index][key] = [0.0] + [0, 0, 0] * len(limits)
+            counters[0] = now
 
-    def is_allowed(self, ip_address: str) -> Tuple[bool, str]:
+            # ウィンドウを進めて上限チェック
+            for i, (window, limit) in enumerate(limits):
+                offset = 1 + i * 3
+                self._roll(counters, offset, now, window)
+                if self._estimate(counters, offset, now, window) + cost > limit:
+                    return window
+
+            # リクエストを記録
+            for i in range(len(limits)):
+                counters[2 + i * 3] += cost
+
+            return None
+
+    @staticmethod
+    def _roll(counters: list, offset: int, now: float, window: int):
         """
-        リクエストを許可するか判定
+        現在時刻のウィンドウに合わせてカウンターを進める
 
         Args:
-            ip_address: クライアントIPアドレス
+            counters: キーごとのカウンター
+            offset: 対象ウィンドウの位置
+            now: 現在時刻（Unix timestamp）
+            window: ウィンドウ長（秒）
+        """
+        window_index = int(now // window)
+        elapsed_windows = window_index - counters[offset]
+        if elapsed_windows == 0:
+            return
+        # 1つ進んだ場合は現在の件数が直前の件数になり、2つ以上空いた場合は0
+        counters[offset + 2] = counters[offset + 1] if elapsed_windows == 1 else 0
+        counters[offset + 1] = 0
+        counters[offset] = window_index
+
+    @staticmethod
+    def _estimate(counters: list, offset: int, now: float, window: int) -> float:
+        """
+        直近 window 秒間のリクエスト数を見積もる
+
+        Args:
+            counters: キーごとのカウンター
+            offset: 対象ウィンドウの位置
+            now: 現在時刻（Unix timestamp）
+            window: ウィンドウ長（秒）
 
         Returns:
-            (許可するか, エラーメッセージ)
+            見積もり件数
         """
-        with self.lock:
-            current_time = time.time()
+        elapsed_fraction = (now % window) / window
+        return counters[offset + 2] * (1 - elapsed_fraction) + counters[offset + 1]
 
-            # 古いエントリを削除
-            self._cleanup_old_entries(ip_address, current_time)
+    def cleanup_idle(self, idle_seconds: Optional[float] = None) -> int:
+        """
+        一定時間アクセスのないキーを削除
+
+        Args:
+            idle_seconds: 最終アクセスからの経過秒数
+                          （省略時は最長ウィンドウの2倍。それだけ経てばカウンターは0と同じ）
 
-            # 1分間のリクエスト数チェック
-            minute_count = len(self.minute_requests[ip_address])
-            if minute_count >= self.max_per_minute:
-                return False, f"Rate limit exceeded: {self.max_per_minute} requests per minute"
+        Returns:
+            削除したキー数
+        """
+        if idle_seconds is None:
+            idle_seconds = 2 * self._max_window
+        threshold = time.time() - idle_seconds
+        removed = 0
+        for lock, entries in zip(self._locks, self._stripes):
+            with lock:
+                idle = [key for key, counters in entries.items() if counters[0] < threshold]
+                for key in idle:
+                    del entries[key]
+                removed += len(idle)
+        return removed
 
-            # 1時間のリクエスト数チェック
-            hour_count = len(self.hour_requests[ip_address])
-            if hour_count >= self.max_per_hour:
-                return False, f"Rate limit exceeded: {self.max_per_hour} requests per hour"
+    def _cleanup_loop(self, interval: float):
+        """アイドルキーの定期削除"""
+        while not self._stop.wait(interval):
+            self.cleanup_idle()
 
-            # リクエストを記録
-            self.minute_requests[ip_address].append(current_time)
-            self.hour_requests[ip_address].append(current_time)
+    def tracked_count(self) -> int:
+        """カウンターを保持しているキー数"""
+        return sum(len(entries) for entries in self._stripes)
 
-            return True, ""
+    def reset(self, key: str):
+        index = self._stripe_index(key)
+        with self._locks[index]:
+            self._stripes[index].pop(key, None)
 
-    def _cleanup_old_entries(self, ip_address: str, current_time: float):
+    def reset_all(self):
+        for lock, entries in zip(self._locks, self._stripes):
+            with lock:
+                entries.clear()
+
+    def stop(self):
+        """定期削除を停止"""
+        self._stop.set()
+
+
+# 全ウィンドウを確認してから加算する Lua スクリプト（1往復・アトミック）
+# KEYS: ウィンドウごとに [現在の件数キー, 直前の件数キー]
+# ARGV: [消費件数, ウィンドウごとに [上限件数, 経過割合, キーの有効期限（秒）]]
+HIT_SCRIPT = """
+local n = #KEYS / 2
+local cost = tonumber(ARGV[1])
+for i = 0, n - 1 do
+  local current = tonumber(redis.call('GET', KEYS[i * 2 + 1]) or '0')
+  local previous = tonumber(redis.call('GET', KEYS[i * 2 + 2]) or '0')
+  local limit = tonumber(ARGV[i * 3 + 2])
+  local fraction = tonumber(ARGV[i * 3 + 3])
+  if previous * (1 - fraction) + current + cost > limit then
+    return i + 1
+  end
+end
+for i = 0, n - 1 do
+  redis.call('INCRBY', KEYS[i * 2 + 1], cost)
+  redis.call('EXPIRE', KEYS[i * 2 + 1], ARGV[i * 3 + 4])
+end
+return 0
+"""
+
+
+class RedisBackend(RateLimitBackend):
+    """Redis 上のカウンター（複数インスタンスで共有）"""
+
+    def __init__(
+        self,
+        client,
+        key_prefix: str = "ratelimit",
+        local_deny_seconds: float = 1.0,
+        local_deny_max_keys: int = 10000
+    ):
         """
-        古いリクエスト記録を削除
+        初期化
 
         Args:
-            ip_address: IPアドレス
-            current_time: 現在時刻（Unix timestamp）
-        """
-        # 1分以上前のエントリを削除
-        minute_threshold = current_time - 60
-        self.minute_requests[ip_address] = [
-            t for t in self.minute_requests[ip_address]
-            if t > minute_threshold
-        ]
-
-        # 1時間以上前のエントリを削除
-        hour_threshold = current_time - 3600
-        self.hour_requests[ip_address] = [
-            t for t in self.hour_requests[ip_address]
-            if t > hour_threshold
-        ]
+            client: redis.Redis 互換のクライアント
+            key_prefix: Redis キーの接頭辞
+            local_deny_seconds: 拒否したキーをローカルで拒否し続ける秒数
+                                （連打するクライアントへの Redis 呼び出しを省く）
+            local_deny_max_keys: ローカルで保持する拒否キーの上限
+        """
+        self.client = client
+        self.key_prefix = key_prefix
+        self.local_deny_seconds = local_deny_seconds
+        self.local_deny_max_keys = local_deny_max_keys
+
+        self._script = client.register_script(HIT_SCRIPT)
+        # {key: (拒否を続ける期限, 上限に達したウィンドウ長)}
+        self._denied: Dict[str, Tuple[float, int]] = {}
+        self._denied_lock = Lock()
+
+    def _redis_key(self, key: str, window: int, window_index: int) -> str:
+        """
+        ウィンドウごとの Redis キー
+
+        {key} はハッシュタグ（Redis Cluster で同じキーのカウンターを同じスロットに置く）
+        """
+        return f"{self.key_prefix}:{{{key}}}:{window}:{window_index}"
+
+    def hit(self, key: str, limits: Limits, now: float, cost: int = 1) -> Optional[int]:
+        # ローカルの事前チェック（直前に拒否したキーは Redis に問い合わせない）
+        with self._denied_lock:
+            denied = self._denied.get(key)
+            if denied:
+                if denied[0] > now:
+                    return denied[1]
+                del self._denied[key]
+
+        keys = []
+        args = [cost]
+        for window, limit in limits:
+            window_index = int(now // window)
+            keys.append(self._redis_key(key, window, window_index))
+            keys.append(self._redis_key(key, window, window_index - 1))
+            args.extend([limit, (now % window) / window, window * 2])
+
+        try:
+            exceeded = int(self._script(keys=keys, args=args))
+        except Exception as e:
+            # Redis 障害時は予約受付を止めないよう許可する
+            logger.warning("Rate limit backend unavailable, allowing request: %s", e)
+            return None
+
+        if exceeded == 0:
+            return None
+
+        window = limits[exceeded - 1][0]
+        with self._denied_lock:
+            if len(self._denied) >= self.local_deny_max_keys:
+                self._denied.clear()
+            self._denied[key] = (now + self.local_deny_seconds, window)
+        return window
+
+    def reset(self, key: str):
+        with self._denied_lock:
+            self._denied.pop(key, None)
+        for redis_key in self.client.scan_iter(match=f"{self.key_prefix}:{{{key}}}:*"):
+            self.client.delete(redis_key)
+
+    def reset_all(self):
+        with self._denied_lock:
+            self._denied.clear()
+        for redis_key in self.client.scan_iter(match=f"{self.key_prefix}:*"):
+            self.client.delete(redis_key)
+
+
+class RateLimiter:
+    """IPアドレスベースのレート制限"""
+
+    def __init__(
+        self,
+        max_per_minute: int = 10,
+        max_per_hour: int = 60,
+        backend: Optional[RateLimitBackend] = None,
+        name: str = ""
+    ):
+        """
+        初期化
+
+        Args:
+            max_per_minute: 1分あたりの最大リクエスト数
+            max_per_hour: 1時間あたりの最大リクエスト数
+            backend: カウンターの保存先（省略時は InMemoryBackend）
+            name: ポリシー名（同じバックエンドを共有する場合のキーの区別に使用）
+        """
+        self.max_per_minute = max_per_minute
+        self.max_per_hour = max_per_hour
+        self.backend = backend or InMemoryBackend()
+        self.name = name
+
+        self._limits = ((MINUTE, max_per_minute), (HOUR, max_per_hour))
+        self._messages = {
+            MINUTE: f"Rate limit exceeded: {max_per_minute} requests per minute",
+            HOUR: f"Rate limit exceeded: {max_per_hour} requests per hour",
+        }
+
+    def _key(self, ip_address: str) -> str:
+        """バックエンドに渡すキー"""
+        return f"{self.name}:{ip_address}" if self.name else ip_address
+
+    def is_allowed(self, ip_address: str, cost: int = 1) -> Tuple[bool, str]:
+        """
+        リクエストを許可するか判定
+
+        Args:
+            ip_address: クライアントIPアドレス
+            cost: このリクエストで消費する件数
+
+        Returns:
+            (許可するか, エラーメッセージ)
+        """
+        exceeded = self.backend.hit(self._key(ip_address), self._limits, time.time(), cost)
+        if exceeded is not None:
+            return False, self._messages[exceeded]
+        return True, ""
 
     def reset(self, ip_address: str):
         """
@@ -90,12 +352,8 @@ class RateLimiter:
         Args:
             ip_address: IPアドレス
         """
-        with self.lock:
-            self.minute_requests.pop(ip_address, None)
-            self.hour_requests.pop(ip_address, None)
+        self.backend.reset(self._key(ip_address))
 
     def reset_all(self):
         """全IPのカウンターをリセット"""
-        with self.lock:
-            self.minute_requests.clear()
-            self.hour_requests.clear()
+        self.backend.reset_all()
@@ -0,0 +1,82 @@
+"""
+予約枠の仮押さえ管理（インメモリ）
+空き確認から予約確定までの間に同じ枠が二重に確保されないよう、
+カレンダー単位でアトミックに枠を押さえる
+"""
+
+import uuid
+from bisect import bisect_left, insort
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+
+class ReservationManager:
+    """カレンダーごとの占有状況を保持し、重複しない枠だけを確保する"""
+
+    def __init__(self, stripes: int = 16):
+        """
+        初期化
+
+        Args:
+            stripes: ロック数（カレンダーIDをハッシュで振り分け、異なるスタッフ同士は待たない）
+        """
+        self._locks = [Lock() for _ in range(stripes)]
+
+        # {calendar_id: [(開始, 終了, 予約トークン), ...]}（開始時刻順）
+        self._occupancy: Dict[str, List[Tuple[datetime, datetime, str]]] = {}
+
+    def _lock_for(self, calendar_id: str) -> Lock:
+        """カレンダーIDに対応するロックを取得"""
+        return self._locks[hash(calendar_id) % len(self._locks)]
+
+    def try_reserve(self, calendar_id: str, start: datetime, end: datetime) -> Optional[str]:
+        """
+        枠が空いていれば押さえる（確認と確保をアトミックに行う）
+
+        Args:
+            calendar_id: カレンダーID
+            start: 開始時刻
+            end: 終了時刻
+
+        Returns:
+            予約トークン（既に押さえられている枠と重なる場合 None）
+        """
+        with self._lock_for(calendar_id):
+            occupied = self._occupancy.setdefault(calendar_id, [])
+
+            # 開始時刻順に並んでいるため、直前の1件と以降の重なる候補だけを見ればよい
+            index = bisect_left(occupied, (start,))
+            if index > 0 and occupied[index - 1][1] > start:
+                return None
+            if index < len(occupied) and occupied[index][0] < end:
+                return None
+
+            token = uuid.uuid4().hex
+            insort(occupied, (start, end, token))
+            return token
+
+    def release(self, calendar_id: str, token: str):
+        """
+        押さえた枠を解放（確定の成否にかかわらず、確定処理の後に呼ぶ）
+
+        Args:
+            calendar_id: カレンダーID
+            token: try_reserve が返した予約トークン
+        """
+        with self._lock_for(calendar_id):
+            occupied = self._occupancy.get(calendar_id, [])
+            for index, (_, _, reserved_token) in enumerate(occupied):
+                if reserved_token == token:
+                    del occupied[index]
+                    return
+
+    def reset_all(self):
+        """全カレンダーの占有状況をリセット"""
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            self._occupancy.clear()
+        finally:
+            for lock in self._locks:
+                lock.release()
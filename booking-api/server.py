@@ -4,56 +4,115 @@
 
 import os
 import sys
-import yaml
+import threading
+import time
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-import pytz
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from google.cloud import secretmanager
-from googleapiclient.errors import HttpError
 
-from calendar_service import CalendarService
-from rate_limiter import RateLimiter
-
-# ログ設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from api_common import (
+    BOOKING_ERROR_MESSAGE,
+    CALENDAR_ERROR_MESSAGE,
+    QUEUE_FULL_MESSAGE,
+    SLOT_TAKEN_MESSAGE,
+    availability_body,
+    availability_calendar_ids,
+    availability_headers,
+    batch_body,
+    booking_details,
+    booking_response,
+    cache_headers,
+    calendar_api_endpoint,
+    calendar_unavailable,
+    calendar_webhook_settings,
+    check_not_modified,
+    client_ip,
+    create_circuit_breaker,
+    create_rate_limiters,
+    etag_matches,
+    get_credentials,
+    load_config,
+    log_booking_confirmed,
+    metrics_authorized,
+    metrics_settings,
+    parse_availability_query,
+    parse_batch_query,
+    parse_booking_request,
+    parse_search_query,
+    parse_staff_at_query,
+    revalidate_after_fetch,
+    search_body,
+    search_free_intervals,
+    stale_busy_fallback,
+    staff_at_body,
 )
-logger = logging.getLogger(__name__)
+from app_config import AppConfig
+from availability_snapshot import (
+    SSE_KEEPALIVE,
+    AvailabilitySnapshot,
+    SnapshotRefresher,
+    format_sse_event,
+    format_sse_retry,
+)
+from booking_queue import CalendarWriteQueue
+from booking_store import BookingStore
+from calendar_service import CALENDAR_UNAVAILABLE_ERRORS, CalendarService, SlotConflictError
+from calendar_sync import CalendarMirror, CalendarSyncWorker, notification_calendar
+from credential_manager import CredentialManager, load_discovery_document
+from metrics import (
+    BOOKING_CONFLICTS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    HTTP_REQUEST_DURATION,
+    RATE_LIMIT_REJECTIONS,
+    registry as metrics_registry,
+)
+from rate_limiter import RateLimiter
+from reservation import ReservationManager
+from structured_logging import setup_logging
 
 # Flask app
 app = Flask(__name__)
 
 # 設定読み込み
-with open("config.yaml", "r", encoding="utf-8") as f:
-    config = yaml.safe_load(f)
+config = load_config()
 
-# CORS設定（ワイルドカード対応）
-import re
+# ログ設定（JSON 形式、出力はキュー経由で別スレッド）
+log_listener = setup_logging(config.get("logging", {}))
+logger = logging.getLogger(__name__)
 
-def is_origin_allowed(origin):
-    """リクエストオリジンがCORS許可リストに含まれるかチェック"""
-    allowed_patterns = config["cors"]["allowed_origins"]
+# リクエストごとに変わらない値は起動時に計算しておく
+app_config = AppConfig(config)
+
+# /metrics は Bearer トークン（METRICS_TOKEN）を設定した場合のみ有効
+metrics_enabled, metrics_auth_token = metrics_settings(config.get("metrics", {}))
 
-    if not origin:
-        return False
 
-    for pattern in allowed_patterns:
-        if pattern == origin:
-            return True
-        # ワイルドカードパターンマッチング
-        if "*" in pattern:
-            regex_pattern = pattern.replace(".", r"\.").replace("*", r"[^/]+")
-            if re.match(f"^{regex_pattern}$", origin):
-                return True
+# 処理時間の計測（他のフックより先に登録し、開始は最初・記録は最後に行う）
+@app.before_request
+def start_request_timer():
+    """リクエストの開始時刻を記録"""
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_duration(response):
+    """ルート（URLテンプレート）ごとの処理時間を記録（SSE は配信開始までの時間）"""
+    started = g.get("request_started")
+    if metrics_enabled and started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - started, route, request.method, str(response.status_code)
+        )
+    return response
+
+
+def is_origin_allowed(origin):
+    """リクエストオリジンがCORS許可リストに含まれるかチェック（ワイルドカード対応）"""
+    return app_config.is_origin_allowed(origin)
 
-    return False
 
 # CORS初期化（全てのVercelドメインを許可）
 CORS(app, resources={
@@ -74,30 +133,60 @@ def check_cors_origin(response):
     # オリジンが許可リストに含まれる場合のみ、明示的に設定
     if origin and is_origin_allowed(origin):
         response.headers['Access-Control-Allow-Origin'] = origin
+        response.vary.add('Origin')  # 共有キャッシュがオリジンごとに保持するように
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
     elif origin:
         # 許可されていないオリジンの場合はログ出力
-        logger.warning(f"CORS blocked origin: {origin}")
+        logger.warning("CORS blocked origin: %s", origin)
 
     return response
 
 # レート制限
 rate_limit_config = config["rate_limit"]
-rate_limiter = RateLimiter(
-    max_per_minute=rate_limit_config["max_requests_per_minute"],
-    max_per_hour=rate_limit_config["max_requests_per_hour"]
-) if rate_limit_config["enabled"] else None
+
+
+# routes に定義のないエンドポイントは rate_limiter（既定の上限）を使用
+rate_limiter: Optional[RateLimiter]
+rate_limit_routes: Dict[str, Tuple[RateLimiter, int]]
+rate_limiter, rate_limit_routes = create_rate_limiters(rate_limit_config)
+
+# 予約枠の仮押さえ（check-then-insert の競合防止）
+reservation_manager = ReservationManager()
 
 # グローバル変数
 calendar_service: Optional[CalendarService] = None
+credential_manager: Optional[CredentialManager] = None
+calendar_write_queue: Optional[CalendarWriteQueue] = None
+availability_snapshot: Optional[AvailabilitySnapshot] = None
+snapshot_refresher: Optional[SnapshotRefresher] = None
+calendar_mirror: Optional[CalendarMirror] = None
+calendar_sync_worker: Optional[CalendarSyncWorker] = None
+
+# カレンダーの差分同期（プッシュ通知の通知先とトークン）
+sync_config = config.get("calendar_sync", {})
+webhook_address, webhook_token = calendar_webhook_settings(sync_config)
+
+# 空き枠スナップショットの配信（SSE は1接続で1スレッドを占有するため同時接続数を制限）
+snapshot_config = config.get("availability_snapshot", {})
+stream_slots = threading.BoundedSemaphore(snapshot_config.get("max_streams", 4))
+# 検索で使うスナップショットを古いとみなす、最後の全体更新からの経過秒数（更新間隔 + 1回の取得にかかりうる時間）
+snapshot_max_age_seconds = (
+    snapshot_config.get("refresh_interval_seconds", 30)
+    + (config["google_calendar"].get("read_timeout_seconds") or 0)
+)
+
+# 起動設定
+startup_config = config.get("startup", {})
+startup_mode = os.environ.get("STARTUP_MODE", startup_config.get("mode", "eager"))
+calendar_service_ready = threading.Event()
+init_lock = threading.Lock()
+init_error: Optional[str] = None
 
 
 def get_client_ip() -> str:
     """クライアントIPアドレスを取得"""
-    if request.headers.get("X-Forwarded-For"):
-        return request.headers["X-Forwarded-For"].split(",")[0].strip()
-    return request.remote_addr or "unknown"
+    return client_ip(request.headers.get("X-Forwarded-For"), request.remote_addr)
 
 
 def check_rate_limit() -> Optional[Dict]:
@@ -105,122 +194,218 @@ def check_rate_limit() -> Optional[Dict]:
     if not rate_limiter:
         return None
 
+    # エンドポイントに対応するポリシーは1回の辞書参照で決まる
+    limiter, cost = rate_limit_routes.get(request.endpoint, (rate_limiter, 1))
+
     ip_address = get_client_ip()
-    allowed, message = rate_limiter.is_allowed(ip_address)
+    allowed, message = limiter.is_allowed(ip_address, cost)
 
     if not allowed:
-        logger.warning(f"Rate limit exceeded for IP: {ip_address}")
+        logger.warning("Rate limit exceeded for IP: %s (%s)", ip_address, request.endpoint)
+        RATE_LIMIT_REJECTIONS.inc(request.endpoint or "unknown")
         return {"error": message}, 429
 
     return None
 
 
-def mask_sensitive_data(data: str, mask_type: str) -> str:
-    """個人情報をマスク"""
-    if mask_type == "phone":
-        # 090-1234-5678 → 090-****-5678
-        if len(data) > 4:
-            return data[:3] + "****" + data[-4:]
-        return "****"
-    elif mask_type == "email":
-        # test@example.com → t***@example.com
-        if "@" in data:
-            local, domain = data.split("@", 1)
-            return local[0] + "***@" + domain
-        return "***"
-    return data
+def init_calendar_service():
+    """CalendarService 初期化"""
+    global calendar_service, credential_manager, calendar_write_queue
+    global availability_snapshot, snapshot_refresher, calendar_mirror, calendar_sync_worker
+    try:
+        # 認証情報を共有し、期限前にバックグラウンドで更新
+        credential_manager = CredentialManager(
+            get_credentials(config),
+            refresh_margin_seconds=config["google_calendar"].get("token_refresh_margin_seconds", 300)
+        )
+        credential_manager.start()
+        creds = credential_manager.credentials
+
+        # Discovery ドキュメントを先に読み込んでおく（初回リクエストでの build を軽くする）
+        load_discovery_document("calendar", config["google_calendar"]["api_version"])
+
+        cache_config = config.get("cache", {})
+        store_config = config.get("booking_store", {})
+        batch_config = config.get("calendar_batch", {})
+        breaker_config = config.get("circuit_breaker", {})
+        booking_store = (
+            BookingStore(store_config["path"], store_config.get("synced_hold_seconds", 300))
+            if store_config.get("enabled") else None
+        )
+        if sync_config.get("enabled"):
+            calendar_mirror = CalendarMirror(
+                (staff["calendar_id"] for staff in app_config.staff_list),
+                app_config.timezone_name,
+                max_age_seconds=sync_config.get("max_age_seconds")
+            )
+        calendar_service = CalendarService(
+            creds,
+            cache_ttl_seconds=cache_config.get("busy_ttl_seconds", 0) if cache_config.get("enabled") else 0,
+            cache_max_entries=cache_config.get("max_entries", 256),
+            booking_store=booking_store,
+            insert_batch_window_seconds=(
+                batch_config.get("window_ms", 50) / 1000 if batch_config.get("enabled") else 0
+            ),
+            insert_batch_max_size=batch_config.get("max_size", 50),
+            http_timeout_seconds=config["google_calendar"].get("http_timeout_seconds"),
+            api_endpoint=calendar_api_endpoint(config),
+            coalesce_freebusy=cache_config.get("coalesce_freebusy", True),
+            read_timeout_seconds=config["google_calendar"].get("read_timeout_seconds"),
+            stale_max_age_seconds=breaker_config.get("stale_max_age_seconds", 0),
+            circuit_breaker=create_circuit_breaker(breaker_config),
+            calendar_mirror=calendar_mirror
+        )
+
+        # 非同期カレンダー書き込み（台帳が必要）
+        async_config = config.get("async_calendar_write", {})
+        if async_config.get("enabled"):
+            if booking_store:
+                calendar_write_queue = CalendarWriteQueue(
+                    calendar_service,
+                    max_size=async_config.get("queue_size", 100),
+                    workers=async_config.get("workers", 2),
+                    max_retries=async_config.get("max_retries", 5),
+                    retry_base_seconds=async_config.get("retry_base_seconds", 1.0),
+                    retry_max_seconds=async_config.get("retry_max_seconds", 30.0)
+                )
+                # 前回のプロセスで未反映のまま残った予約を書き込む
+                calendar_write_queue.requeue_pending()
+            else:
+                logger.warning("async_calendar_write requires booking_store, falling back to synchronous writes")
+
+        # 空き枠スナップショット（初回の生成はバックグラウンドで行う）
+        # 配信（SSE）は1接続でスレッドを1つ占有するため、同期版では sync_server を指定した場合のみ
+        if snapshot_config.get("enabled") and snapshot_config.get("sync_server", False):
+            availability_snapshot = AvailabilitySnapshot(app_config, calendar_service)
+            snapshot_refresher = SnapshotRefresher(
+                availability_snapshot,
+                fetch_busy=fetch_snapshot_busy,
+                interval_seconds=snapshot_config.get("refresh_interval_seconds", 30)
+            )
+            snapshot_refresher.start()
+
+        # カレンダーの差分同期（初回の全件取得はバックグラウンドで行い、完了までは freebusy.query を使う）
+        if calendar_mirror:
+            calendar_sync_worker = CalendarSyncWorker(
+                calendar_mirror,
+                sync_calendar=calendar_service.sync_calendar,
+                poll_interval_seconds=sync_config.get("poll_interval_seconds", 60),
+                watch_calendar=watch_calendar if webhook_address else None,
+                renew_before_seconds=sync_config.get("webhook", {}).get("renew_before_seconds", 3600),
+                on_change=on_calendar_changed
+            )
+            calendar_sync_worker.start()
+        calendar_service_ready.set()
+        logger.info("CalendarService initialized successfully")
+    except Exception as e:
+        logger.error("Failed to initialize CalendarService: %s", e)
+        raise
 
 
-def get_credentials() -> Credentials:
+def ensure_calendar_service() -> bool:
     """
-    Google OAuth 2.0 認証情報を取得
+    CalendarService の初期化を待つ（未初期化で初期化中でなければここで初期化）
 
-    開発環境: token.json から読み込み
-    本番環境: Secret Manager から refresh_token 取得
+    Returns:
+        初期化済みの場合 True
     """
-    is_development = config.get("development", {}).get("use_local_credentials", False)
+    global init_error
+    if calendar_service_ready.is_set():
+        return True
 
-    if is_development:
-        # ローカル開発環境
-        logger.info("Using local credentials (development mode)")
-        token_file = config["development"]["token_file"]
+    # 初期化中は完了を待ち、初期化中でなければ自分で初期化する
+    if not init_lock.acquire(timeout=startup_config.get("ready_wait_seconds", 10)):
+        return False
+    try:
+        if not calendar_service_ready.is_set():
+            init_calendar_service()
+            init_error = None
+    except Exception as e:
+        init_error = str(e)
+    finally:
+        init_lock.release()
+    return calendar_service_ready.is_set()
 
-        if not os.path.exists(token_file):
-            logger.error(f"Token file not found: {token_file}")
-            logger.error("Run setup_oauth.py first to generate token.json")
-            raise FileNotFoundError(f"Token file not found: {token_file}")
 
-        creds = Credentials.from_authorized_user_file(
-            token_file,
-            scopes=config["google_calendar"]["scopes"]
-        )
+def start_calendar_service(mode: str):
+    """
+    起動モードに応じて CalendarService を初期化
 
-        # トークン更新
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-
-        return creds
-
-    else:
-        # 本番環境（Secret Manager）
-        logger.info("Using Secret Manager credentials (production mode)")
-        project_id = os.environ.get("GCP_PROJECT_ID")
-
-        if not project_id:
-            raise ValueError("GCP_PROJECT_ID environment variable not set")
-
-        client = secretmanager.SecretManagerServiceClient()
-
-        # refresh_token 取得
-        refresh_token_name = config["secrets"]["refresh_token_name"]
-        refresh_token_path = f"projects/{project_id}/secrets/{refresh_token_name}/versions/latest"
-        refresh_token_response = client.access_secret_version(name=refresh_token_path)
-        refresh_token = refresh_token_response.payload.data.decode("UTF-8")
-
-        # client_secret 取得
-        client_secret_name = config["secrets"]["client_secret_name"]
-        client_secret_path = f"projects/{project_id}/secrets/{client_secret_name}/versions/latest"
-        client_secret_response = client.access_secret_version(name=client_secret_path)
-        client_secret_data = client_secret_response.payload.data.decode("UTF-8")
-
-        # client_secret は JSON 形式
-        import json
-        client_config = json.loads(client_secret_data)
-
-        # Credentials 作成
-        creds = Credentials(
-            token=None,
-            refresh_token=refresh_token,
-            token_uri=client_config["installed"]["token_uri"],
-            client_id=client_config["installed"]["client_id"],
-            client_secret=client_config["installed"]["client_secret"],
-            scopes=config["google_calendar"]["scopes"]
-        )
+    Args:
+        mode: eager / background / lazy
+    """
+    logger.info("Startup mode: %s", mode)
+    if mode == "background":
+        threading.Thread(
+            target=ensure_calendar_service,
+            name="calendar-service-init",
+            daemon=True
+        ).start()
+    elif mode != "lazy":
+        init_calendar_service()
+
+
+@app.before_request
+def require_calendar_service():
+    """API リクエストの前に CalendarService の初期化を待つ"""
+    if not request.path.startswith("/api/") or request.method == "OPTIONS":
+        return None
+    if not ensure_calendar_service():
+        return jsonify({"error": "Service is starting. Please retry shortly."}), 503, {"Retry-After": "1"}
+    return None
 
-        # トークン更新
-        creds.refresh(Request())
 
-        return creds
+def fetch_busy_slots(calendar_ids: List[str], date: datetime) -> Tuple[Dict[str, List], bool]:
+    """
+    イベント当日のbusy枠を取得（Calendar API が使えない間は最後に取得したbusy枠で代替）
 
+    Returns:
+        (カレンダーIDごとのbusy枠, 古いbusy枠で代替したか)
 
-def init_calendar_service():
-    """CalendarService 初期化"""
-    global calendar_service
+    Raises:
+        CALENDAR_UNAVAILABLE_ERRORS: Calendar API が使えず、代替できるbusy枠もない
+    """
     try:
-        creds = get_credentials()
-        calendar_service = CalendarService(creds)
-        logger.info("CalendarService initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize CalendarService: {e}")
-        raise
+        busy_by_calendar = calendar_service.get_busy_slots_batch(
+            calendar_ids=calendar_ids,
+            date=date,
+            start_time=app_config.start_time_str,
+            end_time=app_config.end_time_str,
+            timezone=app_config.timezone_name
+        )
+        return busy_by_calendar, False
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        return stale_busy_fallback(calendar_service, app_config, calendar_ids, date, e), True
 
 
-def get_staff_by_id(staff_id: str) -> Optional[Dict]:
-    """スタッフIDから施術者情報を取得"""
-    for staff in config["staff"]:
-        if staff["id"] == staff_id:
-            return staff
-    return None
+def fetch_snapshot_busy() -> Dict[str, List]:
+    """
+    スナップショット用に全カレンダーの最新のbusy枠を取得
+
+    差分同期が有効ならミラーから（Google への問い合わせなし）、無効ならキャッシュを使わずに取得する
+    """
+    return calendar_service.get_busy_slots_batch(
+        calendar_ids=availability_snapshot.calendar_ids,
+        date=availability_snapshot.date,
+        start_time=app_config.start_time_str,
+        end_time=app_config.end_time_str,
+        timezone=app_config.timezone_name,
+        use_cache=calendar_mirror is not None
+    )
+
+
+def watch_calendar(calendar_id: str) -> Dict:
+    """カレンダーの変更通知チャンネルを作成（通知先は /webhooks/calendar）"""
+    webhook_config = sync_config.get("webhook", {})
+    return calendar_service.watch_calendar(
+        calendar_id, webhook_address, webhook_token, webhook_config.get("ttl_seconds", 86400)
+    )
+
+
+def on_calendar_changed(calendar_id: str):
+    """ミラーの予定が変わった（スナップショットを次の間隔を待たずに作り直す）"""
+    if snapshot_refresher:
+        snapshot_refresher.request_refresh()
 
 
 @app.route("/health", methods=["GET"])
@@ -229,6 +414,45 @@ def health_check():
     return jsonify({"status": "ok", "service": "booking-api"}), 200
 
 
+@app.route("/ready", methods=["GET"])
+def readiness_check():
+    """レディネスチェック（CalendarService の初期化が完了しているか）"""
+    if calendar_service_ready.is_set():
+        return jsonify({"status": "ready", "startup_mode": startup_mode}), 200
+    status = "error" if init_error else "starting"
+    return jsonify({"status": status, "startup_mode": startup_mode, "error": init_error}), 503
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """メトリクス（Prometheus テキスト形式、Authorization: Bearer <METRICS_TOKEN> が必要）"""
+    if not metrics_enabled:
+        return jsonify({"error": "Endpoint not found"}), 404
+    if not metrics_authorized(request.headers.get("Authorization"), metrics_auth_token):
+        return jsonify({"error": "Unauthorized"}), 401, {"WWW-Authenticate": "Bearer"}
+    return Response(metrics_registry.render(), status=200, content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/webhooks/calendar", methods=["POST"])
+def calendar_webhook():
+    """
+    Google Calendar のプッシュ通知（events.watch の通知先）
+
+    本文はなく、ヘッダー（X-Goog-Channel-Token・X-Goog-Resource-State・X-Goog-Resource-URI）で
+    変更のあったカレンダーが分かる。同期はバックグラウンドで行い、すぐに応答する
+    """
+    if not sync_config.get("enabled"):
+        return jsonify({"error": "Endpoint not found"}), 404
+    if not calendar_sync_worker:
+        # 初期化前（Google は 503 を時間をおいて再送する）
+        return "", 503, {"Retry-After": "1"}
+
+    calendar_id, status = notification_calendar(request.headers, webhook_token, calendar_mirror)
+    if calendar_id:
+        calendar_sync_worker.notify(calendar_id)
+    return "", status
+
+
 @app.route("/api/availability", methods=["GET"])
 def get_availability():
     """
@@ -237,14 +461,19 @@ def get_availability():
     Query Parameters:
         staff: スタッフID（必須）
         date: 日付 YYYY-MM-DD（任意、デフォルトはイベント日）
+        menu: メニュー名（任意、指定時はメニューの施術時間が収まる枠のみ返す）
 
     Returns:
         {
             "staff": {...},
             "date": "2026-02-20",
             "available_slots": ["10:30", "10:45", ...],
-            "timezone": "Asia/Tokyo"
+            "duration": 15,
+            "timezone": "Asia/Tokyo",
+            "stale": false
         }
+        ETag 付きで返し、If-None-Match が一致する場合は 304
+        Calendar API が使えない間は最後に取得したbusy枠から作り、"stale": true（キャッシュ不可）で返す
     """
     # レート制限チェック
     rate_limit_error = check_rate_limit()
@@ -252,85 +481,321 @@ def get_availability():
         return rate_limit_error
 
     try:
-        # パラメータ取得
-        staff_id = request.args.get("staff")
-        date_str = request.args.get("date", config["event"]["date"])
+        # パラメータ取得・検証
+        params, error = parse_availability_query(app_config, request.args)
+        if error:
+            return error
+        calendar_ids = [params["staff"]["calendar_id"]]
+        variant = str(params["duration"])
+
+        if_none_match = request.headers.get("If-None-Match")
+        etag, not_modified = check_not_modified(
+            calendar_service, app_config, calendar_ids, params["date"], variant, if_none_match
+        )
+        if not_modified:
+            return not_modified
 
-        if not staff_id:
-            return jsonify({"error": "staff parameter is required"}), 400
+        busy_by_calendar, stale = fetch_busy_slots(calendar_ids, params["date"])
+        not_modified = revalidate_after_fetch(
+            calendar_service, app_config, calendar_ids, variant, if_none_match, stale
+        )
+        if not_modified:
+            return not_modified
 
-        # スタッフ情報取得
-        staff = get_staff_by_id(staff_id)
-        if not staff:
-            return jsonify({"error": f"Staff not found: {staff_id}"}), 404
+        body = availability_body(calendar_service, app_config, params, busy_by_calendar, stale)
+        return jsonify(body), 200, availability_headers(app_config, etag, stale)
 
-        # 日付パース
-        try:
-            date = datetime.strptime(date_str, "%Y-%m-%d")
-        except ValueError:
-            return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
-
-        # イベント日チェック
-        event_date_str = config["event"]["date"]
-        if date_str != event_date_str:
-            return jsonify({"error": f"Bookings only available for {event_date_str}"}), 400
-
-        # busy枠取得
-        calendar_id = staff["calendar_id"]
-        start_time = config["event"]["start_time"]
-        end_time = config["event"]["end_time"]
-        timezone = config["event"]["timezone"]
-
-        busy_slots = calendar_service.get_busy_slots(
-            calendar_id=calendar_id,
-            date=date,
-            start_time=start_time,
-            end_time=end_time,
-            timezone=timezone
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, CALENDAR_ERROR_MESSAGE)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error("Unexpected error in get_availability: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route("/api/availability/batch", methods=["GET"])
+def get_availability_batch():
+    """
+    複数スタッフの空き枠一括取得API（freebusy.query 1回）
+
+    Query Parameters:
+        staff: カンマ区切りのスタッフID（任意、省略時は全スタッフ）
+        date: 日付 YYYY-MM-DD（任意、デフォルトはイベント日）
+
+    Returns:
+        {
+            "date": "2026-02-20",
+            "timezone": "Asia/Tokyo",
+            "results": [
+                {"staff": {...}, "available_slots": ["10:30", ...]},
+                ...
+            ],
+            "stale": false
+        }
+        ETag 付きで返し、If-None-Match が一致する場合は 304（stale は get_availability と同じ）
+    """
+    # レート制限チェック（スタッフ数に関わらず1回）
+    rate_limit_error = check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    try:
+        # パラメータ取得・検証
+        params, error = parse_batch_query(app_config, request.args)
+        if error:
+            return error
+        calendar_ids = availability_calendar_ids(params["staff_list"])
+
+        if_none_match = request.headers.get("If-None-Match")
+        etag, not_modified = check_not_modified(
+            calendar_service, app_config, calendar_ids, params["date"], "", if_none_match
         )
+        if not_modified:
+            return not_modified
 
-        # 回復枠時刻リスト
-        recovery_times = [slot["time"] for slot in config["recovery_slots"]]
+        # busy枠を一括取得
+        busy_by_calendar, stale = fetch_busy_slots(calendar_ids, params["date"])
+        not_modified = revalidate_after_fetch(
+            calendar_service, app_config, calendar_ids, "", if_none_match, stale
+        )
+        if not_modified:
+            return not_modified
 
-        # 空き枠生成
-        available_slots_dt = calendar_service.generate_available_slots(
-            busy_slots=busy_slots,
-            date=date,
-            start_time=start_time,
-            end_time=end_time,
-            slot_duration=config["booking"]["slot_duration"],
-            recovery_times=recovery_times,
-            timezone=timezone
+        body = batch_body(calendar_service, app_config, params, busy_by_calendar, stale)
+        return jsonify(body), 200, availability_headers(app_config, etag, stale)
+
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, CALENDAR_ERROR_MESSAGE)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error("Unexpected error in get_availability_batch: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route("/api/availability/at", methods=["GET"])
+def get_availability_at():
+    """
+    指定時刻に施術できるスタッフの検索API（freebusy.query 1回）
+
+    Query Parameters:
+        time: 開始時刻 HH:MM（必須）
+        duration: 施術時間（分、任意、デフォルトは1枠の長さ）
+        date: 日付 YYYY-MM-DD（任意、デフォルトはイベント日）
+
+    Returns:
+        {
+            "date": "2026-02-20",
+            "time": "13:15",
+            "duration": 30,
+            "timezone": "Asia/Tokyo",
+            "results": [
+                {"staff": {...}, "free_minutes": 45, "menus": ["グラデーションジェルネイル", ...]},
+                ...
+            ],
+            "stale": false
+        }
+        free_minutes は開始時刻から連続して空いている分数、menus はそこに収まるメニュー
+        ETag 付きで返し、If-None-Match が一致する場合は 304（stale は get_availability と同じ）
+    """
+    # レート制限チェック
+    rate_limit_error = check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    try:
+        # パラメータ取得・検証
+        params, error = parse_staff_at_query(app_config, request.args)
+        if error:
+            return error
+        calendar_ids = availability_calendar_ids(app_config.staff_list)
+        variant = f"{params['time_str']}/{params['duration']}"
+
+        if_none_match = request.headers.get("If-None-Match")
+        etag, not_modified = check_not_modified(
+            calendar_service, app_config, calendar_ids, params["date"], variant, if_none_match
+        )
+        if not_modified:
+            return not_modified
+
+        busy_by_calendar, stale = fetch_busy_slots(calendar_ids, params["date"])
+        not_modified = revalidate_after_fetch(
+            calendar_service, app_config, calendar_ids, variant, if_none_match, stale
         )
+        if not_modified:
+            return not_modified
+
+        body = staff_at_body(calendar_service, app_config, params, busy_by_calendar, stale)
+        return jsonify(body), 200, availability_headers(app_config, etag, stale)
+
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, CALENDAR_ERROR_MESSAGE)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error("Unexpected error in get_availability_at: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
 
-        # 時刻文字列に変換
-        available_slots = [dt.strftime("%H:%M") for dt in available_slots_dt]
 
-        logger.info(
-            f"Availability requested - Staff: {staff['name']}, "
-            f"Date: {date_str}, Available: {len(available_slots)} slots"
+@app.route("/api/availability/search", methods=["GET"])
+def search_availability():
+    """
+    早い順の空き枠検索API（サービス・メニューを受けられるスタッフ横断）
+
+    Query Parameters:
+        service: サービス名（カンマ区切りで複数可。例: ドライヘッド,ネイル）
+        menu: メニュー名（カンマ区切りで複数可）※ service か menu のどちらかは必須
+        from: 検索開始時刻 HH:MM（任意、デフォルトは営業開始）
+        to: 検索終了時刻 HH:MM（任意、この時刻より前に始まる枠のみ。デフォルトは営業終了）
+        limit: 件数（任意、デフォルト 5、最大 50）
+        date: 日付 YYYY-MM-DD（任意、デフォルトはイベント日）
+
+    Returns:
+        {
+            "date": "2026-02-20",
+            "timezone": "Asia/Tokyo",
+            "from": "10:30",
+            "to": "16:30",
+            "results": [
+                {"staff": {...}, "start": "10:30", "free_minutes": 90, "menus": ["ハンドマッサージ", ...]},
+                ...
+            ],
+            "stale": false
+        }
+        開始時刻の早い順（同時刻は設定のスタッフ順）。menus は開始から空いている時間に収まる対象メニュー
+        空き区間はスナップショットと同時に作成済みのものを使う（スナップショットが無効・未生成の間は freebusy から作る）
+        スナップショットの全体更新が更新間隔（+ 読み取りタイムアウト）を過ぎても成功していない・Calendar API の回路が
+        開いている間は "stale": true（キャッシュ不可）で返す
+    """
+    # レート制限チェック
+    rate_limit_error = check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    try:
+        # パラメータ取得・検証
+        params, error = parse_search_query(app_config, request.args)
+        if error:
+            return error
+
+        index, free_by_staff = (
+            availability_snapshot.free_intervals() if availability_snapshot else (None, {})
         )
+        if index is not None:
+            # 全体更新が止まっている・Calendar API の回路が開いている間は古い可能性がある
+            stale = availability_snapshot.is_stale(snapshot_max_age_seconds)
+        else:
+            # スナップショットが無効・未生成の間は freebusy（キャッシュ）から作る
+            staff_list = [staff for staff, _ in params["candidates"]]
+            busy_by_calendar, stale = fetch_busy_slots(
+                availability_calendar_ids(staff_list), params["date"]
+            )
+            index, free_by_staff = search_free_intervals(
+                calendar_service, app_config, staff_list, params["date"], busy_by_calendar
+            )
+
+        body = search_body(app_config, params, index, free_by_staff, stale)
+        return jsonify(body), 200, availability_headers(app_config, None, stale)
 
-        return jsonify({
-            "staff": {
-                "id": staff["id"],
-                "name": staff["name"],
-                "service": staff["service"],
-                "menus": staff["menus"]
-            },
-            "date": date_str,
-            "available_slots": available_slots,
-            "timezone": timezone
-        }), 200
-
-    except HttpError as e:
-        logger.error(f"Google Calendar API error: {e}")
-        return jsonify({"error": "Calendar service error"}), 503
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, CALENDAR_ERROR_MESSAGE)
+        return jsonify(body), status, headers
     except Exception as e:
-        logger.error(f"Unexpected error in get_availability: {e}")
+        logger.error("Unexpected error in search_availability: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route("/api/availability/snapshot", methods=["GET"])
+def get_availability_snapshot():
+    """
+    全スタッフ・全メニューの空き枠（事前生成済み）
+
+    Returns:
+        {
+            "date": "2026-02-20",
+            "timezone": "Asia/Tokyo",
+            "results": [
+                {
+                    "staff": {...},
+                    "available_slots": ["10:30", ...],
+                    "menus": {"ドライヘッドスパ": ["10:30", ...], ...}
+                },
+                ...
+            ]
+        }
+        ETag 付きで返し、If-None-Match が一致する場合は 304
+    """
+    # レート制限チェック
+    rate_limit_error = check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    if not availability_snapshot:
+        return jsonify({"error": "Availability snapshot is not enabled"}), 404
+
+    body, etag = availability_snapshot.get()
+    if body is None:
+        return jsonify({"error": "Availability snapshot is being prepared. Please retry shortly."}), 503, {"Retry-After": "1"}
+
+    headers = cache_headers(app_config, etag)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return "", 304, headers
+    return Response(body, status=200, mimetype="application/json", headers=headers)
+
+
+@app.route("/api/availability/stream", methods=["GET"])
+def stream_availability():
+    """
+    空き枠スナップショットの配信（Server-Sent Events）
+
+    接続時と内容が変わるたびに "snapshot" イベント（data は /api/availability/snapshot と同じ JSON、
+    id は ETag）を送る。stream_max_seconds で切断し、ブラウザの EventSource が自動で再接続する
+    （Last-Event-ID が最新と一致する場合、接続時のイベントは省略）
+    """
+    # レート制限チェック
+    rate_limit_error = check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    if not availability_snapshot:
+        return jsonify({"error": "Availability snapshot is not enabled"}), 404
+
+    if not stream_slots.acquire(blocking=False):
+        logger.warning("Availability stream rejected - too many open streams")
+        return jsonify({"error": "Too many open streams. Please retry shortly."}), 503, {"Retry-After": "10"}
+
+    snapshot = availability_snapshot
+    last_event_id = request.headers.get("Last-Event-ID")
+    keepalive_seconds = snapshot_config.get("stream_keepalive_seconds", 15)
+    deadline = time.monotonic() + snapshot_config.get("stream_max_seconds", 50)
+
+    def generate():
+        yield format_sse_retry(snapshot_config.get("stream_retry_ms", 3000))
+        sent_etag = last_event_id
+        while True:
+            version = snapshot.version
+            body, etag = snapshot.get()
+            if body is not None and etag != sent_etag:
+                yield format_sse_event(body, etag)
+                sent_etag = etag
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if snapshot.wait_for_change(version, min(keepalive_seconds, remaining)) == version:
+                yield SSE_KEEPALIVE
+
+    response = Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # プロキシでのバッファリングを無効化
+    })
+    # 切断時（ジェネレーター終了時）に接続枠を返す
+    response.call_on_close(stream_slots.release)
+    return response
+
+
 @app.route("/api/book", methods=["POST"])
 def create_booking():
     """
@@ -350,10 +815,14 @@ def create_booking():
     Returns:
         {
             "success": true,
-            "event_id": "...",
+            "booking_id": "...",
+            "event_id": "..." (非同期モードでは null),
+            "status": "synced" | "pending",
             "message": "予約が完了しました",
             "booking": {...}
         }
+        非同期モード（async_calendar_write.enabled）では 202 で即時に応答し、
+        カレンダー登録の完了は GET /api/book/<booking_id> で確認する
     """
     # レート制限チェック
     rate_limit_error = check_rate_limit()
@@ -361,124 +830,125 @@ def create_booking():
         return rate_limit_error
 
     try:
-        data = request.get_json()
-
-        # バリデーション
-        required_fields = ["staff", "start", "menu", "name", "phone"]
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Missing required field: {field}"}), 400
-
-        staff_id = data["staff"]
-        start_str = data["start"]
-        menu_name = data["menu"]
-        customer_name = data["name"]
-        customer_phone = data["phone"]
-        customer_email = data.get("email")
-        note = data.get("note")
-
-        # スタッフ情報取得
-        staff = get_staff_by_id(staff_id)
-        if not staff:
-            return jsonify({"error": f"Staff not found: {staff_id}"}), 404
-
-        # メニュー情報取得
-        menu = None
-        for m in staff["menus"]:
-            if m["name"] == menu_name:
-                menu = m
-                break
-
-        if not menu:
-            return jsonify({"error": f"Menu not found: {menu_name}"}), 404
-
-        # 開始時刻パース（タイムゾーン付き）
-        timezone = config["event"]["timezone"]
-        try:
-            # naive datetime をパース
-            start_time_naive = datetime.fromisoformat(start_str)
-            # タイムゾーンを付与
-            tz = pytz.timezone(timezone)
-            start_time = tz.localize(start_time_naive)
-        except ValueError:
-            return jsonify({"error": "Invalid start time format"}), 400
-
-        # イベント日チェック
-        event_date_str = config["event"]["date"]
-        if start_time.strftime("%Y-%m-%d") != event_date_str:
-            return jsonify({"error": f"Bookings only available for {event_date_str}"}), 400
-
-        # 回復枠時刻リスト
-        recovery_times = [slot["time"] for slot in config["recovery_slots"]]
+        # リクエスト本文の検証
+        booking, error = parse_booking_request(app_config, request.get_json(silent=True))
+        if error:
+            return error
+        staff = booking["staff"]
+        start_str = booking["start_str"]
+        start_time = booking["start_time"]
+        end_time = booking["end_time"]
+
+        # Calendar API の回路が開いている間は待たずに断る
+        calendar_service.ensure_calendar_available()
 
         # 二重予約チェック
-        calendar_id = staff["calendar_id"]
-        duration = menu["duration"]
-
-        is_available = calendar_service.is_slot_available(
-            calendar_id=calendar_id,
-            start_time=start_time,
-            duration=duration,
-            recovery_times=recovery_times,
-            timezone=timezone
-        )
+        calendar_id = booking["calendar_id"]
 
-        if not is_available:
+        # 枠を仮押さえ（同じスタッフへの同時リクエストは1件だけが先へ進む）
+        reservation = reservation_manager.try_reserve(calendar_id, start_time, end_time)
+        if reservation is None:
             logger.warning(
-                f"Booking failed - Slot already taken - "
-                f"Staff: {staff['name']}, Time: {start_str}"
+                "Booking failed - Slot is being reserved - Staff: %s, Time: %s", staff["name"], start_str
             )
-            return jsonify({
-                "error": "この時間枠は既に予約されています。別の時間をお選びください。"
-            }), 409  # Conflict
-
-        # 予約確定
-        event = calendar_service.create_booking(
-            calendar_id=calendar_id,
-            start_time=start_time,
-            duration=duration,
-            customer_name=customer_name,
-            customer_phone=customer_phone,
-            staff_name=staff["name"],
-            service_name=menu_name,
-            location=config["event"]["location"],
-            customer_email=customer_email,
-            note=note,
-            timezone=timezone
-        )
+            BOOKING_CONFLICTS.inc("reserving")
+            return jsonify({"error": SLOT_TAKEN_MESSAGE}), 409  # Conflict
+
+        try:
+            is_available = calendar_service.is_slot_available(
+                calendar_id=calendar_id,
+                start_time=start_time,
+                duration=booking["duration"],
+                recovery_times=app_config.recovery_times,
+                timezone=app_config.timezone_name
+            )
+
+            if not is_available:
+                logger.warning(
+                    "Booking failed - Slot already taken - Staff: %s, Time: %s", staff["name"], start_str
+                )
+                BOOKING_CONFLICTS.inc("calendar")
+                return jsonify({"error": SLOT_TAKEN_MESSAGE}), 409  # Conflict
+
+            details = booking_details(app_config, booking)
+
+            if calendar_write_queue:
+                # 台帳に記録して即応答（カレンダー登録はバックグラウンドで実行）
+                event = calendar_service.build_event(**details)
+                booking_id = calendar_service.reserve_booking(calendar_id, start_time, end_time, event)
+
+                if not calendar_write_queue.submit(booking_id, calendar_id, event, start_time, end_time):
+                    calendar_service.release_booking(booking_id, calendar_id)
+                    return jsonify({"error": QUEUE_FULL_MESSAGE}), 503
+
+                event_id = None
+                status = "pending"
+                status_code = 202  # Accepted
+            else:
+                # 予約確定
+                event = calendar_service.create_booking(calendar_id=calendar_id, **details)
+                booking_id = event["id"]
+                event_id = event["id"]
+                status = "synced"
+                status_code = 200
+        finally:
+            # 仮押さえは確定（台帳・カレンダーへの記録）までの間だけ。以降の重複は台帳と freebusy で検出する
+            reservation_manager.release(calendar_id, reservation)
+
+        # スナップショットは予約したスタッフの分だけ再計算（SSE で配信される）
+        if availability_snapshot:
+            availability_snapshot.add_busy(calendar_id, start_time, end_time)
 
         # マスク処理してログ
-        masked_phone = mask_sensitive_data(customer_phone, "phone")
-        masked_email = mask_sensitive_data(customer_email, "email") if customer_email else None
+        log_booking_confirmed(booking)
 
-        logger.info(
-            f"Booking confirmed - Staff: {staff['name']}, "
-            f"Time: {start_str}, Menu: {menu_name}, "
-            f"Customer: {customer_name[:2]}**, Phone: {masked_phone}"
-        )
+        return jsonify(booking_response(app_config, booking, booking_id, event_id, status)), status_code
 
-        return jsonify({
-            "success": True,
-            "event_id": event["id"],
-            "message": "予約が完了しました",
-            "booking": {
-                "staff": staff["name"],
-                "service": staff["service"],
-                "menu": menu_name,
-                "date": start_time.strftime("%Y年%m月%d日"),
-                "time": start_time.strftime("%H:%M"),
-                "duration": duration,
-                "location": config["event"]["location"],
-                "customer_name": customer_name
-            }
-        }), 200
-
-    except HttpError as e:
-        logger.error(f"Google Calendar API error: {e}")
-        return jsonify({"error": "予約処理中にエラーが発生しました"}), 503
+    except SlotConflictError:
+        logger.warning(
+            "Booking failed - Slot already taken (ledger) - Staff: %s, Time: %s", staff["name"], start_str
+        )
+        BOOKING_CONFLICTS.inc("ledger")
+        return jsonify({"error": SLOT_TAKEN_MESSAGE}), 409  # Conflict
+    except CALENDAR_UNAVAILABLE_ERRORS as e:
+        logger.error("Google Calendar API error: %s", e)
+        body, status, headers = calendar_unavailable(e, BOOKING_ERROR_MESSAGE)
+        return jsonify(body), status, headers
     except Exception as e:
-        logger.error(f"Unexpected error in create_booking: {e}")
-        return jsonify({"error": "予約処理中にエラーが発生しました"}), 500
+        logger.error("Unexpected error in create_booking: %s", e)
+        return jsonify({"error": BOOKING_ERROR_MESSAGE}), 500
+
+
+@app.route("/api/book/<booking_id>", methods=["GET"])
+def get_booking_status(booking_id):
+    """
+    予約のカレンダー反映状況API
+
+    Returns:
+        {
+            "booking_id": "...",
+            "status": "pending" | "synced" | "failed",
+            "event_id": "..." (反映前は null)
+        }
+    """
+    # レート制限チェック
+    rate_limit_error = check_rate_limit()
+    if rate_limit_error:
+        return rate_limit_error
+
+    booking_store = calendar_service.booking_store if calendar_service else None
+    if not booking_store:
+        return jsonify({"error": "Booking status is not available"}), 404
+
+    booking = booking_store.get(booking_id)
+    if not booking:
+        return jsonify({"error": f"Booking not found: {booking_id}"}), 404
+
+    return jsonify({
+        "booking_id": booking["booking_id"],
+        "status": booking["status"],
+        "event_id": booking["event_id"]
+    }), 200
 
 
 @app.errorhandler(404)
@@ -490,17 +960,17 @@ def not_found(error):
 @app.errorhandler(500)
 def internal_error(error):
     """500エラーハンドラ"""
-    logger.error(f"Internal server error: {error}")
+    logger.error("Internal server error: %s", error)
     return jsonify({"error": "Internal server error"}), 500
 
 
-# CalendarService を初期化（モジュールロード時に実行）
+# CalendarService を初期化（モジュールロード時に実行、起動モードに応じて遅延）
 # gunicorn で起動する場合もこれが実行される
-init_calendar_service()
+start_calendar_service(startup_mode)
 
 
 if __name__ == "__main__":
-    # 直接実行の場合は既に初期化済み
+    # 直接実行の場合は既に初期化開始済み
 
     # サーバー起動
     port = int(os.environ.get("PORT", 8080))
@@ -0,0 +1,110 @@
+"""
+同一リクエストの合流（single-flight）
+同じキーの処理が実行中なら新たに実行せず、実行中の処理の結果（または例外）を共有する
+
+予約受付開始直後などに、同じカレンダー・同じ日の freebusy.query が多数のスレッドから
+同時に発行されるのを1回にまとめるために使う
+"""
+
+import asyncio
+from threading import Event, Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """実行中の処理1件（完了待ち・結果・例外）"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """スレッド間で同じキーの処理を1回にまとめる"""
+
+    def __init__(self):
+        """初期化"""
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        func を実行（同じキーの処理が実行中ならその完了を待って結果を共有）
+
+        結果は実行中の呼び出しが終わった時点で破棄する（完了後の呼び出しは新たに実行する）
+
+        Args:
+            key: 処理を識別するキー
+            func: 実行する処理
+
+        Returns:
+            (結果, 他の呼び出しの結果を共有したか)
+
+        Raises:
+            func が送出した例外（待っていた全呼び出しに同じ例外を送出）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight:
+    """同一イベントループ内で同じキーの処理を1回にまとめる（asyncio 版）"""
+
+    def __init__(self):
+        """初期化"""
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        func を実行（同じキーの処理が実行中ならその完了を待って結果を共有）
+
+        処理はタスクとして実行するため、待っている呼び出しの一部がキャンセルされても
+        他の呼び出しには影響しない
+
+        Args:
+            key: 処理を識別するキー
+            func: 実行するコルーチン関数
+
+        Returns:
+            (結果, 他の呼び出しの結果を共有したか)
+
+        Raises:
+            func が送出した例外（待っていた全呼び出しに同じ例外を送出）
+        """
+        task = self._tasks.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        """完了したタスクを登録から外す（待つ側が全員キャンセル済みでも例外を回収する）"""
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()
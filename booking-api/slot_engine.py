@@ -0,0 +1,111 @@
+"""
+時刻・busy枠の分単位変換
+"HH:MM" の解析と、busy枠を基準時刻からの整数オフセット（分）に変換・マージする処理
+（空き枠の判定は occupancy_index のビットマスクで行う）
+"""
+
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+ONE_MINUTE = timedelta(minutes=1)
+
+
+def parse_hhmm(value: str) -> int:
+    """
+    "HH:MM" を0時からの経過分に変換
+
+    Args:
+        value: 時刻文字列 (HH:MM)
+
+    Returns:
+        経過分
+    """
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+@lru_cache(maxsize=256)
+def parse_clock(value: str) -> time:
+    """
+    "HH:MM" を datetime.time に変換（同じ文字列は再計算しない）
+
+    Args:
+        value: 時刻文字列 (HH:MM)
+
+    Returns:
+        時刻
+    """
+    hours, minutes = value.split(":")
+    return time(int(hours), int(minutes))
+
+
+def to_minute_offset(dt: datetime, origin: datetime, round_up: bool = False) -> int:
+    """
+    基準時刻からの経過分に変換
+
+    Args:
+        dt: 対象時刻
+        origin: 基準時刻
+        round_up: 端数を切り上げるか（False の場合は切り捨て）
+
+    Returns:
+        経過分（整数）
+    """
+    if round_up:
+        return -((origin - dt) // ONE_MINUTE)
+    return (dt - origin) // ONE_MINUTE
+
+
+def _merge_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    区間をソートして重複・隣接区間をマージ
+
+    Args:
+        intervals: [(開始, 終了), ...]（分オフセット）
+
+    Returns:
+        重複のない昇順の区間リスト
+    """
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def busy_to_offsets(
+    busy_slots: Iterable[Tuple[datetime, datetime]],
+    origin: datetime
+) -> List[Tuple[int, int]]:
+    """
+    busy枠を分オフセットに変換してマージ
+
+    開始は切り捨て・終了は切り上げるため、分単位の候補枠に対する重複判定は
+    元の datetime での判定と一致する
+
+    Args:
+        busy_slots: busy枠リスト [(開始時刻, 終了時刻), ...]
+        origin: 基準時刻
+
+    Returns:
+        マージ済みの区間リスト
+    """
+    # 同じ tzinfo 同士の減算は utcoffset() を呼ばずに済むため、基準時刻を
+    # busy枠側のタイムゾーン（freebusy では UTC）に合わせておく
+    origins = {}
+    intervals = []
+    for start, end in busy_slots:
+        local_origin = origins.get(start.tzinfo)
+        if local_origin is None:
+            local_origin = origins[start.tzinfo] = origin.astimezone(start.tzinfo)
+        intervals.append((
+            (start - local_origin) // ONE_MINUTE,
+            -((local_origin - end) // ONE_MINUTE)
+        ))
+    return _merge_intervals(intervals)
@@ -0,0 +1,142 @@
+"""
+構造化ログ（JSON）の非同期出力
+リクエスト処理スレッドはログレコードをキューに積むだけにし、メッセージの組み立て・JSON 化・
+標準出力への書き込みは QueueListener のスレッドで行う
+
+- メッセージは %-style で渡す（logger.info("... %s", value)）と、組み立てが出力スレッドまで遅延される
+- 同じ内容が大量に出る WARNING（CORS 拒否など）は、メッセージテンプレートごとに一定時間あたりの件数へ間引く
+"""
+
+import atexit
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from pythonjsonlogger import jsonlogger
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Cloud Logging が重大度として解釈するフィールド名に合わせる（時刻は ISO 8601 の timestamp）
+JSON_FORMAT = "%(levelname)s %(name)s %(message)s"
+JSON_RENAME_FIELDS = {"levelname": "severity", "name": "logger"}
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    レコードをそのままキューに積む QueueHandler
+
+    標準の QueueHandler.prepare() は呼び出し元のスレッドでメッセージを組み立てるため、
+    同一プロセス内のキューでは組み立てを QueueListener 側に任せる
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    同じメッセージテンプレートの WARNING を時間窓あたり max_per_window 件までに間引く
+
+    間引いた件数は、次の時間窓で最初に通したレコードの suppressed フィールドに載せる
+    ERROR 以上は間引かない
+    """
+
+    def __init__(self, window_seconds: float, max_per_window: int):
+        """
+        初期化
+
+        Args:
+            window_seconds: 時間窓（秒）
+            max_per_window: 時間窓あたりに出力する件数
+        """
+        super().__init__()
+        self.window_seconds = window_seconds
+        self.max_per_window = max_per_window
+        # {(ロガー名, テンプレート): [時間窓の開始時刻, 出力件数, 間引いた件数]}
+        self._windows: Dict[Tuple[str, str], list] = {}
+        self._lock = Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.WARNING:
+            return True
+
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.window_seconds:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.max_per_window:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def setup_logging(logging_config: Dict) -> Optional[QueueListener]:
+    """
+    ルートロガーを構成（キュー経由で標準出力へ JSON またはテキストで出力）
+
+    Args:
+        logging_config: config.yaml の logging セクション
+
+    Returns:
+        開始済みの QueueListener（async: false の場合は None）
+    """
+    root = logging.getLogger()
+    root.setLevel(logging_config.get("level", "INFO"))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(sys.stdout)
+    if logging_config.get("format", "json") == "json":
+        output.setFormatter(jsonlogger.JsonFormatter(
+            JSON_FORMAT,
+            rename_fields=JSON_RENAME_FIELDS,
+            timestamp=True,
+            json_ensure_ascii=False
+        ))
+    else:
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    sampling_config = logging_config.get("sampling", {})
+    sampler = None
+    if sampling_config.get("enabled", True):
+        sampler = SamplingFilter(
+            sampling_config.get("window_seconds", 60),
+            sampling_config.get("max_per_window", 10)
+        )
+
+    if not logging_config.get("async", True):
+        # 同期出力（デバッグ用）
+        if sampler:
+            output.addFilter(sampler)
+        root.addHandler(output)
+        return None
+
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    if sampler:
+        # 間引くレコードはキューにも積まない
+        handler.addFilter(sampler)
+    root.addHandler(handler)
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    # 終了時にキューに残ったログを出力してから止める
+    atexit.register(stop_listener, listener)
+    return listener
+
+
+def stop_listener(listener: QueueListener):
+    """キューに残ったログを出力して QueueListener を止める（停止済みなら何もしない）"""
+    if listener._thread is not None:
+        listener.stop()